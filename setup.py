@@ -1,8 +1,6 @@
 from setuptools import find_packages, setup
 
-requirements = [
-    'pybloom_live'
-]
+requirements = []
 
 dev_requirements = [
     'pytest'
@@ -0,0 +1,366 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random as r
+import sys
+import time
+
+from sisu.bitmap import CHUNK_MEMORY
+from sisu.memory import MemoryBudget, current_rss, peak_rss
+from sisu.result import Counter
+import sisu.constants as c
+import sisu.strategy as strategy
+
+# ids of a dataset are drawn from a permutation of [0, _PRIME): the i-th id
+# is a*i + b modulo a prime. Distinct indices give distinct ids, so files of
+# any size are written a line at a time without remembering what was drawn.
+_PRIME = (1 << 61) - 1
+
+# amount of lines written at a time when generating a dataset
+_WRITE_LINES = 1 << 16
+
+# the lines of the smaller file, the size of the larger file relative to it,
+# the fraction of the smaller file which is in both files and the memory
+# budgets in megabytes. Ids take about 20 bytes a line, so 50000 lines are
+# about 1MB and the largest `full` file is about 500MB.
+SUITES = {
+    'quick': {
+        'lines': (1000, 50000),
+        'ratios': (1, 10),
+        'overlaps': (0.1, 0.9),
+        'budgets': (1, 16),
+    },
+    'full': {
+        'lines': (1000, 50000, 500000, 2500000),
+        'ratios': (1, 10),
+        'overlaps': (0.01, 0.5, 1),
+        'budgets': (1, 16, 1024),
+    },
+}
+
+# the metrics compared against a baseline, and the smallest increase of each
+# which counts as a regression however large it is relative to the baseline.
+# Small runs take milliseconds, which are mostly noise.
+REGRESSION_METRICS = {
+    'wall_time': 0.05,
+    'peak_rss': c.MEGABYTE,
+    'bytes_written': 64 * 1024,
+}
+
+
+def strategies():
+    """Returns every exact strategy by name, including ones added later.
+    Approximate strategies can not be checked against the cardinality.
+
+    Returns
+    ------
+    dict of str to Strategy
+    """
+    return {
+        strat.__name__: strat for strat in strategy.Strategy.__subclasses__()
+        if strat.exact
+    }
+
+
+def write_ids(path, ranges, seed=0):
+    """Writes the ids with index in `ranges` to `path`, one per line.
+
+    Parameters
+    ----------
+    path : str
+    ranges : list of (int, int)
+        [start, stop) ranges of indices
+    seed : int, optional
+        Picks the permutation ids are drawn from
+
+    Side Effect
+    ------
+    Writes a file to disk
+    """
+    random = r.Random(seed)
+    scale = random.randrange(1, _PRIME)
+    shift = random.randrange(_PRIME)
+
+    with open(path, 'w') as fp:
+        for start, stop in ranges:
+            for pos in range(start, stop, _WRITE_LINES):
+                fp.write(''.join([
+                    f'{(scale * idx + shift) % _PRIME}\n'
+                    for idx in range(pos, min(pos + _WRITE_LINES, stop))
+                ]))
+
+
+def dataset(data_dir, lines, ratio, overlap, seed=0):
+    """Generates a pair of files unless they exist already. The first has
+    `lines` ids and the second `lines * ratio`, of which `lines * overlap`
+    are in the first file too.
+
+    Parameters
+    ----------
+    data_dir : str
+    lines : int
+    ratio : float
+    overlap : float
+    seed : int, optional
+
+    Returns
+    ------
+    str
+        Path of the first file
+    str
+        Path of the second file
+    int
+        The amount of ids in both files
+    """
+    lines2 = int(lines * ratio)
+    shared = int(lines * overlap)
+    base_name = os.path.join(data_dir, f'{lines}-{lines2}-{shared}-{seed}')
+    file1, file2 = f'{base_name}-0.lst', f'{base_name}-1.lst'
+
+    os.makedirs(data_dir, exist_ok=True)
+    if not os.path.isfile(file1):
+        write_ids(file1, [(0, lines)], seed)
+    if not os.path.isfile(file2):
+        write_ids(file2, [(0, shared), (lines, lines + lines2 - shared)],
+                  seed)
+    return file1, file2, shared
+
+
+def cases(suite, names=None):
+    """Yields every case of `suite`. Naive reads both files into memory
+    whatever the budget, so it only runs when the files fit in the budget.
+    The ids are spread over a range far too wide for a bitmap, where every
+    id takes a chunk, so Bitmap only runs when those chunks fit as well.
+
+    Parameters
+    ----------
+    suite : dict
+        See `SUITES`
+    names : list of str, optional
+        Names of the strategies to run. Runs every strategy if None
+
+    Yields
+    ------
+    dict
+    """
+    names = names or sorted(strategies())
+    for lines, ratio, overlap, budget in itertools.product(
+            suite['lines'], suite['ratios'], suite['overlaps'],
+            suite['budgets']):
+
+        input_size = lines * (1 + ratio) * 20
+        for name in names:
+            if name == 'Naive' and input_size > budget * c.MEGABYTE:
+                continue
+            if name == 'Bitmap' and \
+                    2 * lines * CHUNK_MEMORY > budget * c.MEGABYTE:
+                continue
+            yield {
+                'key': f'{name}/{lines}x{ratio}/{overlap}/{budget}MB',
+                'strategy': name,
+                'lines': lines,
+                'ratio': ratio,
+                'overlap': overlap,
+                'budget': budget,
+            }
+
+
+def io_counters():
+    """Returns the I/O counters of this process, or an empty dict where
+    /proc is not available.
+
+    Returns
+    ------
+    dict of str to int
+        rchar and wchar are the bytes read and written, syscr and syscw the
+        amount of read and write system calls
+    """
+    try:
+        with open('/proc/self/io') as io:
+            return {
+                name: int(value)
+                for name, value in (line.split(': ') for line in io)
+            }
+    except OSError:
+        return {}
+
+
+def _measure(file1, file2, mem_limit, name):
+    """Intersects the files with strategy `name` and measures it. Runs on a
+    fresh process so the peak resident set size is that of this run alone.
+
+    Returns
+    ------
+    dict
+    """
+    strat = strategies()[name]
+    budget = MemoryBudget(mem_limit)
+    result = Counter()
+    start_rss = current_rss()
+    start_io = io_counters()
+
+    start = time.perf_counter()
+    strat.intersect(file1, file2, mem_limit, budget=budget, result=result)
+    wall_time = time.perf_counter() - start
+
+    end_io = io_counters()
+    io = {name: end_io[name] - start_io[name] for name in end_io}
+
+    return {
+        'cardinality': result.cardinality,
+        'wall_time': wall_time,
+        'start_rss': start_rss,
+        'peak_rss': peak_rss(),
+        'peak_reserved': budget.peak_reserved,
+        'bytes_read': io.get('rchar'),
+        'bytes_written': io.get('wchar'),
+        'read_calls': io.get('syscr'),
+        'write_calls': io.get('syscw'),
+    }
+
+
+def run(suite, data_dir, names=None, log=print):
+    """Runs every case of `suite` on datasets in `data_dir`.
+
+    Parameters
+    ----------
+    suite : dict
+        See `SUITES`
+    data_dir : str
+        Datasets are generated in, and reused from, this dir
+    names : list of str, optional
+        Names of the strategies to run. Runs every strategy if None
+    log : callable, optional
+        Called with a line of progress per case
+
+    Returns
+    ------
+    list of dict
+        Every case with its measurements. `correct` tells whether the
+        strategy found the right cardinality.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for case in cases(suite, names):
+        file1, file2, expected = dataset(
+            data_dir, case['lines'], case['ratio'], case['overlap']
+        )
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            measured = pool.submit(
+                _measure, file1, file2, case['budget'] * c.MEGABYTE,
+                case['strategy']
+            ).result()
+
+        result = dict(case, **measured)
+        result['correct'] = measured['cardinality'] == expected
+        results.append(result)
+        log(f"{case['key']}: {measured['wall_time']:.3f} seconds")
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Compares results with the results of a baseline run. A metric
+    regressed when it grew by more than `tolerance` relative to the baseline
+    and by more than its minimum in `REGRESSION_METRICS`.
+
+    Parameters
+    ----------
+    results : list of dict
+    baseline : list of dict
+    tolerance : float, optional
+
+    Returns
+    ------
+    list of dict
+        The regressions
+    """
+    baseline = {result['key']: result for result in baseline}
+    regressions = []
+    for result in results:
+        before = baseline.get(result['key'])
+        if before is None:
+            continue
+        for metric, min_increase in REGRESSION_METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > min_increase:
+                regressions.append({
+                    'key': result['key'],
+                    'metric': metric,
+                    'baseline': old,
+                    'value': new,
+                })
+    return regressions
+
+
+def parse_args(args=None):
+    """Parses the command line args of the benchmark.
+
+    Parameters
+    ----------
+    args : list of str, optional
+        Reads from argv if None
+
+    Returns
+    ------
+    Namespace
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the strategies of sisu'
+    )
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick')
+    parser.add_argument('--strategies', nargs='+',
+                        choices=sorted(strategies()),
+                        help='Runs every strategy if not given')
+    parser.add_argument('--data_dir', default='benchmark-data',
+                        help='Where datasets are generated and reused from')
+    parser.add_argument('--output', default='benchmark.json',
+                        help='Where to write the results')
+    parser.add_argument('--baseline',
+                        help='Results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Runs a suite, writes its results and exits with status 1 if a strategy
+    was wrong or a metric regressed against the baseline.
+    """
+    args = parse_args(args)
+    results = run(SUITES[args.suite], args.data_dir, args.strategies)
+
+    with open(args.output, 'w') as outfile:
+        json.dump({
+            'suite': args.suite,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }, outfile, indent=2)
+
+    failed = False
+    for result in results:
+        if not result['correct']:
+            print(f"{result['key']}: wrong cardinality "
+                  f"{result['cardinality']}")
+            failed = True
+
+    if args.baseline:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)['results']
+        for regression in compare(results, baseline, args.tolerance):
+            print(
+                f"{regression['key']}: {regression['metric']} regressed from "
+                f"{regression['baseline']} to {regression['value']}"
+            )
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
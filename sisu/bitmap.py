@@ -0,0 +1,192 @@
+from array import array
+import sys
+
+import sisu.constants as c
+
+_CHUNK_SHIFT = c.BITMAP_CHUNK_BITS.bit_length() - 1
+_CHUNK_MASK = c.BITMAP_CHUNK_BITS - 1
+CHUNK_BYTES = c.BITMAP_CHUNK_BITS // 8
+
+# a chunk costs its bytes, the bytearray object and the key and entry of the
+# dict holding it
+CHUNK_MEMORY = CHUNK_BYTES + sys.getsizeof(bytearray()) + c.SIZE_INT + \
+    3 * c.SIZE_POINTER
+
+# the offsets of the set bits of every byte value
+_BITS = tuple(
+    tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)
+)
+
+
+class ChunkedBitmap():
+    """A ChunkedBitmap is a bitmap of unsigned 64 bit ints split into chunks
+    of `c.BITMAP_CHUNK_BITS` values, keyed by the high bits of the values
+    they hold like the containers of a roaring bitmap. Only chunks which
+    hold a value are allocated, so values clustered in a few narrow ranges
+    take about a bit each however far apart the ranges are.
+
+    Two bitmaps are intersected a chunk at a time with a word wise AND of the
+    chunks, see `intersection`.
+    """
+
+    def __init__(self, low_key=0, high_key=float('inf')):
+        """
+        Attributes
+        ---------
+        low_key : int
+            Values of chunks with a smaller key are not added
+        high_key : int U float
+            Values of chunks with this key or a larger one are not added
+        grow : bool
+            Are chunks allocated for values of chunks it does not hold yet?
+        _chunks : dict of int to bytearray
+        """
+        self.low_key = low_key
+        self.high_key = high_key
+        self.grow = True
+        self._chunks = {}
+
+    @staticmethod
+    def key_of(number):
+        """Returns the key of the chunk of `number`.
+
+        Parameters
+        ----------
+        number : int
+
+        Returns
+        ------
+        int
+        """
+        return number >> _CHUNK_SHIFT
+
+    @staticmethod
+    def chunks_for(low, high, values):
+        """Returns the most chunks `values` values in [`low`, `high`] can
+        take.
+
+        Parameters
+        ----------
+        low : int
+        high : int
+        values : int
+
+        Returns
+        ------
+        int
+        """
+        return min((high >> _CHUNK_SHIFT) - (low >> _CHUNK_SHIFT) + 1, values)
+
+    @property
+    def memory(self):
+        """Returns the size in bytes of the allocated chunks.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return len(self._chunks) * CHUNK_MEMORY
+
+    @property
+    def keys(self):
+        """Returns the keys of the allocated chunks, ascending.
+
+        Returns
+        ------
+        list of int
+        """
+        return sorted(self._chunks)
+
+    def like(self):
+        """Returns an empty bitmap which only adds the values of the chunks
+        of this one.
+
+        Returns
+        ------
+        ChunkedBitmap
+        """
+        bitmap = ChunkedBitmap(self.low_key, self.high_key)
+        bitmap._chunks = {key: bytearray(CHUNK_BYTES) for key in self._chunks}
+        bitmap.grow = False
+        return bitmap
+
+    def add_many(self, numbers):
+        """Adds every value of `numbers` which falls in the bitmap's chunks.
+
+        Parameters
+        ----------
+        numbers : iterable of int
+        """
+        chunks = self._chunks
+        grow = self.grow
+        low_key, high_key = self.low_key, self.high_key
+        for number in numbers:
+            key = number >> _CHUNK_SHIFT
+            chunk = chunks.get(key)
+            if chunk is None:
+                if not grow or key < low_key or key >= high_key:
+                    continue
+                chunk = chunks[key] = bytearray(CHUNK_BYTES)
+            offset = number & _CHUNK_MASK
+            chunk[offset >> 3] |= 1 << (offset & 7)
+
+    def __contains__(self, number):
+        """Is number in the bitmap?
+
+        Parameters
+        ----------
+        number : int
+
+        Returns
+        ------
+        bool
+        """
+        chunk = self._chunks.get(number >> _CHUNK_SHIFT)
+        offset = number & _CHUNK_MASK
+        return chunk is not None and bool(chunk[offset >> 3] >> (offset & 7)
+                                          & 1)
+
+    def intersection(self, other):
+        """Yields the values in both bitmaps, a chunk at a time and in
+        ascending order. Chunks of both bitmaps are released as they are
+        intersected.
+
+        Parameters
+        ----------
+        other : ChunkedBitmap
+
+        Yields
+        ------
+        array of uint64
+        """
+        for key in self.keys:
+            chunk = self._chunks.pop(key)
+            other_chunk = other._chunks.pop(key, None)
+            if other_chunk is None:
+                continue
+            both = (
+                int.from_bytes(chunk, 'little') &
+                int.from_bytes(other_chunk, 'little')
+            )
+            if both:
+                yield ChunkedBitmap._decode(
+                    key, both.to_bytes(CHUNK_BYTES, 'little')
+                )
+
+    @staticmethod
+    def _decode(key, chunk):
+        """Returns the values of the set bits of the chunk with `key`. Empty
+        words are skipped a word at a time.
+        """
+        values = array('Q')
+        words = array('Q')
+        words.frombytes(chunk)
+        base = key << _CHUNK_SHIFT
+        for idx, word in enumerate(words):
+            if word:
+                start = base + (idx << 6)
+                for pos, byte in enumerate(word.to_bytes(8, sys.byteorder)):
+                    if byte:
+                        offset = start + (pos << 3)
+                        values.extend([offset + bit for bit in _BITS[byte]])
+        return values
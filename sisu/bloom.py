@@ -0,0 +1,279 @@
+from array import array
+import math
+
+from sisu.packed import read_into, write_packed
+import sisu.constants as c
+
+# the hash is `partition.mix64` with a seed no partitioning level uses, so
+# the bits picked within a partition are not correlated with it. It is
+# inlined in the loops below since a function call per value dominates their
+# cost.
+_SEED = 64
+_GOLDEN = 0x9E3779B97F4A7C15
+_MIX1 = 0xBF58476D1CE4E5B9
+_MIX2 = 0x94D049BB133111EB
+_MASK64 = (1 << 64) - 1
+_OFFSET = ((_SEED + 1) * _GOLDEN) & _MASK64
+_MASK32 = (1 << 32) - 1
+
+# bits of a word are addressed with 6 bits of the upper half of the hash
+_BIT_INDEX_BITS = 6
+_BIT_INDEX_MASK = (1 << _BIT_INDEX_BITS) - 1
+MAX_HASHES = 32 // _BIT_INDEX_BITS
+
+
+class BloomFilter():
+    """A BloomFilter is a fixed size, register blocked bloom filter of
+    unsigned 64 bit ints. Every value sets `n_hashes` bits of a single 64
+    bit word: the lower half of its hash picks the word and the upper half
+    the bits within it. A lookup costs one hash and one word read, at the
+    price of a slightly higher false positive rate than a classic bloom
+    filter of the same size.
+
+    Unlike a scalable bloom filter its memory is fixed when it is created,
+    so it can be reserved from a `MemoryBudget` up front.
+    """
+
+    def __init__(self, capacity, memory):
+        """
+        Attributes
+        ---------
+        capacity : int
+            The expected amount of values, used to pick `n_hashes`
+        n_hashes : int
+            The amount of bits set per value
+        cardinality : int
+            The amount of values added
+        _words : array of uint64
+            The bit array
+        """
+        n_words = max(int(memory // c.SIZE_UINT64), 1)
+        self.capacity = max(int(capacity), 1)
+        self.n_hashes = BloomFilter.hashes_for(
+            n_words * 64 / self.capacity
+        )
+        self.cardinality = 0
+        self._words = array('Q', (0,)) * n_words
+
+    @staticmethod
+    def hashes_for(bits_per_value):
+        """Returns the amount of bits to set per value which minimizes the
+        false positive rate, ln(2) times the bits per value.
+
+        Parameters
+        ----------
+        bits_per_value : float
+
+        Returns
+        ------
+        int
+        """
+        return min(max(round(math.log(2) * bits_per_value), 1), MAX_HASHES)
+
+    @staticmethod
+    def memory_for(capacity, bits_per_value=c.BLOOM_BITS_PER_VALUE):
+        """Returns the size in bytes of a filter for `capacity` values.
+
+        Parameters
+        ----------
+        capacity : int
+        bits_per_value : float, optional
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        bits = max(int(capacity * bits_per_value), 64)
+        return (bits + 63) // 64 * c.SIZE_UINT64
+
+    @property
+    def memory(self):
+        """Returns the size in bytes of the bit array.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return len(self._words) * c.SIZE_UINT64
+
+    @property
+    def false_positive_rate(self):
+        """Returns the estimated false positive rate given the values added
+        so far, see `false_positive_rate_for`.
+
+        Returns
+        ------
+        float
+        """
+        return BloomFilter.false_positive_rate_for(
+            self.cardinality, self.memory, self.n_hashes
+        )
+
+    @staticmethod
+    def false_positive_rate_for(values, memory, n_hashes=None):
+        """Returns the estimated false positive rate of a filter of `memory`
+        bytes holding `values` values. The amount of values sharing a word is
+        poisson distributed with a mean of n/w for n values and w words, and
+        a word holding l values has a fraction of about 1 - (1 - 1/64)^(kl)
+        of its bits set for k hashes.
+
+        Parameters
+        ----------
+        values : int
+        memory : int (in bytes)
+        n_hashes : int, optional
+            The amount of bits set per value. Picked like a filter for
+            `values` values would if None
+
+        Returns
+        ------
+        float
+        """
+        n_words = max(int(memory // c.SIZE_UINT64), 1)
+        mean = values / n_words
+        if not mean:
+            return 0.0
+        k = n_hashes or BloomFilter.hashes_for(64 / mean)
+
+        rate = 0.0
+        probability = math.exp(-mean)
+        for load in range(int(mean + 10 * math.sqrt(mean) + 10)):
+            if load:
+                probability *= mean / load
+            rate += probability * (1 - (1 - 1 / 64) ** (k * load)) ** k
+        return rate
+
+    def write(self, outfile):
+        """Writes the bit array to `outfile`, see `read`.
+
+        Parameters
+        ----------
+        outfile : file object
+            Opened in binary mode
+        """
+        write_packed(outfile, self._words)
+
+    @staticmethod
+    def read(infile, capacity, memory):
+        """Reads a filter of `capacity` values and `memory` bytes which
+        `write` wrote to `infile`. It is assumed to be full.
+
+        Parameters
+        ----------
+        infile : file object
+            Opened in binary mode
+        capacity : int
+        memory : int (in bytes)
+
+        Returns
+        ------
+        BloomFilter
+        """
+        bloom = BloomFilter(capacity, memory)
+        read_into(infile, bloom._words)
+        bloom.cardinality = bloom.capacity
+        return bloom
+
+    def _mask(self, hashed):
+        """Returns the bits of a word set by a value with hash `hashed`."""
+        mask = 0
+        upper = hashed >> 32
+        for _ in range(self.n_hashes):
+            mask |= 1 << (upper & _BIT_INDEX_MASK)
+            upper >>= _BIT_INDEX_BITS
+        return mask
+
+    @staticmethod
+    def _hash(number):
+        x = (number + _OFFSET) & _MASK64
+        x = ((x ^ (x >> 30)) * _MIX1) & _MASK64
+        x = ((x ^ (x >> 27)) * _MIX2) & _MASK64
+        return x ^ (x >> 31)
+
+    def add(self, number):
+        """Adds number to the filter.
+
+        Parameters
+        ----------
+        number : int
+        """
+        hashed = BloomFilter._hash(number)
+        idx = ((hashed & _MASK32) * len(self._words)) >> 32
+        self._words[idx] |= self._mask(hashed)
+        self.cardinality += 1
+
+    def __contains__(self, number):
+        """Might number be in the filter?
+
+        Parameters
+        ----------
+        number : int
+
+        Returns
+        ------
+        bool
+            False if number was never added
+        """
+        hashed = BloomFilter._hash(number)
+        idx = ((hashed & _MASK32) * len(self._words)) >> 32
+        mask = self._mask(hashed)
+        return self._words[idx] & mask == mask
+
+    def add_many(self, numbers):
+        """Adds every value of `numbers` to the filter.
+
+        Parameters
+        ----------
+        numbers : iterable of int
+        """
+        words = self._words
+        n_words = len(words)
+        n_hashes = self.n_hashes
+        added = 0
+        for number in numbers:
+            x = (number + _OFFSET) & _MASK64
+            x = ((x ^ (x >> 30)) * _MIX1) & _MASK64
+            x = ((x ^ (x >> 27)) * _MIX2) & _MASK64
+            x ^= x >> 31
+
+            mask = 0
+            upper = x >> 32
+            for _ in range(n_hashes):
+                mask |= 1 << (upper & _BIT_INDEX_MASK)
+                upper >>= _BIT_INDEX_BITS
+
+            words[((x & _MASK32) * n_words) >> 32] |= mask
+            added += 1
+        self.cardinality += added
+
+    def contains_many(self, numbers):
+        """Returns the values of `numbers` which might be in the filter.
+
+        Parameters
+        ----------
+        numbers : iterable of int
+
+        Returns
+        ------
+        array of uint64
+        """
+        words = self._words
+        n_words = len(words)
+        n_hashes = self.n_hashes
+        hits = array('Q')
+        append = hits.append
+        for number in numbers:
+            x = (number + _OFFSET) & _MASK64
+            x = ((x ^ (x >> 30)) * _MIX1) & _MASK64
+            x = ((x ^ (x >> 27)) * _MIX2) & _MASK64
+            x ^= x >> 31
+
+            mask = 0
+            upper = x >> 32
+            for _ in range(n_hashes):
+                mask |= 1 << (upper & _BIT_INDEX_MASK)
+                upper >>= _BIT_INDEX_BITS
+
+            if words[((x & _MASK32) * n_words) >> 32] & mask == mask:
+                append(number)
+        return hits
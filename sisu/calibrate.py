@@ -0,0 +1,281 @@
+from array import array
+import argparse
+import json
+import os
+import random as r
+import tempfile
+import time
+
+from sisu.bitmap import ChunkedBitmap
+from sisu.bloom import BloomFilter
+from sisu.hashset import Uint64HashSet
+from sisu.packed import read_deltas, read_packed, write_deltas, write_packed
+from sisu.partition import PartitionedStore, RangePartitionedStore
+import sisu.constants as c
+import sisu.external_sort as external_sort
+import sisu.utils as utils
+
+# machine constants of the cost model in `optimize`. The defaults were
+# measured on a single core Linux VM, `calibrate` measures them on the host.
+DEFAULT_MACHINE = {
+    # bytes per second read sequentially from a packed file
+    'read_rate': 800 * c.MEGABYTE,
+    # bytes per second written to a packed file
+    'write_rate': 1000 * c.MEGABYTE,
+    # lines per second read and parsed from a text file
+    'parse_rate': 2e6,
+    # values per second added to, or looked up in, a Uint64HashSet
+    'hash_rate': 9e5,
+    # values per second added to a python set and intersected with one
+    'set_rate': 2.8e6,
+    # values per second checked against a BloomFilter
+    'bloom_rate': 3e5,
+    # values per second added to a ChunkedBitmap of a dense range
+    'bitmap_rate': 2.4e6,
+    # values per second decoded from the chunks of a ChunkedBitmap
+    'bitmap_decode_rate': 2.4e6,
+    # values per second hash partitioned into a PartitionedStore, including
+    # writing the partitions
+    'partition_rate': 5e5,
+    # values per second range partitioned into a RangePartitionedStore,
+    # including writing the partitions
+    'radix_rate': 1.7e6,
+    # values per second sorted in runs of `SORT_RUN` values
+    'sort_rate': 1.3e6,
+    # values per second merged out of two sorted runs. Every doubling of the
+    # amount of runs costs about as much again.
+    'merge_rate': 5e6,
+    # values per second delta encoded into a sorted run and decoded back
+    'delta_rate': 1.6e6,
+    # seconds to open a spill bucket file and start scanning it
+    'lookup_time': 6e-5,
+}
+
+# amount of values of the micro benchmarks, and of a run when sorting
+SAMPLE_SIZE = 1 << 18
+SORT_RUN = 1 << 16
+
+# runs merged by the merge benchmark, a power of two
+_MERGE_RUNS = 16
+
+
+def profile_path():
+    """Returns where the machine constants are saved: the path in the
+    SISU_MACHINE_PROFILE environment variable, or a file in the home dir.
+
+    Returns
+    ------
+    str
+    """
+    return os.environ.get(
+        'SISU_MACHINE_PROFILE',
+        os.path.join(os.path.expanduser('~'), '.sisu', 'machine.json')
+    )
+
+
+def load_machine(path=None):
+    """Returns the saved machine constants, falling back to
+    `DEFAULT_MACHINE` for the ones which are not saved.
+
+    Parameters
+    ----------
+    path : str, optional
+        Reads from `profile_path` if None
+
+    Returns
+    ------
+    dict of str to float
+    """
+    path = path or profile_path()
+    machine = dict(DEFAULT_MACHINE)
+    if os.path.isfile(path):
+        with open(path) as infile:
+            machine.update(json.load(infile))
+    return machine
+
+
+def save_machine(machine, path=None):
+    """Saves machine constants.
+
+    Parameters
+    ----------
+    machine : dict of str to float
+    path : str, optional
+        Writes to `profile_path` if None
+
+    Returns
+    ------
+    str
+        The path written to
+    """
+    path = path or profile_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as outfile:
+        json.dump(machine, outfile, indent=2)
+    return path
+
+
+def _rate(amount, function, *args):
+    """Returns `amount` divided by the seconds `function` takes."""
+    start = time.perf_counter()
+    function(*args)
+    return amount / max(time.perf_counter() - start, 1e-9)
+
+
+def _drain(blocks):
+    for _ in blocks:
+        pass
+
+
+def calibrate(sample_size=SAMPLE_SIZE, dir_=None):
+    """Measures the machine constants of the cost model with micro benchmarks
+    of the building blocks of the strategies on `sample_size` values.
+
+    Files are read right after they are written, so reads come from the page
+    cache, like they mostly do for files of at most 500MB.
+
+    Parameters
+    ----------
+    sample_size : int, optional
+    dir_ : str, optional
+        Where to write the benchmark files
+
+    Returns
+    ------
+    dict of str to float
+    """
+    random = r.Random(0)
+    values = array('Q', (random.getrandbits(63) for _ in range(sample_size)))
+    block_size = c.READ_BUFFER_SIZE // c.SIZE_UINT64
+    machine = {}
+
+    with tempfile.TemporaryDirectory(dir=dir_) as tmp:
+        text = os.path.join(tmp, 'text.lst')
+        with open(text, 'w') as outfile:
+            outfile.write(''.join([f'{num}\n' for num in values]))
+        machine['parse_rate'] = _rate(
+            sample_size, _drain,
+            utils.FileReader().blocks(text, c.READ_BUFFER_SIZE)
+        )
+
+        packed = os.path.join(tmp, 'packed')
+
+        def write():
+            with open(packed, 'wb') as outfile:
+                write_packed(outfile, values)
+        machine['write_rate'] = _rate(len(values) * c.SIZE_UINT64, write)
+        machine['read_rate'] = _rate(
+            len(values) * c.SIZE_UINT64, _drain,
+            read_packed(packed, block_size)
+        )
+
+        def hash_():
+            hash_set = Uint64HashSet(size_hint=len(values))
+            hash_set.add_many(values)
+            hash_set.contains_many(values)
+        machine['hash_rate'] = _rate(2 * sample_size, hash_)
+
+        def set_():
+            set(values).intersection(values)
+        machine['set_rate'] = _rate(2 * sample_size, set_)
+
+        bloom = BloomFilter(sample_size,
+                            BloomFilter.memory_for(sample_size))
+        machine['bloom_rate'] = _rate(sample_size, bloom.contains_many,
+                                      values)
+
+        # the values of a dense range half of which is taken
+        dense = array('Q', random.sample(range(2 * sample_size), sample_size))
+        bitmap = ChunkedBitmap()
+        machine['bitmap_rate'] = _rate(sample_size, bitmap.add_many, dense)
+        same = bitmap.like()
+        same.add_many(dense)
+        machine['bitmap_decode_rate'] = _rate(
+            sample_size, _drain, bitmap.intersection(same)
+        )
+
+        store = PartitionedStore(dir_=tmp)
+
+        def partition():
+            store.add_many(values)
+            store.close()
+        machine['partition_rate'] = _rate(sample_size, partition)
+
+        range_store = RangePartitionedStore(0, c.MAX_NUMBER, dir_=tmp)
+
+        def range_partition():
+            range_store.add_many(values)
+            range_store.close()
+        machine['radix_rate'] = _rate(sample_size, range_partition)
+        range_store.cleanup()
+
+        # a lookup of an absent value in an almost empty bucket costs little
+        # more than opening the bucket file
+        lookups = 1000
+        machine['lookup_time'] = 1 / _rate(
+            lookups, lambda: [store.contains(num) for num in range(lookups)]
+        )
+        store.cleanup()
+
+        runs = external_sort.SortedRuns(dir_=tmp)
+        machine['sort_rate'] = _rate(sample_size, lambda: [
+            runs.write(values[pos:pos + SORT_RUN])
+            for pos in range(0, sample_size, SORT_RUN)
+        ])
+
+        merge_runs = external_sort.SortedRuns(dir_=tmp)
+        run_size = -(-sample_size // _MERGE_RUNS)
+        for pos in range(0, sample_size, run_size):
+            merge_runs.write(values[pos:pos + run_size])
+        machine['merge_rate'] = _rate(
+            sample_size * (_MERGE_RUNS.bit_length() - 1), _drain,
+            external_sort.merge_runs(merge_runs.paths, block_size)
+        )
+        runs.cleanup()
+        merge_runs.cleanup()
+
+        deltas = os.path.join(tmp, 'deltas')
+        ordered = array('Q', sorted(values))
+
+        def delta():
+            with open(deltas, 'wb') as outfile:
+                write_deltas(outfile, ordered)
+            _drain(read_deltas(deltas, block_size))
+        machine['delta_rate'] = _rate(sample_size, delta)
+
+    return machine
+
+
+def parse_args(args=None):
+    """Parses the command line args of the calibration.
+
+    Parameters
+    ----------
+    args : list of str, optional
+        Reads from argv if None
+
+    Returns
+    ------
+    Namespace
+    """
+    parser = argparse.ArgumentParser(
+        description='Measure the machine constants of the cost model'
+    )
+    parser.add_argument('--profile', help='Where to save the constants, '
+                        'see `profile_path` for the default')
+    parser.add_argument('--sample_size', type=int, default=SAMPLE_SIZE)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Calibrates the machine constants and saves them."""
+    args = parse_args(args)
+    machine = calibrate(args.sample_size)
+    path = save_machine(machine, args.profile)
+    for name, value in machine.items():
+        print(f'{name}: {value:.4g}')
+    print(f'Saved to {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import struct
 import sys
 
 # problem given constants ###
@@ -9,8 +10,12 @@ MEGABYTE = BYTE << 20
 MIN_MEMORY_BUDGET = MEGABYTE
 MAX_FILE_SIZE = 500 * MEGABYTE
 
+# an input given as this path is read from stdin
+STDIN = '-'
+
 # system constants ###
 SIZE_INT = sys.getsizeof(int())
+SIZE_POINTER = struct.calcsize('P')
 
 # when we read a an element from the list
 # it is not stored as an int but rather as a array of
@@ -18,3 +23,93 @@ SIZE_INT = sys.getsizeof(int())
 # possible size of a line by taking the size of the
 # biggest possible number
 LARGEST_ELEMENT_SIZE = sys.getsizeof(str(MAX_NUMBER))
+
+# values spilled to disk are stored as packed unsigned 64 bit ints
+SIZE_UINT64 = 8
+
+# sorted runs which are delta encoded are written in frames of this many
+# values, see `packed.write_deltas`
+DELTA_FRAME_SIZE = 256
+
+# an index is split into at most this many partitions of whole frames, see
+# `index.Index`
+INDEX_PARTITIONS = 256
+
+# besides its block, every run which is read while merging holds an open
+# file, a generator and an entry of the merge heap, in bytes
+MERGE_RUN_OVERHEAD = 1024
+
+# each side of an incremental checkpoint keeps at most this many indexes of
+# appended lines before they are merged into one, see `incremental.update`
+CHECKPOINT_INDEXES = 8
+
+# the spill store hash partitions values into this many bucket files
+SPILL_PARTITIONS = 64
+
+# number of values buffered in memory per bucket before they are appended
+# to the bucket file
+SPILL_BUFFER_SIZE = 256
+
+# in parallel mode both files are hash partitioned into this many partitions
+# per worker, rounded up to a power of two
+PARTITIONS_PER_WORKER = 4
+
+# number of values read at a time when scanning a bucket file for a value
+SPILL_SCAN_SIZE = 8192
+
+# a buffer of ascii numbers is parsed this many pieces at a time. Splitting
+# a piece briefly creates a bytes object per line of about 48 bytes.
+PARSE_PIECES = 16
+
+# each byte of raw input read at a time costs at most this many bytes of
+# memory: the buffer itself, the bytes objects of a piece (48 bytes per 2
+# byte line at worst) and the packed values of the current and the previous
+# piece (8 bytes per 2 byte line at worst).
+PARSE_OVERHEAD = 3
+
+# smallest buffer a reader will read at a time, in bytes
+MIN_READ_SIZE = 64
+
+# amount of bytes of every sample taken from a file to estimate its line
+# count, value range and overlap with the other file
+LINE_SAMPLE_SIZE = 1 << 14
+
+# amount of samples taken from a file, at random offsets spread over it
+ESTIMATE_SAMPLES = 16
+
+# log2 of the amount of registers of a HyperLogLog sketch. Its standard
+# error is 1.04 / sqrt(2^precision), 0.8% at 14.
+HLL_PRECISION = 14
+
+# buffer size for helpers that do not have a memory limit, in bytes
+READ_BUFFER_SIZE = MEGABYTE
+
+# the open addressing hash set grows before more than this fraction of its
+# slots are taken, which bounds the length of probe sequences
+HASH_SET_MAX_LOAD = 0.7
+
+# bits per value of a bloom filter in front of spilled values. At 10 bits
+# about 2% of lookups of absent values go to disk.
+BLOOM_BITS_PER_VALUE = 10
+
+# number of values a streaming result buffers before writing them out
+RESULT_BUFFER_SIZE = 512
+
+# set operations over two files, see `Strategy.combine`. A difference holds
+# the numbers of the first file which are not in the second.
+SET_OPERATIONS = ('intersect', 'union', 'difference', 'symdiff')
+
+# a value of a python set costs a boxed int and a slot of a hash and a
+# pointer. Right after the set grew as few as 1 in 7 slots are taken.
+SET_ELEMENT_SIZE = sys.getsizeof(MAX_NUMBER - 1) + 7 * 2 * SIZE_POINTER
+
+# values of a chunk of a bitmap, which share all but the lowest 16 bits
+BITMAP_CHUNK_BITS = 1 << 16
+
+# amount of slots a hash set starts out with
+HASH_SET_INITIAL_SLOTS = 1024
+
+# sorting a run of packed values needs the packed run, a list of boxed ints
+# and the sorted packed run
+SORT_ELEMENT_SIZE = 2 * SIZE_UINT64 + SIZE_POINTER + \
+    sys.getsizeof(MAX_NUMBER - 1)
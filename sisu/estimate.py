@@ -0,0 +1,497 @@
+from array import array
+import math
+import os
+import random as r
+
+from sisu.packed import read_packed
+import sisu.constants as c
+
+# the hash is `partition.mix64` with a seed neither the partitioning levels
+# nor the bloom filter use. It is inlined in the `add_many` methods like in
+# `bloom`.
+_SEED = 96
+_GOLDEN = 0x9E3779B97F4A7C15
+_MIX1 = 0xBF58476D1CE4E5B9
+_MIX2 = 0x94D049BB133111EB
+_MASK64 = (1 << 64) - 1
+_HASHES = 1 << 64
+_OFFSET = ((_SEED + 1) * _GOLDEN) & _MASK64
+
+# an overlap is only estimated when the sampled values of the two files
+# could share at least this many standard errors of the sketches
+_MIN_OVERLAP_ERRORS = 3
+
+# statistics already gathered, by path
+_stats = {}
+
+
+class HyperLogLog():
+    """A HyperLogLog estimates the amount of distinct values added to it in
+    a fixed amount of memory. Every value is hashed to one of 2^`precision`
+    registers, which keeps the longest run of leading zeros of the rest of
+    the hashes it saw.
+    """
+
+    def __init__(self, precision=c.HLL_PRECISION):
+        """
+        Attributes
+        ---------
+        precision : int
+            log2 of the amount of registers
+        _registers : bytearray
+        """
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+
+    @property
+    def memory(self):
+        """Returns the size in bytes of the registers.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return len(self._registers)
+
+    @property
+    def error(self):
+        """Returns the relative standard error of `cardinality`.
+
+        Returns
+        ------
+        float
+        """
+        return 1.04 / math.sqrt(len(self._registers))
+
+    @property
+    def cardinality(self):
+        """Returns the estimated amount of distinct values added. Small
+        cardinalities are estimated from the amount of empty registers.
+
+        Returns
+        ------
+        float
+        """
+        registers = self._registers
+        m = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in registers)
+
+        empty = registers.count(0)
+        if estimate <= 2.5 * m and empty:
+            return m * math.log(m / empty)
+        return estimate
+
+    def add_many(self, numbers):
+        """Adds every value of `numbers` to the sketch.
+
+        Parameters
+        ----------
+        numbers : iterable of int
+        """
+        registers = self._registers
+        shift = 64 - self.precision
+        mask = (1 << shift) - 1
+        for number in numbers:
+            x = (number + _OFFSET) & _MASK64
+            x = ((x ^ (x >> 30)) * _MIX1) & _MASK64
+            x = ((x ^ (x >> 27)) * _MIX2) & _MASK64
+            x ^= x >> 31
+
+            idx = x >> shift
+            rank = shift - (x & mask).bit_length() + 1
+            if rank > registers[idx]:
+                registers[idx] = rank
+
+    def union(self, other):
+        """Returns a sketch of the values added to either sketch.
+
+        Parameters
+        ----------
+        other : HyperLogLog
+            Of the same precision
+
+        Returns
+        ------
+        HyperLogLog
+        """
+        union = HyperLogLog(self.precision)
+        union._registers = bytearray(map(max, self._registers,
+                                         other._registers))
+        return union
+
+
+class KMinValues():
+    """A KMinValues sketch keeps the `k` smallest hashes of the values added
+    to it. The hashes are uniform, so the k-th smallest one tells what
+    fraction `theta` of all hashes the sketch holds. Sketches are mergeable
+    and the hashes two sketches share below the smaller of their thetas are
+    a uniform sample of the values added to both, see `intersection`.
+
+    Hashes below the k-th smallest are appended to a buffer, which is
+    compacted back to the k smallest when it holds `2 * k` hashes.
+    """
+
+    def __init__(self, k):
+        """
+        Attributes
+        ---------
+        k : int
+            The amount of hashes kept
+        _hashes : array of uint64
+            The k smallest hashes so far and the buffered ones
+        _limit : int
+            Only hashes below the limit can be among the k smallest
+        """
+        self.k = max(int(k), 1)
+        self._hashes = array('Q')
+        self._limit = _HASHES
+
+    @staticmethod
+    def memory_for(k):
+        """Returns the memory in bytes a sketch of `k` hashes needs: a full
+        buffer, which is sorted when it is compacted.
+
+        Parameters
+        ----------
+        k : int
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return int(2 * k * c.SORT_ELEMENT_SIZE)
+
+    @staticmethod
+    def capacity_for(memory):
+        """Returns the amount of hashes a sketch of `memory` bytes keeps.
+
+        Parameters
+        ----------
+        memory : int
+            In bytes
+
+        Returns
+        ------
+        int
+        """
+        return int(memory // (2 * c.SORT_ELEMENT_SIZE))
+
+    @property
+    def theta(self):
+        """Returns the fraction of all hashes below the limit, 1 while the
+        sketch holds fewer than `k` hashes.
+
+        Returns
+        ------
+        float
+        """
+        self._compact()
+        return self._limit / _HASHES
+
+    @property
+    def cardinality(self):
+        """Returns the estimated amount of distinct values added.
+
+        Returns
+        ------
+        float
+        """
+        return len(self.sample()) / self.theta
+
+    def sample(self, limit=None):
+        """Returns the kept hashes below `limit`, sorted.
+
+        Parameters
+        ----------
+        limit : int, optional
+            The limit of the sketch if None
+
+        Returns
+        ------
+        array of uint64
+        """
+        self._compact()
+        limit = self._limit if limit is None else limit
+        hashes = self._hashes
+        end = len(hashes)
+        while end and hashes[end - 1] >= limit:
+            end -= 1
+        return hashes[:end]
+
+    def _compact(self):
+        """Keeps the k smallest distinct hashes. Once there are `k` of them
+        the largest one is the limit, so only the `k - 1` below it are
+        sampled.
+        """
+        hashes = self._hashes
+        kept = array('Q')
+        last = None
+        for hash_ in sorted(hashes):
+            if hash_ != last:
+                kept.append(hash_)
+                last = hash_
+                if len(kept) == self.k:
+                    self._limit = hash_
+                    break
+        self._hashes = kept
+
+    def add_many(self, numbers):
+        """Adds every value of `numbers` to the sketch.
+
+        Parameters
+        ----------
+        numbers : iterable of int
+        """
+        hashes = self._hashes
+        limit = self._limit
+        full = 2 * self.k
+        for number in numbers:
+            x = (number + _OFFSET) & _MASK64
+            x = ((x ^ (x >> 30)) * _MIX1) & _MASK64
+            x = ((x ^ (x >> 27)) * _MIX2) & _MASK64
+            x ^= x >> 31
+
+            if x < limit:
+                hashes.append(x)
+                if len(hashes) >= full:
+                    self._compact()
+                    hashes = self._hashes
+                    limit = self._limit
+
+    def merge(self, other):
+        """Returns a sketch of the values added to either sketch.
+
+        Parameters
+        ----------
+        other : KMinValues
+
+        Returns
+        ------
+        KMinValues
+            Keeps as many hashes as the smaller of the two
+        """
+        self._compact()
+        other._compact()
+        merged = KMinValues(min(self.k, other.k))
+        merged._limit = min(self._limit, other._limit)
+        merged._hashes = self.sample(merged._limit) + \
+            other.sample(merged._limit)
+        merged._compact()
+        return merged
+
+    def intersection(self, other):
+        """Estimates the amount of values added to both sketches. The hashes
+        below the smaller limit are a sample of `theta` of every hash, so the
+        amount of shared ones is binomial and scaled up by 1 / `theta`.
+
+        Parameters
+        ----------
+        other : KMinValues
+
+        Returns
+        ------
+        float
+            The estimate
+        float
+            Its standard error, 0 when both sketches hold every hash
+        """
+        self._compact()
+        other._compact()
+        limit = min(self._limit, other._limit)
+        shared = len(set(self.sample(limit)).intersection(other.sample(limit)))
+        theta = limit / _HASHES
+
+        # no shared hashes still leaves room for a few shared values
+        error = math.sqrt(max(shared, 1) * (1 - theta)) / theta
+        return shared / theta, error
+
+
+class FileStats():
+    """FileStats are estimated statistics of an input file, gathered from
+    samples of it, see `sample_file`.
+    """
+
+    def __init__(self, size, lines, low, high, fraction, sketch):
+        """
+        Attributes
+        ---------
+        size : int
+            The size of the file in bytes
+        lines : int
+            The estimated amount of numbers in the file
+        low : int U None
+            The smallest sampled number, None for an empty file
+        high : int U None
+            The largest sampled number, None for an empty file
+        fraction : float
+            The fraction of the numbers of the file which were sampled
+        sketch : HyperLogLog
+            Sketch of the sampled numbers
+        """
+        self.size = size
+        self.lines = lines
+        self.low = low
+        self.high = high
+        self.fraction = fraction
+        self.sketch = sketch
+
+    @property
+    def exact(self):
+        """Was every number of the file sampled?
+
+        Returns
+        ------
+        bool
+        """
+        return self.fraction >= 1
+
+
+def _text_samples(path, size, n_samples, sample_size, seed):
+    """Yields the complete lines of `n_samples` chunks of about `sample_size`
+    bytes, one at a random offset in every 1 / `n_samples` of the file, or
+    every line if the chunks would cover the whole file.
+    """
+    with open(path, 'rb') as infile:
+        if size <= n_samples * sample_size:
+            carry = b''
+            while True:
+                chunk = infile.read(sample_size)
+                if not chunk:
+                    break
+                chunk = carry + chunk
+                cut = chunk.rfind(b'\n') + 1
+                carry = chunk[cut:]
+                yield chunk[:cut]
+            yield carry
+            return
+
+        random = r.Random(seed)
+        stratum = (size - sample_size) / n_samples
+        for idx in range(n_samples):
+            offset = int(stratum * idx + random.random() * stratum)
+            infile.seek(offset)
+            chunk = infile.read(sample_size)
+            # the first line may be cut off, unless the chunk starts the file
+            start = chunk.find(b'\n') + 1 if offset else 0
+            yield chunk[start:chunk.rfind(b'\n') + 1]
+
+
+def sample_file(path, packed=False, n_samples=c.ESTIMATE_SAMPLES,
+                sample_size=c.LINE_SAMPLE_SIZE, seed=0):
+    """Samples `n_samples` chunks of `sample_size` bytes spread over a file
+    to estimate its statistics. Files which are not larger than the samples
+    are read whole, which makes the statistics exact but for the sketch.
+
+    Parameters
+    ----------
+    path : str
+    packed : bool, optional
+        Is the file a file of packed uint64s instead of lines?
+    n_samples : int, optional
+    sample_size : int, optional
+        In bytes
+    seed : int, optional
+        Picks the offsets of the samples
+
+    Returns
+    ------
+    FileStats
+    """
+    size = os.path.getsize(path)
+    sketch = HyperLogLog()
+    low = high = None
+    sampled_bytes = sampled_lines = 0
+
+    if packed:
+        per_sample = max(sample_size // c.SIZE_UINT64, 1) * c.SIZE_UINT64
+        stride = max(size // c.SIZE_UINT64 // max(n_samples, 1), 1) * \
+            c.SIZE_UINT64
+        stride = max(stride, per_sample)
+        blocks = (
+            (block, len(block) * c.SIZE_UINT64)
+            for start in range(0, size, stride)
+            for block in read_packed(path, per_sample // c.SIZE_UINT64,
+                                     start, min(start + per_sample, size))
+        )
+    else:
+        blocks = (
+            (array('Q', map(int, chunk.split())), len(chunk))
+            for chunk in _text_samples(path, size, n_samples, sample_size,
+                                       seed)
+        )
+
+    for block, block_bytes in blocks:
+        if not block:
+            continue
+        sketch.add_many(block)
+        sampled_lines += len(block)
+        sampled_bytes += block_bytes
+        low = min(block) if low is None else min(low, min(block))
+        high = max(block) if high is None else max(high, max(block))
+
+    if packed:
+        lines = size // c.SIZE_UINT64
+    elif size <= n_samples * sample_size or not sampled_lines:
+        lines = sampled_lines
+    else:
+        # the sampled lines are complete, so their average length holds for
+        # the rest of the file
+        lines = int(size * sampled_lines / sampled_bytes)
+
+    fraction = min(sampled_lines / lines, 1.0) if lines else 1.0
+    return FileStats(size, lines, low, high, fraction, sketch)
+
+
+def file_stats(path, packed=False):
+    """Returns the statistics of a file, see `sample_file`. A file is only
+    sampled once per process, unless it changed since.
+
+    Parameters
+    ----------
+    path : str
+    packed : bool, optional
+
+    Returns
+    ------
+    FileStats
+    """
+    status = os.stat(path)
+    key = (os.path.abspath(path), status.st_size, status.st_mtime_ns, packed)
+    if key not in _stats:
+        _stats[key] = sample_file(path, packed)
+    return _stats[key]
+
+
+def estimate_overlap(stats1, stats2):
+    """Estimates the amount of numbers two files have in common from the
+    sketches of their samples. A number is in both samples with the product
+    of the sampled fractions as probability, so the overlap of the samples
+    is scaled up by it.
+
+    Parameters
+    ----------
+    stats1 : FileStats
+    stats2 : FileStats
+
+    Returns
+    ------
+    int U None
+        None if the samples are too small to tell the overlap apart from the
+        error of the sketches
+    """
+    most = min(stats1.lines, stats2.lines)
+    if not most:
+        return 0
+    if stats1.exact and stats2.exact and \
+            (stats1.high < stats2.low or stats2.high < stats1.low):
+        return 0
+
+    union = stats1.sketch.union(stats2.sketch).cardinality
+    shared = stats1.sketch.cardinality + stats2.sketch.cardinality - union
+    fraction = stats1.fraction * stats2.fraction
+
+    noise = _MIN_OVERLAP_ERRORS * stats1.sketch.error * union
+    if not fraction or most * fraction < noise:
+        return None
+    return int(min(max(shared, 0) / fraction, most))
@@ -0,0 +1,234 @@
+from bisect import bisect_left
+import heapq
+import os
+import tempfile
+from array import array
+
+from sisu.packed import read_deltas, read_packed, write_deltas, write_packed
+import sisu.constants as c
+
+
+class SortedRuns():
+    """SortedRuns are the sorted pieces of a file which did not fit in memory.
+    Each run is a binary file of packed uint64s in ascending order, or of
+    their deltas if `delta` is set, see `packed.write_deltas`.
+    """
+
+    def __init__(self, dir_=None, delta=False,
+                 frame_size=c.DELTA_FRAME_SIZE):
+        """
+        Attributes
+        ---------
+        paths : list of str
+            Path of every run file, in the order they were written
+        cardinality : int
+            The amount of values over all runs
+        dir : TemporaryDirectory
+            Output dir for the run files
+        delta : bool
+            Are runs delta encoded? Small gaps between sorted values take
+            fewer bytes, at the cost of encoding them.
+        frame_size : int
+            Values per frame of a delta encoded run. A frame is read and
+            skipped as a whole.
+        """
+        self.paths = []
+        self.cardinality = 0
+        self.delta = delta
+        self.frame_size = frame_size
+        self.dir = tempfile.TemporaryDirectory(dir=dir_)
+
+    def write(self, run):
+        """Sorts `run` and appends it to disk as a new run file.
+
+        Parameters
+        ----------
+        run : iterable of int
+            Values of the run
+
+        Returns
+        ------
+        str
+            Path of the run file
+        """
+        run = array('Q', sorted(run))
+        path = os.path.join(self.dir.name, str(len(self.paths)))
+        with open(path, 'wb') as outfile:
+            if self.delta:
+                write_deltas(outfile, run, self.frame_size)
+            else:
+                write_packed(outfile, run)
+        self.paths.append(path)
+        self.cardinality += len(run)
+        return path
+
+    def cleanup(self):
+        """Removes the run files from disk."""
+        self.dir.cleanup()
+
+
+def write_runs(blocks, run_size, delta=False,
+               frame_size=c.DELTA_FRAME_SIZE):
+    """Groups the values of `blocks` in runs of about `run_size` values, then
+    sorts every run in memory and writes it to disk.
+
+    Parameters
+    ----------
+    blocks : iterable of array of uint64
+    run_size : int
+        Number of values sorted in memory at a time
+    delta : bool, optional
+        Delta encode the runs, see `SortedRuns`
+    frame_size : int, optional
+        Values per frame of a delta encoded run
+
+    Returns
+    ------
+    SortedRuns
+    """
+    runs = SortedRuns(delta=delta, frame_size=frame_size)
+    run = array('Q')
+    for block in blocks:
+        run.extend(block)
+        if len(run) >= run_size:
+            runs.write(run)
+            run = array('Q')
+    if run:
+        runs.write(run)
+    return runs
+
+
+def skip_to(generator, value):
+    """Sends `value` to `generator`, like a stream of `merge_runs` to skip
+    ahead to it. Returns None when the generator is exhausted.
+
+    Parameters
+    ----------
+    generator : generator
+    value : int
+
+    Returns
+    ------
+    int U array of uint64 U None
+    """
+    try:
+        return generator.send(value)
+    except StopIteration:
+        return None
+
+
+def gallop(block, value, pos=0):
+    """Returns the position of the first value of ascending `block` from
+    `pos` on which is not smaller than `value`. The block is searched with
+    steps which double from `pos` and then bisected, so a value `n` values
+    ahead takes about 2 log2(n) comparisons however large the block.
+
+    Parameters
+    ----------
+    block : array of uint64
+    value : int
+    pos : int, optional
+
+    Returns
+    ------
+    int
+    """
+    size = len(block)
+    low = high = pos
+    step = 1
+    while high < size and block[high] < value:
+        low = high + 1
+        high += step
+        step <<= 1
+    return bisect_left(block, value, low, min(high, size))
+
+
+def _position(values):
+    """Returns the position of the next value of an iterator over an array.
+    The position is part of the state the iterator pickles with.
+    """
+    return values.__reduce__()[2]
+
+
+def merge_runs(paths, block_size, delta=False):
+    """K-way merges sorted run files into a single ascending stream of unique
+    values. Every run is read `block_size` values at a time.
+
+    Sending a value larger than the value yielded last to the stream skips
+    ahead to it and returns the first value which is not smaller. Runs
+    behind the value gallop to it in their block, see `gallop`, pass over
+    blocks which end before it, and delta encoded runs pass over whole
+    frames without decoding them, see `packed.read_deltas`.
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths to sorted run files
+    block_size : int
+        Number of values buffered per run
+    delta : bool, optional
+        Are the runs delta encoded? See `SortedRuns`
+
+    Yields
+    ------
+    int
+    """
+    read = read_deltas if delta else read_packed
+    # like `heapq.merge` the heap holds the current value and the position of
+    # every run, followed by an iterator over the rest of its block, the
+    # block and the generator of its blocks
+    heap = []
+    for idx, path in enumerate(paths):
+        blocks = read(path, block_size)
+        block = next(blocks, None)
+        if block:
+            values = iter(block)
+            heap.append([next(values), idx, values, block, blocks])
+    heapq.heapify(heap)
+
+    heapreplace = heapq.heapreplace
+    previous = low = None
+    while heap:
+        entry = heap[0]
+        value = entry[0]
+        if low is None or value >= low:
+            if value != previous:
+                previous = value
+                low = yield value
+                # the run of `value` skips ahead next
+                if low is not None:
+                    continue
+            try:
+                entry[0] = next(entry[2])
+                heapreplace(heap, entry)
+                continue
+            except StopIteration:
+                block = next(entry[4], None)
+                pos = 0
+        else:
+            # most runs are only a value behind, a step is cheaper than a
+            # search for those
+            value = next(entry[2], None)
+            if value is not None and value >= low:
+                entry[0] = value
+                heapreplace(heap, entry)
+                continue
+
+            # the others gallop from their position in their block, a block
+            # which ends before `low` is passed over for the next
+            block = entry[3]
+            pos = len(block) if value is None else \
+                gallop(block, low, _position(entry[2]))
+            while pos == len(block):
+                block = skip_to(entry[4], low)
+                if block is None:
+                    break
+                pos = gallop(block, low)
+
+        if block is None:
+            heapq.heappop(heap)
+        else:
+            values = iter(block)
+            values.__setstate__(pos + 1)
+            entry[0], entry[2], entry[3] = block[pos], values, block
+            heapreplace(heap, entry)
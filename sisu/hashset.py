@@ -0,0 +1,279 @@
+from array import array
+import math
+
+import sisu.constants as c
+
+# IDs are in [0, 2^63) so the largest uint64 never collides with an element
+EMPTY = (1 << 64) - 1
+
+# fibonacci hashing constant (2^64 / golden ratio)
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+class Uint64HashSet():
+    """A Uint64HashSet is a set of unsigned 64 bit ints stored in a flat
+    array of slots with open addressing and linear probing. An element costs
+    `c.SIZE_UINT64` bytes per slot plus the slack needed to keep the load
+    factor below `c.HASH_SET_MAX_LOAD`, instead of the boxed int and set
+    entry a python `set` needs for it.
+
+    A set with a finite `max_size` allocates its slot array up front, so
+    its memory is known exactly. Otherwise, or when a smaller `size_hint`
+    is given, the slot array doubles as it fills up. While growing, the old
+    and the new slot arrays are briefly both alive.
+    """
+
+    def __init__(self, max_size=float('inf'), size_hint=None,
+                 initial_slots=c.HASH_SET_INITIAL_SLOTS):
+        """
+        Attributes
+        ---------
+        max_size : int
+            The amount of elements the set can hold
+        size_hint : int, optional
+            The amount of elements the set is expected to hold
+        _slots : array of uint64
+            Table of elements, free slots hold EMPTY
+        _size : int
+            The amount of elements in the set
+        _threshold : int
+            The amount of elements at which the table has to grow
+        """
+        self.max_size = max_size
+        self._max_slots = Uint64HashSet.slots_for(max_size)
+        self._size = 0
+
+        if size_hint is not None:
+            n_slots = Uint64HashSet.slots_for(min(size_hint, max_size))
+        elif math.isinf(max_size):
+            n_slots = initial_slots
+        else:
+            n_slots = self._max_slots
+        self._allocate(n_slots)
+
+    @staticmethod
+    def slots_for(n):
+        """Returns the amount of slots needed to hold `n` elements.
+
+        Parameters
+        ----------
+        n : int U float
+
+        Returns
+        ------
+        int U float
+        """
+        if math.isinf(n):
+            return n
+        # there is always at least one empty slot so probing terminates
+        return int(n / c.HASH_SET_MAX_LOAD) + 1
+
+    @staticmethod
+    def memory_for(n):
+        """Returns the size in bytes of a table for `n` elements.
+
+        Parameters
+        ----------
+        n : int
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return Uint64HashSet.slots_for(n) * c.SIZE_UINT64
+
+    @staticmethod
+    def capacity_for(memory):
+        """Returns the amount of elements a table of at most `memory` bytes
+        can hold.
+
+        Parameters
+        ----------
+        memory : int (in bytes)
+
+        Returns
+        ------
+        int
+        """
+        slots = int(memory // c.SIZE_UINT64)
+        # the most elements whose `slots_for` fits, so that a table sized
+        # with `memory_for(n)` holds n elements
+        return max(math.ceil(slots * c.HASH_SET_MAX_LOAD) - 1, 0)
+
+    @property
+    def memory(self):
+        """Returns the size in bytes of the slot array.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return len(self._slots) * c.SIZE_UINT64
+
+    def _allocate(self, n_slots):
+        """Replaces the slot array with an empty one of `n_slots` slots."""
+        n_slots = max(int(n_slots), 1)
+        self._slots = array('Q', (EMPTY,)) * n_slots
+        if n_slots >= self._max_slots:
+            self._threshold = max(
+                min(self.max_size, int(n_slots * c.HASH_SET_MAX_LOAD)), 0
+            )
+        else:
+            self._threshold = int(n_slots * c.HASH_SET_MAX_LOAD)
+
+    def _grow(self):
+        """Doubles the slot array, up to the size needed for `max_size`
+        elements, and reinserts every element.
+        """
+        n_slots = len(self._slots)
+        if n_slots >= self._max_slots:
+            raise ValueError('Uint64HashSet is full')
+
+        old_slots = self._slots
+        self._allocate(min(2 * n_slots, self._max_slots))
+        self._size = 0
+        self.add_many(key for key in old_slots if key != EMPTY)
+
+    def resize(self, max_size):
+        """Rehashes the set into a slot array sized for `max_size` elements.
+        The old and the new slot arrays are briefly both alive.
+
+        Parameters
+        ----------
+        max_size : int
+            Has to be at least the amount of elements in the set
+        """
+        if max_size < self._size:
+            raise ValueError('Uint64HashSet can not hold its elements')
+
+        old_slots = self._slots
+        self.max_size = max_size
+        self._max_slots = Uint64HashSet.slots_for(max_size)
+        self._allocate(self._max_slots)
+        self._size = 0
+        self.add_many(key for key in old_slots if key != EMPTY)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return (key for key in self._slots if key != EMPTY)
+
+    def __contains__(self, key):
+        """Is key in the set?
+
+        Parameters
+        ----------
+        key : int
+
+        Returns
+        ------
+        bool
+        """
+        slots = self._slots
+        n_slots = len(slots)
+        idx = (((key * _GOLDEN) & _MASK64) * n_slots) >> 64
+        while True:
+            current = slots[idx]
+            if current == key:
+                return True
+            if current == EMPTY:
+                return False
+            idx += 1
+            if idx == n_slots:
+                idx = 0
+
+    def add(self, key):
+        """Adds key to the set.
+
+        Parameters
+        ----------
+        key : int
+
+        Returns
+        ------
+        bool
+            Whether key was not in the set yet
+        """
+        if self._size >= self._threshold:
+            self._grow()
+
+        slots = self._slots
+        n_slots = len(slots)
+        idx = (((key * _GOLDEN) & _MASK64) * n_slots) >> 64
+        while True:
+            current = slots[idx]
+            if current == key:
+                return False
+            if current == EMPTY:
+                slots[idx] = key
+                self._size += 1
+                return True
+            idx += 1
+            if idx == n_slots:
+                idx = 0
+
+    def add_many(self, keys):
+        """Adds every key of `keys` to the set.
+
+        Parameters
+        ----------
+        keys : iterable of int
+
+        Returns
+        ------
+        int
+            The amount of keys which were not in the set yet
+        """
+        added = 0
+        slots = self._slots
+        n_slots = len(slots)
+        for key in keys:
+            if self._size >= self._threshold:
+                self._grow()
+                slots = self._slots
+                n_slots = len(slots)
+
+            idx = (((key * _GOLDEN) & _MASK64) * n_slots) >> 64
+            while True:
+                current = slots[idx]
+                if current == key:
+                    break
+                if current == EMPTY:
+                    slots[idx] = key
+                    self._size += 1
+                    added += 1
+                    break
+                idx += 1
+                if idx == n_slots:
+                    idx = 0
+        return added
+
+    def contains_many(self, keys):
+        """Returns the keys of `keys` which are in the set.
+
+        Parameters
+        ----------
+        keys : iterable of int
+
+        Returns
+        ------
+        array of uint64
+        """
+        hits = array('Q')
+        slots = self._slots
+        n_slots = len(slots)
+        for key in keys:
+            idx = (((key * _GOLDEN) & _MASK64) * n_slots) >> 64
+            while True:
+                current = slots[idx]
+                if current == key:
+                    hits.append(key)
+                    break
+                if current == EMPTY:
+                    break
+                idx += 1
+                if idx == n_slots:
+                    idx = 0
+        return hits
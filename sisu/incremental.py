@@ -0,0 +1,290 @@
+from itertools import groupby, repeat
+from operator import itemgetter
+import heapq
+import json
+import os
+
+from sisu.index import Index
+from sisu.memory import MemoryBudget
+from sisu.result import Counter
+import sisu.constants as c
+import sisu.external_sort as external_sort
+import sisu.index as index
+import sisu.utils as utils
+
+
+class Checkpoint():
+    """A Checkpoint records how far the intersection of two files which grow
+    by appending lines is up to date: the offset in bytes up to which each
+    file was read, the cardinality of the intersection of those lines and the
+    indexes of the numbers of each side, see `index.Index`. It is a JSON file
+    and the indexes are written next to it.
+
+    Every update adds an index of the lines appended to a file to its side,
+    and the indexes of a side are merged into one when there are too many of
+    them, see `update`.
+    """
+
+    def __init__(self, path):
+        """
+        Attributes
+        ---------
+        path : str
+            Path of the checkpoint file
+        files : list of str U None
+            Absolute paths of the two files, None until the checkpoint is
+            first saved
+        offsets : list of int
+            Offset in bytes of the first line of each file which was not read
+        count : int
+            The cardinality of the intersection of the lines read
+        indexes : list of list of str
+            Paths of the indexes of the numbers read from each file. They
+            are saved relative to the directory of the checkpoint, so it
+            can be used from any working directory.
+        serial : int
+            The amount of indexes written so far, which names the next one
+        """
+        self.path = path
+        self.files = None
+        self.offsets = [0, 0]
+        self.count = 0
+        self.indexes = [[], []]
+        self.serial = 0
+        if os.path.exists(path):
+            with open(path) as infile:
+                vars(self).update(json.load(infile))
+            self.path = path
+            self.indexes = [
+                [os.path.join(os.path.dirname(path), path_)
+                 for path_ in paths]
+                for paths in self.indexes
+            ]
+
+    def index_path(self):
+        """Returns the path of a new index next to the checkpoint.
+
+        Returns
+        ------
+        str
+        """
+        self.serial += 1
+        return f'{self.path}.{self.serial}.idx'
+
+    def save(self):
+        """Writes the checkpoint. It replaces the previous one at once, so an
+        interrupted update leaves the previous one intact.
+        """
+        state = {key: value for key, value in vars(self).items()
+                 if key != 'path'}
+        directory = os.path.dirname(self.path) or os.curdir
+        state['indexes'] = [
+            [os.path.relpath(path, directory) for path in paths]
+            for paths in self.indexes
+        ]
+        with open(f'{self.path}.tmp', 'w') as outfile:
+            json.dump(state, outfile)
+        os.replace(f'{self.path}.tmp', self.path)
+
+
+def _index_lines(file_, start, end, path, mem_limit, budget):
+    """Writes an `Index` of the lines in [`start`, `end`) of `file_`, like
+    `index.build`.
+
+    Returns
+    ------
+    Index
+    """
+    read_memory = mem_limit * index.RUN_READ_MEMORY
+    run_size = max(int((mem_limit - read_memory) // c.SORT_ELEMENT_SIZE), 1)
+
+    # half of the read memory parses the lines, the other half holds them
+    # as a list of ints
+    budget.reserve('sort_run', mem_limit)
+    runs = external_sort.write_runs(
+        utils.read_file_by_block(
+            file_, max(int(read_memory / 2 // c.SORT_ELEMENT_SIZE), 1),
+            start, end, read_memory / 2 // c.PARSE_OVERHEAD,
+            complete_lines=True
+        ),
+        run_size
+    )
+    budget.release('sort_run')
+
+    return index.from_runs(runs, path, mem_limit, budget)
+
+
+def _contains(indexes, block_size):
+    """Returns a function which tells whether any of `indexes` holds a
+    number. It is asked about ascending numbers only, which the indexes skip
+    ahead to, see `Index.values`.
+
+    Parameters
+    ----------
+    indexes : list of Index
+    block_size : int
+
+    Returns
+    ------
+    function
+    """
+    streams = [index_.values(block_size) for index_ in indexes]
+    heads = [next(stream, None) for stream in streams]
+
+    def contains(value):
+        found = False
+        for idx, stream in enumerate(streams):
+            if heads[idx] is not None and heads[idx] < value:
+                heads[idx] = external_sort.skip_to(stream, value)
+            found = found or heads[idx] == value
+        return found
+
+    return contains
+
+
+def _new_numbers(old, appended, block_size):
+    """Yields the numbers of the appended lines of either side which are in
+    the intersection now, but were not before.
+
+    Parameters
+    ----------
+    old : list of list of Index
+        The indexes of the lines of each side read before
+    appended : list of Index U None
+        The index of the appended lines of each side, None if there are none
+    block_size : int
+        Numbers read at a time from every index
+
+    Yields
+    ------
+    int
+    """
+    contains = [_contains(indexes, block_size) for indexes in old]
+    streams = [
+        zip(index_.values(block_size), repeat(side))
+        for side, index_ in enumerate(appended) if index_ is not None
+    ]
+
+    for value, group in groupby(heapq.merge(*streams), key=itemgetter(0)):
+        sides = {side for _, side in group}
+        before = [contains[0](value), contains[1](value)]
+        if all(before):
+            continue
+        if all(before[side] or side in sides for side in (0, 1)):
+            yield value
+
+
+def update(file1, file2, path, mem_limit, budget=None, result=None,
+           max_indexes=c.CHECKPOINT_INDEXES):
+    """Brings the checkpoint at `path` up to date with the lines appended to
+    `file1` and `file2` since it was saved, or creates it from all of their
+    lines. Only the appended lines are read: they are indexed, and their
+    numbers are probed against the indexes of the lines read before of both
+    sides. A last line without a newline is left for the next update.
+
+    Parameters
+    ----------
+    file1 : str
+    file2 : str
+    path : str
+        The path of the checkpoint
+    mem_limit : float
+        The memory limit in bytes
+    budget : MemoryBudget, optional
+        memory of the indexes and the read buffers is reserved from it
+    result : Counter, optional
+        Gets the numbers which were not in the intersection before
+    max_indexes : int, optional
+        The indexes of a side are merged into one when there are more of
+        them
+
+    Returns
+    ------
+    Checkpoint
+    """
+    checkpoint = Checkpoint(path)
+    files = [os.path.abspath(file_) for file_ in (file1, file2)]
+    if checkpoint.files is None:
+        checkpoint.files = files
+    elif checkpoint.files != files:
+        raise ValueError(f'The checkpoint {path} is of '
+                         f'{checkpoint.files[0]} and {checkpoint.files[1]}.')
+
+    ends = [utils.line_end(file_) for file_ in files]
+    for file_, offset, end in zip(files, checkpoint.offsets, ends):
+        if end < offset:
+            raise ValueError(f'{file_} is shorter than when the checkpoint '
+                             'was saved, lines can only be appended.')
+
+    budget = budget or MemoryBudget(mem_limit)
+    result = Counter() if result is None else result
+    budget.reserve('result', result.memory)
+    memory = mem_limit - result.memory
+
+    # the indexes written by this update are removed when it fails, as the
+    # checkpoint does not refer to them
+    written = []
+    try:
+        # the partitions of an index are held until the end
+        appended = []
+        index_memory = 0
+        for file_, offset, end in zip(files, checkpoint.offsets, ends):
+            index_ = None
+            if end > offset:
+                written.append(checkpoint.index_path())
+                index_ = _index_lines(file_, offset, end, written[-1],
+                                      memory - index_memory, budget)
+                index_memory += index_.memory
+                budget.reserve('indexes', index_memory)
+            appended.append(index_)
+        old = [[Index(path_) for path_ in paths]
+               for paths in checkpoint.indexes]
+
+        # like `strategy.Indexed` a block of an index comes with its encoded
+        # frames
+        indexes = sum(old, []) + [
+            index_ for index_ in appended if index_ is not None
+        ]
+        index_memory = sum(index_.memory for index_ in indexes)
+        budget.reserve('indexes', index_memory)
+        budget.reserve('merge_buffers', memory - index_memory)
+        block_size = max(
+            int((memory - index_memory) //
+                (max(len(indexes), 1) * 4 * c.SIZE_UINT64)), 1
+        )
+
+        count = 0
+        for value in _new_numbers(old, appended, block_size):
+            result.add(value)
+            count += 1
+        budget.release('merge_buffers')
+        budget.release('indexes')
+
+        obsolete = []
+        for side, index_ in enumerate(appended):
+            if index_ is None:
+                continue
+            checkpoint.indexes[side].append(index_.path)
+            if len(checkpoint.indexes[side]) > max_indexes:
+                obsolete.extend(checkpoint.indexes[side])
+                written.append(checkpoint.index_path())
+                merged = index.merge(
+                    [Index(path_) for path_ in checkpoint.indexes[side]],
+                    written[-1], memory, budget
+                )
+                checkpoint.indexes[side] = [merged.path]
+
+        checkpoint.offsets = ends
+        checkpoint.count += count
+        checkpoint.save()
+    except BaseException:
+        for path_ in written:
+            if os.path.exists(path_):
+                os.remove(path_)
+        raise
+
+    for path_ in obsolete:
+        os.remove(path_)
+    budget.release('result')
+
+    return checkpoint
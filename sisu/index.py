@@ -0,0 +1,461 @@
+from array import array
+from bisect import bisect_right
+from itertools import groupby
+import argparse
+import heapq
+import struct
+
+from sisu.bloom import BloomFilter
+from sisu.memory import MemoryBudget
+from sisu.packed import encode_deltas, read_deltas, read_into, write_packed
+import sisu.constants as c
+import sisu.external_sort as external_sort
+import sisu.utils as utils
+
+# an index starts with this, followed by the amount of numbers, the smallest
+# and the largest of them, the amount of partitions, the capacity and the
+# size in bytes of the bloom filter and the offset of the filter
+_MAGIC = b'SISUIDX1'
+_HEADER = struct.Struct('<8sQQQIQQQ')
+
+# fraction of the memory used to read the file while sorting runs, like
+# `Merge.RUN_READ_MEMORY`
+RUN_READ_MEMORY = 1/8
+
+# the bloom filter of an index takes at most this fraction of the memory it
+# is built with
+BLOOM_MEMORY_THRESHOLD = 1/4
+
+
+class Index():
+    """An Index is a file of the sorted, unique numbers of another file. It is
+    written once by `build` and then intersected with other files without
+    sorting it again, see `strategy.Indexed`.
+
+    The header is followed by the first number and the offset of every
+    partition, then a bloom filter over the numbers, if there is one, and
+    then the numbers as frames of deltas, see `packed.write_deltas`. A
+    partition is a run of whole frames with about the same amount of numbers
+    in each, so a reader can seek straight to the partition of a number.
+    """
+
+    def __init__(self, path):
+        """
+        Attributes
+        ---------
+        path : str
+            Path of the index file
+        count : int
+            The amount of numbers
+        low : int
+            The smallest number, 0 if there are none
+        high : int
+            The largest number, 0 if there are none
+        fences : array of uint64
+            The first number of every partition
+        offsets : array of uint64
+            The offset in bytes of every partition
+        bloom_capacity : int
+            The amount of numbers the bloom filter was sized for
+        bloom_memory : int
+            The size in bytes of the bloom filter, 0 if there is none
+        _bloom_offset : int
+            The offset in bytes of the bloom filter
+        """
+        with open(path, 'rb') as infile:
+            header = infile.read(_HEADER.size)
+            if len(header) < _HEADER.size or not header.startswith(_MAGIC):
+                raise ValueError(f'{path} is not an index.')
+            (
+                _,
+                self.count,
+                self.low,
+                self.high,
+                n_partitions,
+                self.bloom_capacity,
+                self.bloom_memory,
+                self._bloom_offset,
+            ) = _HEADER.unpack(header)
+            partitions = array('Q', (0,)) * (2 * n_partitions)
+            read_into(infile, partitions)
+        self.path = path
+        self.fences = partitions[::2]
+        self.offsets = partitions[1::2]
+
+    @staticmethod
+    def is_index(path):
+        """Is the file at `path` an index?
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        ------
+        bool
+        """
+        with open(path, 'rb') as infile:
+            return infile.read(len(_MAGIC)) == _MAGIC
+
+    @property
+    def memory(self):
+        """Returns the memory in bytes of the partitions, which are held in
+        memory while the index is read.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return (len(self.fences) + len(self.offsets)) * c.SIZE_UINT64
+
+    def bloom(self):
+        """Reads the bloom filter over the numbers. It takes
+        `bloom_memory` bytes.
+
+        Returns
+        ------
+        BloomFilter U None
+            None if the index has no filter
+        """
+        if not self.bloom_memory:
+            return None
+        with open(self.path, 'rb') as infile:
+            infile.seek(self._bloom_offset)
+            return BloomFilter.read(infile, self.bloom_capacity,
+                                    self.bloom_memory)
+
+    def values(self, block_size):
+        """Yields the numbers in ascending order, read about `block_size` at a
+        time, see `packed.read_deltas`.
+
+        Like a stream of `external_sort.merge_runs`, sending a number skips
+        ahead to it and returns the first number which is not smaller. The
+        current block gallops to it. Past the block, reading seeks to the
+        partition of the number if that partition starts after the block,
+        otherwise the frames before it are passed over.
+
+        Parameters
+        ----------
+        block_size : int
+
+        Yields
+        ------
+        int
+        """
+        if not self.count:
+            return
+
+        blocks = read_deltas(self.path, block_size, self.offsets[0])
+        block = next(blocks, None)
+        pos = 0
+        while block is not None:
+            low = yield block[pos]
+            if low is None:
+                pos += 1
+                if pos == len(block):
+                    block = next(blocks, None)
+                    pos = 0
+                continue
+
+            pos = external_sort.gallop(block, low, pos + 1)
+            if pos < len(block):
+                continue
+
+            # every number of the block is smaller than `low`
+            partition = bisect_right(self.fences, low) - 1
+            if self.fences[partition] > block[-1]:
+                blocks.close()
+                blocks = read_deltas(self.path, block_size,
+                                     self.offsets[partition])
+                block = next(blocks, None)
+            else:
+                block = external_sort.skip_to(blocks, low)
+            while block is not None:
+                pos = external_sort.gallop(block, low)
+                if pos < len(block):
+                    break
+                block = external_sort.skip_to(blocks, low)
+
+
+def build(file_, path, mem_limit, reader=None, budget=None,
+          bloom_bits=0, n_partitions=c.INDEX_PARTITIONS,
+          frame_size=c.DELTA_FRAME_SIZE, start=0, end=None):
+    """Writes an `Index` of the numbers of `file_` to `path` within
+    `mem_limit`. The file is sorted into runs, see `external_sort.write_runs`,
+    which are merged into the frames of the index.
+
+    Parameters
+    ----------
+    file_ : str
+        the path to the file of newline delimited numbers
+    path : str
+        the path to write the index to
+    mem_limit : float
+        The memory limit in bytes
+    reader : FileReader, optional
+        reads blocks of numbers from the file
+    budget : MemoryBudget, optional
+        memory of the runs, the merge and the filter is reserved from it
+    bloom_bits : float, optional
+        Bits per number of the bloom filter, which takes at most
+        `BLOOM_MEMORY_THRESHOLD` of the memory limit. No filter is written
+        if 0. Checking a number against the filter costs about as much as
+        sorting it and writing it to a run, so a filter only pays off when
+        disk writes are slow.
+    n_partitions : int, optional
+        The most partitions the numbers are split into
+    frame_size : int, optional
+        Numbers per delta encoded frame
+    start : int, optional
+        Offset in bytes to start reading the file at, on a line boundary
+    end : int, optional
+        Offset in bytes to stop reading the file at, on a line boundary.
+        Reads to the end of the file if None
+
+    Returns
+    ------
+    Index
+    """
+    reader = reader or utils.FileReader()
+    budget = budget or MemoryBudget(mem_limit)
+
+    read_memory = mem_limit * RUN_READ_MEMORY
+    run_size = max(int((mem_limit - read_memory) // c.SORT_ELEMENT_SIZE), 1)
+    budget.reserve('sort_run', mem_limit)
+    runs = external_sort.write_runs(
+        reader.blocks(file_, read_memory // c.PARSE_OVERHEAD, start, end),
+        run_size
+    )
+    budget.release('sort_run')
+
+    return from_runs(runs, path, mem_limit, budget, bloom_bits,
+                     n_partitions, frame_size)
+
+
+def from_runs(runs, path, mem_limit, budget, bloom_bits=0,
+              n_partitions=c.INDEX_PARTITIONS,
+              frame_size=c.DELTA_FRAME_SIZE):
+    """Merges sorted runs into an `Index` at `path` within `mem_limit`, see
+    `build`. The runs are removed afterwards.
+
+    Parameters
+    ----------
+    runs : SortedRuns
+        Runs of packed values
+    path : str
+    mem_limit : float
+    budget : MemoryBudget
+    bloom_bits : float, optional
+    n_partitions : int, optional
+    frame_size : int, optional
+
+    Returns
+    ------
+    Index
+    """
+    bloom_memory = 0
+    if bloom_bits and runs.cardinality:
+        bloom_memory = min(
+            BloomFilter.memory_for(runs.cardinality, bloom_bits),
+            mem_limit * BLOOM_MEMORY_THRESHOLD
+        )
+
+    # like `Merge.block_size` for runs of packed values, less what writing
+    # and every open run take besides their blocks
+    merge_memory = mem_limit - bloom_memory - \
+        _write_memory(frame_size, n_partitions) - \
+        len(runs.paths) * c.MERGE_RUN_OVERHEAD
+    budget.reserve('merge_buffers', merge_memory)
+    block_size = max(
+        int(merge_memory // ((len(runs.paths) + 2) * c.SIZE_UINT64)), 1
+    )
+
+    index = write(external_sort.merge_runs(runs.paths, block_size),
+                  runs.cardinality, path, budget, bloom_memory,
+                  n_partitions, frame_size)
+
+    runs.cleanup()
+    budget.release('merge_buffers')
+
+    return index
+
+
+def _write_memory(frame_size, n_partitions):
+    """Returns the memory in bytes `write` needs besides the values: the
+    frame being encoded, which is held as values, as their deltas and as the
+    bytes of both, and the first number and offset of every partition.
+    """
+    return (4 * frame_size + 2 * n_partitions) * c.SIZE_UINT64
+
+
+def write(values, cardinality, path, budget, bloom_memory=0,
+          n_partitions=c.INDEX_PARTITIONS, frame_size=c.DELTA_FRAME_SIZE):
+    """Writes ascending, unique `values` to `path` as an `Index`.
+
+    Parameters
+    ----------
+    values : iterable of int
+    cardinality : int
+        At least the amount of values, the partitions and the bloom filter
+        are sized for it
+    path : str
+    budget : MemoryBudget
+        memory of the filter is reserved from it
+    bloom_memory : int, optional
+        Size in bytes of the bloom filter, none is written if 0
+    n_partitions : int, optional
+        The most partitions the numbers are split into
+    frame_size : int, optional
+        Numbers per delta encoded frame
+
+    Returns
+    ------
+    Index
+    """
+    bloom = None
+    if bloom_memory and cardinality:
+        bloom = BloomFilter(cardinality, bloom_memory)
+        bloom_memory = bloom.memory
+        budget.reserve('index.bloom', bloom_memory)
+    else:
+        bloom_memory = 0
+
+    # partitions are whole frames, and there is room for the most of them
+    # the values can fill
+    partition_size = frame_size * max(
+        -(-cardinality // (n_partitions * frame_size)), 1
+    )
+    max_partitions = -(-cardinality // partition_size)
+    bloom_offset = _HEADER.size + 2 * max_partitions * c.SIZE_UINT64
+    partitions = array('Q')
+
+    count = 0
+    with open(path, 'wb') as outfile:
+        outfile.seek(bloom_offset + bloom_memory)
+
+        def write_frame(frame):
+            nonlocal count
+            if count % partition_size == 0:
+                partitions.extend((frame[0], outfile.tell()))
+            outfile.write(encode_deltas(frame))
+            if bloom is not None:
+                bloom.add_many(frame)
+            count += len(frame)
+
+        frame = array('Q')
+        low = high = 0
+        for value in values:
+            frame.append(value)
+            if len(frame) == frame_size:
+                write_frame(frame)
+                frame = array('Q')
+        if frame:
+            write_frame(frame)
+        if count:
+            low, high = partitions[0], value
+
+        outfile.seek(0)
+        outfile.write(_HEADER.pack(
+            _MAGIC, count, low, high, len(partitions) // 2,
+            cardinality, bloom_memory, bloom_offset
+        ))
+        write_packed(outfile, partitions)
+        if bloom is not None:
+            outfile.seek(bloom_offset)
+            bloom.write(outfile)
+
+    budget.release('index.bloom')
+
+    return Index(path)
+
+
+def merge(indexes, path, mem_limit, budget=None,
+          n_partitions=c.INDEX_PARTITIONS, frame_size=c.DELTA_FRAME_SIZE):
+    """Writes the union of the numbers of `indexes` to `path` as a new
+    `Index` without a bloom filter. The indexes are read side by side, like
+    the runs of `build`.
+
+    Parameters
+    ----------
+    indexes : list of Index
+    path : str
+        Not the path of any of `indexes`
+    mem_limit : float
+        The memory limit in bytes
+    budget : MemoryBudget, optional
+        memory of the partitions and the read buffers is reserved from it
+    n_partitions : int, optional
+    frame_size : int, optional
+
+    Returns
+    ------
+    Index
+    """
+    budget = budget or MemoryBudget(mem_limit)
+    index_memory = sum(index_.memory for index_ in indexes)
+    budget.reserve('indexes', index_memory)
+    merge_memory = mem_limit - index_memory - \
+        _write_memory(frame_size, n_partitions) - \
+        len(indexes) * c.MERGE_RUN_OVERHEAD
+    budget.reserve('merge_buffers', merge_memory)
+
+    # a block comes with its encoded frames, see `strategy.Indexed`
+    block_size = max(
+        int(merge_memory // (len(indexes) * 4 * c.SIZE_UINT64)), 1
+    )
+    values = heapq.merge(*(index_.values(block_size) for index_ in indexes))
+    merged = write(
+        (value for value, _ in groupby(values)),
+        sum(index_.count for index_ in indexes), path, budget,
+        n_partitions=n_partitions, frame_size=frame_size
+    )
+
+    budget.release('merge_buffers')
+    budget.release('indexes')
+
+    return merged
+
+
+def parse_args(args=None):
+    """Parses the command line args of the index commands.
+
+    Parameters
+    ----------
+    args : list of str, optional
+        Reads from argv if None
+
+    Returns
+    ------
+    Namespace
+    """
+    parser = argparse.ArgumentParser(
+        description='Build indexes of files to intersect other files with'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser(
+        'build', help='Writes an index of a file of newline delimited numbers'
+    )
+    build_parser.add_argument('file', help='The file to index')
+    build_parser.add_argument('--output', required=True,
+                              help='Where to write the index')
+    build_parser.add_argument('--mem_limit', required=True,
+                              help='The upper limit for RAM in MB',
+                              type=lambda x: float(x) * c.MEGABYTE)
+    build_parser.add_argument('--bloom_bits', type=float, default=0,
+                              help='Bits per number of a bloom filter, none '
+                              'is written if 0')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Runs an index command."""
+    args = parse_args(args)
+    index = build(args.file, args.output, args.mem_limit,
+                  bloom_bits=args.bloom_bits)
+    print(f'Indexed {index.count} numbers in {len(index.fences)} partitions, '
+          f'{index.bloom_memory} bytes of bloom filter, to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
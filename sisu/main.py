@@ -1,6 +1,14 @@
+import contextlib
+import logging
 import time
 
+from sisu.memory import MemoryBudget
+from sisu.result import Counter, StreamingResult
+from sisu.index import Index
+from sisu.strategy import Approximate, Indexed, Streamed
+import sisu.incremental as incremental
 import sisu.optimize as optimize
+import sisu.parallel as parallel
 import sisu.utils as utils
 
 
@@ -8,20 +16,116 @@ def main():
     """Parse arguments, determine the optimal strategy
     and then call that strategy with the given params.
 
-    Print the cardinality of the result hash to get a final
-    result
+    Print the cardinality of the result to get a final result. The
+    intersecting numbers, or those of the set operation given with `--op`,
+    are only counted, or streamed to the output file
+    when one is given, so they never take up memory. With `--approx` the
+    cardinality is estimated instead, along with its error. With
+    `--checkpoint` only the lines appended since the last run are read. An
+    input which is a stream, like stdin, is read once by `Streamed`.
     """
     args = utils.parse_args()
-    strategy = optimize.optimal_strategy(args.file_1, args.file_2,
-                                         args.mem_limit)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    # a stream is only read by the strategy, it can not be peeked at
+    streamed = any(map(utils.is_stream, args.files))
+    indexed = any(Index.is_index(file_) for file_ in args.files
+                  if not utils.is_stream(file_))
+    if indexed and (args.approx or args.workers > 1 or args.checkpoint or
+                    streamed or len(args.files) > 2 or
+                    args.op != 'intersect'):
+        raise ValueError('An index is intersected with one other file at a '
+                         'time, exactly, on one process, without a '
+                         'checkpoint and not with a stream.')
+
+    reader = utils.MappedReader() if args.mmap else utils.FileReader()
+    budget = MemoryBudget(args.mem_limit, strict=args.strict_memory)
+    # tracing allocations is slow so it only happens when it is enforced
+    tracking = budget.track() if args.strict_memory else \
+        contextlib.nullcontext()
 
     start = time.time()
     print('Beginning operation')
-    res = strategy.intersect(args.file_1, args.file_2, args.mem_limit)
+    if args.approx:
+        # the estimate prints with its error
+        with tracking:
+            cardinality = Approximate.intersect(
+                args.file_1, args.file_2, args.mem_limit, reader=reader,
+                budget=budget
+            )
+    elif args.checkpoint:
+        # only the lines appended since the checkpoint are read, the numbers
+        # which join the intersection are counted or streamed out
+        result = StreamingResult(args.output) if args.output else Counter()
+        with tracking, result:
+            checkpoint = incremental.update(
+                args.file_1, args.file_2, args.checkpoint, args.mem_limit,
+                budget=budget, result=result
+            )
+        print(f'{result.cardinality} numbers joined the intersection')
+        cardinality = checkpoint.count
+    elif args.workers > 1:
+        # every partition pair gets the optimal strategy for its size
+        cardinality = parallel.intersect(
+            args.file_1, args.file_2, args.mem_limit, args.workers,
+            reader=reader, strict=args.strict_memory, output=args.output
+        )
+    elif len(args.files) > 2:
+        # the plan is picked for the two smallest files, the intersection
+        # of which every later file only narrows down
+        result = StreamingResult(args.output) if args.output else Counter()
+        strategy = optimize.optimal_strategy_many(
+            args.files, args.mem_limit, reader=reader,
+            result_memory=result.memory
+        )
+        if args.explain:
+            print(optimize.explain(
+                *utils.order_by_file_size(args.files)[:2], args.mem_limit,
+                multiway=True, reader=reader, result_memory=result.memory
+            ))
+        with tracking, result:
+            strategy.intersect_many(args.files, args.mem_limit,
+                                    reader=reader, budget=budget,
+                                    result=result)
+        cardinality = result.cardinality
+    else:
+        result = StreamingResult(args.output) if args.output else Counter()
+        # an index is not priced, only one strategy reads it, and the size
+        # of a stream is not known
+        if indexed:
+            strategy = Indexed
+        elif streamed:
+            strategy = Streamed
+        else:
+            strategy = optimize.optimal_strategy(
+                args.file_1, args.file_2, args.mem_limit, op=args.op,
+                reader=reader, result_memory=result.memory
+            )
+        if args.explain and not indexed and not streamed:
+            print(optimize.explain(
+                args.file_1, args.file_2, args.mem_limit, op=args.op,
+                reader=reader, result_memory=result.memory
+            ))
+        with tracking, result:
+            strategy.combine(args.file_1, args.file_2, args.mem_limit,
+                             args.op, reader=reader, budget=budget,
+                             result=result)
+        cardinality = result.cardinality
     end = time.time()
-    print(res.cardinality)
+    print(cardinality)
     print(f'Operation completed in {end - start} seconds')
 
+    if args.workers == 1:
+        print(f'Reserved at most {budget.peak_reserved} bytes')
+    if budget.measured_peak is not None:
+        print(f'Measured a peak of {budget.measured_peak} bytes')
+
+    if args.mmap:
+        print(
+            f'Touched {reader.touched_bytes} mapped bytes, at most '
+            f'{reader.peak_resident_bytes} bytes resident at once'
+        )
+
 
 if __name__ == '__main__':
     main()
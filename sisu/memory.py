@@ -0,0 +1,182 @@
+import contextlib
+import os
+import resource
+import sys
+import tracemalloc
+
+
+class MemoryLimitExceeded(MemoryError):
+    """Raised by a strict MemoryBudget when the memory limit is exceeded."""
+
+
+def current_rss():
+    """Returns the resident set size of this process in bytes.
+
+    Returns
+    ------
+    int
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def peak_rss():
+    """Returns the peak resident set size of this process in bytes.
+
+    Returns
+    ------
+    int
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+
+class MemoryBudget():
+    """A MemoryBudget hands out the memory limit of a strategy. Every buffer,
+    hash table and bloom filter a strategy allocates reserves its size under
+    a name. Reserving a name again resizes its reservation.
+
+    The peak of real allocations can be measured with `track`. A strict
+    budget raises MemoryLimitExceeded when reservations or the measured peak
+    exceed the limit, a lenient one only records them.
+    """
+
+    def __init__(self, limit, strict=False):
+        """
+        Attributes
+        ---------
+        limit : float
+            The memory limit in bytes
+        strict : bool
+            Raise when the limit is exceeded
+        peak_reserved : int
+            The largest amount of bytes reserved at once
+        measured_peak : int
+            Peak of python allocations in bytes during `track`
+        rss_peak : int
+            Growth in bytes of the peak resident set size during `track`
+        _reservations : dict of str to int
+            Bytes reserved by name
+        """
+        self.limit = limit
+        self.strict = strict
+        self.peak_reserved = 0
+        self.measured_peak = None
+        self.rss_peak = None
+        self._reservations = {}
+
+    @property
+    def reserved(self):
+        """Returns the amount of bytes reserved.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return sum(self._reservations.values())
+
+    @property
+    def available(self):
+        """Returns the amount of bytes which are not reserved.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return max(int(self.limit - self.reserved), 0)
+
+    def reservation(self, name):
+        """Returns the amount of bytes reserved under `name`.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return self._reservations.get(name, 0)
+
+    def reserve(self, name, nbytes):
+        """Reserves `nbytes` bytes under `name`, replacing any earlier
+        reservation of `name`.
+
+        Parameters
+        ----------
+        name : str
+        nbytes : int
+
+        Returns
+        ------
+        nbytes : int
+        """
+        nbytes = int(nbytes)
+        reserved = self.reserved - self.reservation(name) + nbytes
+
+        if self.strict and reserved > self.limit:
+            raise MemoryLimitExceeded(
+                f'Reserving {nbytes} bytes for {name} exceeds the memory '
+                f'limit of {int(self.limit)} bytes.'
+            )
+
+        self._reservations[name] = nbytes
+        self.peak_reserved = max(self.peak_reserved, reserved)
+        return nbytes
+
+    def release(self, name):
+        """Gives back the memory reserved under `name`.
+
+        Parameters
+        ----------
+        name : str
+        """
+        self._reservations.pop(name, None)
+
+    @contextlib.contextmanager
+    def track(self):
+        """Measures the peak of python allocations and of the resident set
+        size while the context is active, then calls `check`.
+
+        Python allocations are traced with tracemalloc, which slows down
+        allocation heavy code. The resident set size also counts the
+        interpreter and allocator overhead and can only grow, so it is
+        reported but not enforced.
+
+        Yields
+        ------
+        MemoryBudget
+        """
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        baseline = tracemalloc.get_traced_memory()[0]
+        rss_baseline = current_rss()
+
+        try:
+            yield self
+        finally:
+            self.measured_peak = max(
+                tracemalloc.get_traced_memory()[1] - baseline, 0
+            )
+            self.rss_peak = max(peak_rss() - rss_baseline, 0)
+            if started:
+                tracemalloc.stop()
+
+        self.check()
+
+    def check(self):
+        """Raises MemoryLimitExceeded if the budget is strict and the
+        measured peak exceeds the limit.
+        """
+        if self.strict and self.measured_peak is not None and \
+                self.measured_peak > self.limit:
+            raise MemoryLimitExceeded(
+                f'Measured a peak of {self.measured_peak} bytes which '
+                f'exceeds the memory limit of {int(self.limit)} bytes.'
+            )
@@ -1,29 +1,334 @@
+import math
 import os
 
+from sisu.bloom import BloomFilter
+from sisu.spillable_hash import SpillableHash
+import sisu.calibrate as calibrate
 import sisu.constants as c
+import sisu.estimate as estimate
+import sisu.profiles as profiles
 import sisu.strategy as s
 import sisu.utils as utils
 
 DEFAULT_CONFIG = {
-    # what constitutes a 'small file'?
-    'small_file': 10 * c.MEGABYTE,
-    # what constitutes a 'large file'?
-    'large_file': 100 * c.MEGABYTE,
-    # what is a signifacant ratio between the smaller file
-    # and the memory limit?
-    'file_to_mem': 2,
-    # what is a signifacant ratio between the larger file
-    # and the smaller file?
-    'file_to_file': 5
+    # how many values are in both files is estimated from samples of the
+    # files, see `estimate.estimate_overlap`. Lookups of those values are the
+    # ones a bloom filter cannot keep from going to disk, so if the samples
+    # are too small to tell, assume this fraction of the smaller file is in
+    # both.
+    'expected_overlap': 1/2,
+}
+
+
+class Cost():
+    """A Cost is the predicted run time of a strategy on a pair of files,
+    broken down into the steps the strategy takes.
+    """
+
+    def __init__(self, strategy, steps):
+        """
+        Attributes
+        ---------
+        strategy : Strategy
+        steps : dict of str to float
+            Predicted seconds of every step
+        """
+        self.strategy = strategy
+        self.steps = steps
+
+    @property
+    def seconds(self):
+        """Returns the predicted run time in seconds.
+
+        Returns
+        ------
+        float
+        """
+        return sum(self.steps.values())
+
+    def __str__(self):
+        steps = ', '.join(
+            f'{step} {seconds:.3g}s' for step, seconds in self.steps.items()
+        )
+        return f'{self.strategy.__name__}: {self.seconds:.3g}s ({steps})'
+
+
+def _read_cost(file_, lines, reader, machine):
+    """Returns the seconds it takes `reader` to read the numbers of `file_`.
+    Packed files only have to be read, text files parsed as well.
+    """
+    if isinstance(reader, utils.PackedReader):
+        return os.path.getsize(file_) / machine['read_rate']
+    return lines / machine['parse_rate']
+
+
+def hash_cost(file1, file2, mem_limit, lines1, lines2, shared, reader,
+              machine, result_memory, config):
+    """Predicts the cost of `strategy.Hash`. The values of file1 which do not
+    fit in the build hash spill. Probing for a spilled value, or for an
+    absent value which passes the bloom filter, scans a spill bucket file.
+
+    Returns
+    ------
+    Cost
+    """
+    build_memory, bloom_memory, _, _ = s.Hash.determine_memory(
+        file1, file2, mem_limit, reader=reader, result_memory=result_memory
+    )
+    capacity = SpillableHash.capacity_for(build_memory)
+    spilled = max(lines1 - capacity, 0)
+
+    steps = {
+        'read': _read_cost(file1, lines1, reader, machine) +
+        _read_cost(file2, lines2, reader, machine),
+        'hash': (lines1 + lines2) / machine['hash_rate'],
+    }
+    if bloom_memory:
+        steps['bloom'] = (lines1 + lines2) / machine['bloom_rate']
+
+    if spilled:
+        if bloom_memory:
+            false_positive_rate = BloomFilter.false_positive_rate_for(
+                lines1, bloom_memory
+            )
+        else:
+            # the filter created on the first spill covers the spilled values
+            false_positive_rate = BloomFilter.false_positive_rate_for(
+                spilled, BloomFilter.memory_for(capacity)
+            )
+            steps['bloom'] = lines2 / machine['bloom_rate']
+
+        lookups = shared * spilled / lines1 + \
+            (lines2 - shared) * false_positive_rate
+        bucket_bytes = spilled * c.SIZE_UINT64 / c.SPILL_PARTITIONS
+
+        steps['spill'] = spilled * c.SIZE_UINT64 / machine['write_rate']
+        steps['disk_lookups'] = lookups * (
+            machine['lookup_time'] + bucket_bytes / machine['read_rate']
+        )
+
+    return Cost(s.Hash, steps)
+
+
+def grace_hash_cost(file1, file2, mem_limit, lines1, lines2, shared, reader,
+                    machine, result_memory, config):
+    """Predicts the cost of `strategy.GraceHash`. Every partitioning pass
+    writes both files to partition files and reads them back. Partitions
+    whose build table does not fit are partitioned again.
+
+    Returns
+    ------
+    Cost
+    """
+    grace_config = profiles.config_for(s.GraceHash, file1, mem_limit)
+    n_partitions, _, build_memory, _ = s.GraceHash.determine_memory(
+        file1, file2, mem_limit, reader=reader, result_memory=result_memory
+    )
+    capacity = max(SpillableHash.capacity_for(build_memory), 1)
+
+    passes = 1
+    partition_lines = lines1 / n_partitions
+    while partition_lines > capacity and passes <= grace_config['max_depth']:
+        partition_lines /= min(
+            s.GraceHash.partitions_needed(partition_lines, capacity),
+            grace_config['max_partitions']
+        )
+        passes += 1
+
+    values = lines1 + lines2
+    return Cost(s.GraceHash, {
+        'read': _read_cost(file1, lines1, reader, machine) +
+        _read_cost(file2, lines2, reader, machine),
+        'partition': passes * values / machine['partition_rate'],
+        'read_partitions': passes * values * c.SIZE_UINT64 /
+        machine['read_rate'],
+        'hash': values / machine['hash_rate'],
+    })
+
+
+def merge_cost(file1, file2, mem_limit, lines1, lines2, shared, reader,
+               machine, result_memory, config):
+    """Predicts the cost of `strategy.Merge`. Sorting a run costs log2 of its
+    length per value, merging the runs of a file log2 of their amount, or
+    only a gallop per run past the values between those of a much smaller
+    file. A delta encoded run takes about as many bytes per value as the
+    gap between the values of a run of the sampled range.
+
+    Returns
+    ------
+    Cost
+    """
+    merge_config = profiles.config_for(s.Merge, file1, mem_limit)
+    delta = merge_config['delta_runs']
+    run_memory, _, _, _ = s.Merge.determine_memory(
+        file1, file2, mem_limit, reader=reader, result_memory=result_memory
+    )
+    read_memory = run_memory * s.Merge.RUN_READ_MEMORY
+    run_size = max(int((run_memory - read_memory) // c.SORT_ELEMENT_SIZE), 1)
+
+    sort = merge = run_bytes = 0
+    for file_, lines, other in ((file1, lines1, lines2),
+                                (file2, lines2, lines1)):
+        runs = max(math.ceil(lines / run_size), 1)
+        sort += lines * math.log2(max(min(run_size, lines), 2)) / \
+            math.log2(calibrate.SORT_RUN)
+        # a stream skips to every value of a much smaller one, its runs
+        # gallop past the values in between
+        merge += min(
+            lines * max(math.log2(runs), 1),
+            other * runs * math.log2(max(lines / max(other, 1), 2))
+        )
+
+        width = c.SIZE_UINT64
+        stats = reader.stats(file_)
+        if delta and stats.low is not None:
+            gap = (stats.high - stats.low) // max(min(run_size, lines), 1)
+            width = min(max(-(-gap.bit_length() // 8), 1), c.SIZE_UINT64)
+        run_bytes += lines * width
+
+    values = lines1 + lines2
+    steps = {
+        'read': _read_cost(file1, lines1, reader, machine) +
+        _read_cost(file2, lines2, reader, machine),
+        'sort': sort / machine['sort_rate'],
+        'write_runs': run_bytes / machine['write_rate'],
+        'merge': merge / machine['merge_rate'],
+    }
+    if delta:
+        steps['delta'] = values / machine['delta_rate']
+    return Cost(s.Merge, steps)
+
+
+def radix_cost(file1, file2, mem_limit, lines1, lines2, shared, reader,
+               machine, result_memory, config):
+    """Predicts the cost of `strategy.Radix`. Both files are range
+    partitioned once and read back, and every partition pair is intersected
+    with a set. Partitions are assumed to be even, those whose set does not
+    fit are partitioned again like in `grace_hash_cost`.
+
+    Returns
+    ------
+    Cost
+    """
+    radix_config = profiles.config_for(s.Radix, file1, mem_limit)
+    n_partitions, _, join_memory, _ = s.Radix.determine_memory(
+        file1, file2, mem_limit, reader=reader, result_memory=result_memory
+    )
+    capacity = max(join_memory / c.SET_ELEMENT_SIZE, 1)
+
+    passes = 1
+    partition_lines = lines1 / n_partitions
+    while partition_lines > capacity:
+        partition_lines /= min(
+            s.GraceHash.partitions_needed(partition_lines, capacity),
+            radix_config['max_partitions']
+        )
+        passes += 1
+
+    values = lines1 + lines2
+    return Cost(s.Radix, {
+        'read': _read_cost(file1, lines1, reader, machine) +
+        _read_cost(file2, lines2, reader, machine),
+        'partition': passes * values / machine['radix_rate'],
+        'read_partitions': passes * values * c.SIZE_UINT64 /
+        machine['read_rate'],
+        'join': values / machine['set_rate'],
+    })
+
+
+def bitmap_cost(file1, file2, mem_limit, lines1, lines2, shared, reader,
+                machine, result_memory, config):
+    """Predicts the cost of `strategy.Bitmap`. Every window of the range of
+    file1 reads both files and checks every value against the chunks of the
+    window. The values in both files are decoded from the chunks. A range
+    which is too sparse for a bitmap takes infinitely many windows.
+
+    Returns
+    ------
+    Cost
+    """
+    n_windows, _, _, _ = s.Bitmap.determine_memory(
+        file1, file2, mem_limit, reader=reader, result_memory=result_memory
+    )
+
+    return Cost(s.Bitmap, {
+        'read': n_windows * (_read_cost(file1, lines1, reader, machine) +
+                             _read_cost(file2, lines2, reader, machine)),
+        'bitmap': n_windows * (lines1 + lines2) / machine['bitmap_rate'],
+        'decode': shared / machine['bitmap_decode_rate'],
+    })
+
+
+# the strategies the optimizer picks from. `Naive` does not respect the
+# memory limit, so it is never picked, and `Approximate` is not exact.
+COST_MODELS = {
+    s.Hash: hash_cost,
+    s.GraceHash: grace_hash_cost,
+    s.Merge: merge_cost,
+    s.Radix: radix_cost,
+    s.Bitmap: bitmap_cost,
 }
 
 
 @utils.reorder_by_file_size
-def optimal_strategy(file1, file2, mem_limit, **config):
-    """Given the inputs try to determine which strategy
-    between merging and hashing is most efficient.
+def estimate_costs(file1, file2, mem_limit, reader=None, machine=None,
+                   result_memory=None, **config):
+    """Predicts the cost of every strategy from the sizes of the files, the
+    estimated amount of numbers in them and in both of them, the memory limit
+    and the machine constants measured by `calibrate`.
+
+    Parameters
+    ----------
+    file1 : str
+        the path to the first file
+    file2 : str
+        the path to the second file
+    mem_limit : float
+        The memory limit in bytes
+    reader : FileReader, optional
+        reads blocks of numbers from the files
+    machine : dict of str to float, optional
+        See `calibrate.DEFAULT_MACHINE`. The saved constants, if any, are
+        used if None
+    result_memory : int, optional
+        The memory of a result which is not a SpillableHash, if there is one
+
+    config
+        custom kwargs of the cost models
+
+    Returns
+    ------
+    list of Cost
+        Cheapest first
+    """
+    if not config:
+        config = DEFAULT_CONFIG
+    reader = reader or utils.FileReader()
+    machine = machine or calibrate.load_machine()
+
+    stats1 = reader.stats(file1)
+    stats2 = reader.stats(file2)
+    lines1 = max(stats1.lines, 1)
+    lines2 = max(stats2.lines, 1)
+
+    shared = estimate.estimate_overlap(stats1, stats2)
+    if shared is None:
+        shared = min(lines1, lines2) * config['expected_overlap']
 
-    For more details on why these values were chosen
+    costs = [
+        cost_model(file1, file2, mem_limit, lines1, lines2, shared, reader,
+                   machine, result_memory, config)
+        for cost_model in COST_MODELS.values()
+    ]
+    return sorted(costs, key=lambda cost: cost.seconds)
+
+
+def optimal_strategy(file1, file2, mem_limit, op='intersect', **kwargs):
+    """Given the inputs determines which strategy of `COST_MODELS`, be it
+    hashing, grace hashing, merging, radix partitioning or bitmaps, is
+    predicted to be the fastest, see `estimate_costs`.
+
+    For more details on how the strategies spend their time
     go to strategy.py and read the docs there.
 
     Parameters
@@ -34,37 +339,74 @@ def optimal_strategy(file1, file2, mem_limit, **config):
         the path to the second file
     mem_limit : float
         The memory limit in bytes
+    op : str, optional
+        The set operation, see `Strategy.combine`. Only the strategies which
+        run it are picked from. The other operations read, hash and sort the
+        same files as an intersection, so they are priced like one.
 
-   config
-        custom kwargs that can be different for each strategy
+    kwargs
+        see `estimate_costs`
 
     Returns
     ------
     implementation of Strategy
     """
+    costs = estimate_costs(file1, file2, mem_limit, **kwargs)
+    return next(cost.strategy for cost in costs
+                if op in cost.strategy.operations)
 
-    if not config:
-        config = DEFAULT_CONFIG
 
-    file1_size = os.path.getsize(file1)
-    file2_size = os.path.getsize(file2)
+def optimal_strategy_many(files, mem_limit, **kwargs):
+    """Given more than two files determines which strategy with a plan of
+    its own for many files, see `Strategy.multiway`, is predicted to be the
+    fastest for the two smallest of them. Every later file only narrows
+    down their intersection.
+
+    Parameters
+    ----------
+    files : list of str
+        the paths to the files
+    mem_limit : float
+        The memory limit in bytes
+
+    kwargs
+        see `estimate_costs`
 
-    file_to_mem_ratio = file1_size / mem_limit
-    file_to_file_ratio = file2_size / file1_size
+    Returns
+    ------
+    implementation of Strategy
+    """
+    file1, file2 = utils.order_by_file_size(files)[:2]
+    costs = estimate_costs(file1, file2, mem_limit, **kwargs)
+    return next(cost.strategy for cost in costs if cost.strategy.multiway)
 
-    # both files are relatively small and you have an acceptable amount of
-    # memory relative to your smaller file
 
-    if file1_size <= config['small_file'] and \
-            file2_size <= config['small_file'] \
-            and file_to_mem_ratio <= config['file_to_file']:
-        return s.Hash
+def explain(file1, file2, mem_limit, multiway=False, op='intersect',
+            **kwargs):
+    """Explains which strategy `optimal_strategy` picks and why.
 
-    # one file is much larger than the other and you have enough
-    # memory for a hash table
+    Parameters
+    ----------
+    file1 : str
+    file2 : str
+    mem_limit : float
+        The memory limit in bytes
+    multiway : bool, optional
+        Only explain the strategies `optimal_strategy_many` picks from
+    op : str, optional
+        Only explain the strategies which run this set operation
 
-    if file_to_file_ratio >= config['file_to_file'] and \
-            file_to_mem_ratio <= config['file_to_mem']:
-        return s.Hash
+    kwargs
+        see `estimate_costs`
 
-    return s.Merge
+    Returns
+    ------
+    str
+    """
+    costs = estimate_costs(file1, file2, mem_limit, **kwargs)
+    if multiway:
+        costs = [cost for cost in costs if cost.strategy.multiway]
+    costs = [cost for cost in costs if op in cost.strategy.operations]
+    lines = [f'Picked {costs[0].strategy.__name__}, the predicted fastest of']
+    lines.extend(f'  {cost}' for cost in costs)
+    return '\n'.join(lines)
@@ -0,0 +1,256 @@
+from array import array
+from itertools import accumulate, islice
+import operator
+import os
+import struct
+import sys
+
+import sisu.constants as c
+
+# every intermediate file is little endian whatever the byte order of the
+# machine, so the files of one machine can be read on another
+_SWAP = sys.byteorder != 'little'
+
+# a frame of a delta encoded file starts with its smallest and largest value,
+# the amount of values in it and the width of its deltas in bytes
+_FRAME_HEADER = struct.Struct('<QQIB')
+
+
+def _to_disk(values):
+    """Returns `values` as an array of uint64 in the byte order of the
+    files. `values` itself is returned when it already is.
+    """
+    if not isinstance(values, array) or values.typecode != 'Q' or _SWAP:
+        values = array('Q', values)
+        if _SWAP:
+            values.byteswap()
+    return values
+
+
+def pack(number):
+    """Returns the bytes of `number` as stored in a packed file.
+
+    Parameters
+    ----------
+    number : int
+
+    Returns
+    ------
+    bytes
+    """
+    return number.to_bytes(c.SIZE_UINT64, 'little')
+
+
+def write_packed(outfile, values):
+    """Writes `values` to `outfile` as fixed width little endian uint64s.
+
+    Parameters
+    ----------
+    outfile : file object
+        Opened in binary mode
+    values : iterable of int
+    """
+    _to_disk(values).tofile(outfile)
+
+
+def read_into(infile, values):
+    """Fills `values` with the packed uint64s read from `infile`, see
+    `write_packed`. The array is read into rather than copied, so a large
+    one only takes its own memory.
+
+    Parameters
+    ----------
+    infile : file object
+        Opened in binary mode
+    values : array of uint64
+        Filled in place
+
+    Returns
+    ------
+    int
+        The amount of values read
+    """
+    view = memoryview(values).cast('B')
+    size = 0
+    while size < len(view):
+        read = infile.readinto(view[size:])
+        if not read:
+            break
+        size += read
+    view.release()
+    if _SWAP:
+        values.byteswap()
+    return size // c.SIZE_UINT64
+
+
+def read_packed(path, block_size, start=0, end=None):
+    """Reads a file of packed uint64s `block_size` values at a time.
+
+    Parameters
+    ----------
+    path : str
+    block_size : int
+        Number of values to fetch at a time
+    start : int, optional
+        Offset in bytes to start reading at, a multiple of the value width
+    end : int, optional
+        Offset in bytes to stop reading at. Reads to the end of the file if
+        None
+
+    Yields
+    ------
+    array of uint64
+    """
+    block_size = max(int(block_size), 1)
+    remaining = float('inf') if end is None else \
+        (end - start) // c.SIZE_UINT64
+    # unbuffered and read straight into the block since values are read in
+    # blocks anyway and many files may be open at once while merging
+    with open(path, 'rb', buffering=0) as infile:
+        infile.seek(start)
+        while remaining > 0:
+            block = array('Q', (0,)) * int(min(block_size, remaining))
+            read = read_into(infile, block)
+            if read < len(block):
+                del block[read:]
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def encode_deltas(values):
+    """Encodes ascending `values` as their first value and the differences
+    between consecutive values, each stored in as few bytes as the largest
+    difference takes.
+
+    Every difference of a frame has the same width, so the low bytes of the
+    differences are picked out with a slice per byte rather than a value at
+    a time like a varint.
+
+    Parameters
+    ----------
+    values : array of uint64
+        At least one value, in ascending order
+
+    Returns
+    ------
+    bytes
+        A frame header and the differences, see `decode_deltas`
+    """
+    deltas = array('Q', map(operator.sub, islice(values, 1, None), values))
+    width = (max(deltas, default=0).bit_length() + 7) // 8
+    raw = _to_disk(deltas).tobytes()
+    data = bytearray(len(deltas) * width)
+    for byte in range(width):
+        data[byte::width] = raw[byte::c.SIZE_UINT64]
+    return _FRAME_HEADER.pack(values[0], values[-1], len(values), width) + \
+        data
+
+
+def decode_deltas(data):
+    """Decodes a frame of `encode_deltas`.
+
+    Parameters
+    ----------
+    data : bytes
+        The frame header and the differences
+
+    Returns
+    ------
+    array of uint64
+    """
+    low, _, count, width = _FRAME_HEADER.unpack_from(data)
+    start = _FRAME_HEADER.size
+    raw = bytearray((count - 1) * c.SIZE_UINT64)
+    for byte in range(width):
+        raw[byte::c.SIZE_UINT64] = data[start + byte:
+                                        start + (count - 1) * width:width]
+    deltas = array('Q')
+    deltas.frombytes(raw)
+    if _SWAP:
+        deltas.byteswap()
+    return array('Q', accumulate(deltas, initial=low))
+
+
+def write_deltas(outfile, values, frame_size=c.DELTA_FRAME_SIZE):
+    """Writes ascending `values` to `outfile` as frames of `frame_size`
+    delta encoded values, see `encode_deltas`.
+
+    Parameters
+    ----------
+    outfile : file object
+        Opened in binary mode
+    values : array of uint64
+        In ascending order
+    frame_size : int, optional
+    """
+    frame_size = max(int(frame_size), 1)
+    for pos in range(0, len(values), frame_size):
+        outfile.write(encode_deltas(values[pos:pos + frame_size]))
+
+
+def read_deltas(path, block_size, start=0):
+    """Reads a file of `write_deltas` about `block_size` values at a time.
+    Frames are never split, so a block holds at least a frame.
+
+    Sending a value to the generator skips ahead to it: frames whose header
+    says all of their values are smaller are passed over without decoding,
+    or reading them if they are not buffered yet. The block returned is the
+    first frame with a value which is not smaller.
+
+    Parameters
+    ----------
+    path : str
+    block_size : int
+        Number of values to fetch at a time, also the number of bytes read
+        at a time in multiples of the value width
+    start : int, optional
+        Offset in bytes of the first frame
+
+    Yields
+    ------
+    array of uint64
+    """
+    block_size = max(int(block_size), 1)
+    chunk_size = block_size * c.SIZE_UINT64
+    header_size = _FRAME_HEADER.size
+    data, pos = b'', 0
+    block = array('Q')
+    low = None
+
+    # unbuffered since `data` is the buffer and many runs are read at once
+    with open(path, 'rb', buffering=0) as infile:
+        infile.seek(start)
+
+        def fill(size):
+            nonlocal data, pos
+            if len(data) - pos < size:
+                data = data[pos:] + infile.read(
+                    max(size, chunk_size) - len(data) + pos
+                )
+                pos = 0
+            return len(data) - pos >= size
+
+        while fill(header_size):
+            _, high, count, width = _FRAME_HEADER.unpack_from(data, pos)
+            size = header_size + (count - 1) * width
+            if low is not None and high < low:
+                skip = size - (len(data) - pos)
+                if skip > 0:
+                    infile.seek(skip, os.SEEK_CUR)
+                    data, pos = b'', 0
+                else:
+                    pos += size
+                continue
+
+            fill(size)
+            block.extend(decode_deltas(data[pos:pos + size]))
+            pos += size
+            # after skipping, only the frame skipped to is decoded since the
+            # next value sent may skip past the frames after it too
+            if len(block) >= block_size or low is not None:
+                low = yield block
+                block = array('Q')
+    if block:
+        yield block
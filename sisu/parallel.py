@@ -0,0 +1,224 @@
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import os
+import shutil
+import tempfile
+
+from sisu.memory import MemoryBudget
+from sisu.partition import PartitionedStore
+from sisu.result import Counter, StreamingResult
+import sisu.constants as c
+import sisu.optimize as optimize
+import sisu.utils as utils
+
+# partitions are hashed with a level no strategy partitions with, so a
+# strategy which hash partitions a partition again is not skewed by it
+PARTITION_LEVEL = 16
+
+
+def partitions_for(workers):
+    """Returns the amount of partitions to split the files into for
+    `workers` worker processes. Every worker gets several partition pairs so
+    a slow pair does not keep the other workers idle.
+
+    Parameters
+    ----------
+    workers : int
+
+    Returns
+    ------
+    int
+        A power of two
+    """
+    needed = max(workers * c.PARTITIONS_PER_WORKER, 1)
+    return 1 << (needed - 1).bit_length()
+
+
+def _partition_range(file_, start, end, prefix, n_partitions, mem_limit,
+                     reader, strict, dir_):
+    """Hash partitions the lines in [`start`, `end`) of `file_` into packed
+    partition files in `dir_`. Runs on a worker process.
+
+    Half of `mem_limit` goes to reading and parsing, the other half to the
+    write buffers of the partitions.
+
+    Returns
+    ------
+    list of str
+        Path of the partition file of every partition
+    FileReader
+        The reader, to add its counters to the reader of the parent
+    """
+    budget = MemoryBudget(mem_limit, strict=strict)
+    read_memory = budget.reserve('read_buffer', mem_limit // 2)
+    buffer_memory = mem_limit - read_memory
+
+    store = PartitionedStore(
+        n_partitions, buffer_memory // (n_partitions * c.SIZE_UINT64),
+        level=PARTITION_LEVEL, dir_=dir_
+    )
+    store.resize_buffers(buffer_memory)
+    budget.reserve('partition_buffers', store.buffer_memory)
+
+    tracking = budget.track() if strict else contextlib.nullcontext()
+    with tracking:
+        for block in reader.blocks(file_, read_memory // c.PARSE_OVERHEAD,
+                                   start, end):
+            store.add_many(block)
+        store.close()
+
+    # the store's directory is removed with the store, so its files are
+    # moved out of it first
+    paths = []
+    for idx in range(n_partitions):
+        path = os.path.join(dir_, f'{prefix}-{idx}')
+        if store.counts[idx]:
+            os.rename(store.path(idx), path)
+        else:
+            open(path, 'wb').close()
+        paths.append(path)
+    store.cleanup()
+
+    return paths, reader
+
+
+def _concatenate(paths, output):
+    """Concatenates the files at `paths` into `output` and removes them.
+
+    Returns
+    ------
+    str
+        `output`
+    """
+    with open(output, 'wb') as outfile:
+        for path in paths:
+            with open(path, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile)
+            os.remove(path)
+    return output
+
+
+def _intersect_partition(paths1, paths2, prefix, mem_limit, strategy,
+                         strict, stream, config):
+    """Intersects one partition pair. The pieces of a partition written by
+    different workers are concatenated first. Runs on a worker process.
+
+    Intersecting values are only counted, or also written to a file next to
+    the partition files if `stream` is set.
+
+    Returns
+    ------
+    int
+        The amount of intersecting values
+    str U None
+        Path of the file of intersecting values
+    """
+    file1 = _concatenate(paths1, f'{prefix}-1')
+    file2 = _concatenate(paths2, f'{prefix}-2')
+    output = f'{prefix}-out' if stream else None
+
+    try:
+        with StreamingResult(output) if stream else Counter() as result:
+            if not os.path.getsize(file1) or not os.path.getsize(file2):
+                return 0, output
+
+            reader = utils.PackedReader()
+            strategy = strategy or optimize.optimal_strategy(
+                file1, file2, mem_limit, reader=reader,
+                result_memory=result.memory
+            )
+            budget = MemoryBudget(mem_limit, strict=strict)
+            tracking = budget.track() if strict else contextlib.nullcontext()
+            with tracking:
+                strategy.intersect(file1, file2, mem_limit, reader=reader,
+                                   budget=budget, result=result, **config)
+        return result.cardinality, output
+    finally:
+        os.remove(file1)
+        os.remove(file2)
+
+
+def intersect(file1, file2, mem_limit, workers, strategy=None, reader=None,
+              strict=False, output=None, **config):
+    """Counts the values both files have in common on `workers` worker
+    processes.
+
+    Both files are split into line ranges which the workers hash partition
+    into packed partition files. Each worker then intersects partition pairs
+    with `strategy`, or the optimal strategy for the pair if None, and the
+    counts of every pair are summed up. Equal values always land in the
+    same partition pair, so no value is counted twice.
+
+    Intersecting values are never held in memory. They are only counted, or
+    streamed to `output` when it is given.
+
+    Every worker gets an equal share of `mem_limit`. The memory of the
+    interpreters themselves is not part of it.
+
+    Parameters
+    ----------
+    file1 : str
+    file2 : str
+    mem_limit : float
+        The memory limit in bytes, shared by all workers
+    workers : int
+        The amount of worker processes
+    strategy : Strategy, optional
+        Intersects a partition pair
+    reader : FileReader, optional
+        reads blocks of numbers from the files
+    strict : bool, optional
+        Raise MemoryLimitExceeded if a worker exceeds its share
+    output : str, optional
+        Path to write the intersecting values to
+    config
+        custom kwargs of `strategy`
+
+    Returns
+    ------
+    int
+        The amount of intersecting values
+    """
+    reader = reader or utils.FileReader()
+    worker_memory = int(mem_limit // workers)
+    n_partitions = partitions_for(workers)
+
+    with tempfile.TemporaryDirectory() as dir_, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+
+        partitioned = {}
+        for side, file_ in ((1, file1), (2, file2)):
+            partitioned[side] = [
+                pool.submit(
+                    _partition_range, file_, start, end,
+                    f'{side}-{range_idx}', n_partitions, worker_memory,
+                    type(reader)(), strict, dir_
+                )
+                for range_idx, (start, end) in enumerate(
+                    utils.line_ranges(file_, workers)
+                )
+            ]
+
+        paths = {}
+        for side, futures in partitioned.items():
+            paths[side] = []
+            for future in futures:
+                range_paths, range_reader = future.result()
+                paths[side].append(range_paths)
+                reader.update(range_reader)
+
+        results = [
+            pool.submit(
+                _intersect_partition,
+                [range_paths[idx] for range_paths in paths[1]],
+                [range_paths[idx] for range_paths in paths[2]],
+                os.path.join(dir_, f'partition-{idx}'),
+                worker_memory, strategy, strict, output is not None, config
+            )
+            for idx in range(n_partitions)
+        ]
+        counts, outputs = zip(*(result.result() for result in results))
+
+        if output is not None:
+            _concatenate(outputs, output)
+        return sum(counts)
@@ -0,0 +1,526 @@
+import heapq
+import os
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+
+from sisu.packed import pack, read_packed, write_packed
+import sisu.constants as c
+import sisu.external_sort as external_sort
+
+# IDs are not guaranteed to be uniformly distributed (see the `small-diff`
+# test data) so values are run through the splitmix64 finalizer before their
+# top bits are used to pick a partition.
+_GOLDEN = 0x9E3779B97F4A7C15
+_MIX1 = 0xBF58476D1CE4E5B9
+_MIX2 = 0x94D049BB133111EB
+_MASK64 = (1 << 64) - 1
+
+
+def mix64(number, seed=0):
+    """Scrambles the bits of a 64 bit int. Different seeds give
+    independent hash functions.
+
+    Parameters
+    ----------
+    number : int
+    seed : int, optional
+
+    Returns
+    ------
+    int
+    """
+    x = (number + (seed + 1) * _GOLDEN) & _MASK64
+    x = ((x ^ (x >> 30)) * _MIX1) & _MASK64
+    x = ((x ^ (x >> 27)) * _MIX2) & _MASK64
+    return x ^ (x >> 31)
+
+
+def partition_bits(n_partitions):
+    """Returns the number of bits needed to address `n_partitions`.
+
+    Parameters
+    ----------
+    n_partitions : int
+        Must be a power of two
+
+    Returns
+    ------
+    int
+    """
+    if n_partitions < 1 or n_partitions & (n_partitions - 1):
+        raise ValueError('Number of partitions must be a power of two')
+    return n_partitions.bit_length() - 1
+
+
+def partition_of(number, bits, level=0):
+    """Hashes `number` into one of 2^`bits` partitions.
+
+    Different `level`s produce independent partitionings so a partition can
+    be split again when it is still too large.
+
+    Parameters
+    ----------
+    number : int
+    bits : int
+        log2 of the number of partitions
+    level : int, optional
+        recursion depth of the partitioning
+
+    Returns
+    ------
+    int
+    """
+    if not bits:
+        return 0
+    return mix64(number, level) >> (64 - bits)
+
+
+def range_shift(width, n_partitions):
+    """Returns the smallest shift s.t. `n_partitions` ranges of 2^shift
+    values cover a range of `width` values.
+
+    Parameters
+    ----------
+    width : int
+    n_partitions : int
+        Must be a power of two
+
+    Returns
+    ------
+    int
+    """
+    return max((max(width, 1) - 1).bit_length() - partition_bits(n_partitions),
+               0)
+
+
+class PartitionedStore():
+    """A PartitionedStore is an append-only collection of uint64s which are
+    hash partitioned into a fixed number of binary bucket files. Every bucket
+    has a small in-memory write buffer, so writing to disk costs one
+    sequential write per buffer flush instead of one write per element.
+    """
+
+    def __init__(self, n_partitions=c.SPILL_PARTITIONS,
+                 buffer_size=c.SPILL_BUFFER_SIZE, level=0, dir_=None):
+        """
+        Attributes
+        ---------
+        cardinality : int
+            The amount of elements in the store
+        n_partitions : int
+            The amount of bucket files, a power of two
+        buffer_size : int
+            The amount of elements buffered per bucket before writing
+        level : int
+            Which hash function to partition with, see `partition_of`
+        dir : TemporaryDirectory
+            Output dir for the bucket files
+        counts : list of int
+            The amount of elements in each bucket
+        scan_size : int
+            The amount of elements read at a time by `contains` and
+            `contains_many`
+        """
+        self.cardinality = 0
+        self.n_partitions = n_partitions
+        self.buffer_size = max(int(buffer_size), 1)
+        self.level = level
+        self.dir = tempfile.TemporaryDirectory(dir=dir_)
+        self.counts = [0] * n_partitions
+        self.scan_size = c.SPILL_SCAN_SIZE
+        self._bits = partition_bits(n_partitions)
+        self._buffers = [array('Q') for _ in range(n_partitions)]
+        # how many values of each bucket file were sorted, see
+        # `_sort_bucket`, and the first value of each of their frames
+        self._sorted = [0] * n_partitions
+        self._fences = [array('Q') for _ in range(n_partitions)]
+
+    @property
+    def buffer_memory(self):
+        """Returns the upper bound in bytes of the write buffers and of the
+        chunk `contains` and `contains_many` read.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return (self.n_partitions * self.buffer_size + self.scan_size) * \
+            c.SIZE_UINT64
+
+    def resize_buffers(self, memory):
+        """Shrinks the write buffers and the scan chunk so they take at most
+        `memory` bytes, or a single element each.
+
+        Parameters
+        ----------
+        memory : int (in bytes)
+        """
+        elements = int(memory // c.SIZE_UINT64)
+        self.buffer_size = max(min(
+            self.buffer_size, elements // (2 * self.n_partitions)
+        ), 1)
+        self.scan_size = max(min(
+            self.scan_size, elements - self.n_partitions * self.buffer_size
+        ), 1)
+        # the frames of the sorted buckets no longer match the scan chunk
+        self._sorted = [0] * self.n_partitions
+
+    @property
+    def _frame_size(self):
+        """The amount of values a sorted bucket file is searched by, see
+        `contains_many`.
+
+        Returns
+        ------
+        int
+        """
+        return max(self.scan_size // 2, 1)
+
+    def path(self, idx):
+        """Returns the path of bucket file `idx`.
+
+        Returns
+        ------
+        str
+        """
+        return os.path.join(self.dir.name, str(idx))
+
+    def partition(self, number):
+        """Returns the bucket `number` belongs to.
+
+        Returns
+        ------
+        int
+        """
+        return partition_of(number, self._bits, self.level)
+
+    def add(self, number):
+        """Appends number to its bucket, writing the bucket's buffer to disk
+        when it is full.
+
+        Parameters
+        ----------
+        number : int
+
+        Returns
+        ------
+        number : int
+        """
+        idx = self.partition(number)
+        buffer_ = self._buffers[idx]
+        buffer_.append(number)
+        self.counts[idx] += 1
+        self.cardinality += 1
+        if len(buffer_) >= self.buffer_size:
+            self._write(idx)
+        return number
+
+    def add_many(self, numbers):
+        """Appends every value of `numbers` to the store.
+
+        Parameters
+        ----------
+        numbers : iterable of int
+        """
+        bits, level = self._bits, self.level
+        buffers, counts = self._buffers, self.counts
+        buffer_size = self.buffer_size
+        added = 0
+        for number in numbers:
+            idx = partition_of(number, bits, level)
+            buffer_ = buffers[idx]
+            buffer_.append(number)
+            counts[idx] += 1
+            added += 1
+            if len(buffer_) >= buffer_size:
+                self._write(idx)
+        self.cardinality += added
+
+    def _write(self, idx):
+        """Appends the buffer of bucket `idx` to its file and empties it."""
+        buffer_ = self._buffers[idx]
+        if not buffer_:
+            return
+        with open(self.path(idx), 'ab') as outfile:
+            write_packed(outfile, buffer_)
+        del buffer_[:]
+
+    def close(self):
+        """Writes every buffer to disk. After closing, every element of the
+        store lives in a bucket file.
+        """
+        for idx in range(self.n_partitions):
+            self._write(idx)
+
+    def contains(self, number):
+        """Is number in the store? Checks the bucket's buffer and then scans
+        the bucket file for the packed value.
+
+        Parameters
+        ----------
+        number : int
+
+        Returns
+        ------
+        bool
+        """
+        idx = self.partition(number)
+        if number in self._buffers[idx]:
+            return True
+
+        path = self.path(idx)
+        if not os.path.isfile(path):
+            return False
+
+        needle = pack(number)
+        chunk_size = self.scan_size * c.SIZE_UINT64
+
+        with open(path, 'rb') as infile:
+            while True:
+                # chunks are a multiple of the value width, so a value is
+                # never split between two chunks
+                data = infile.read(chunk_size)
+                if not data:
+                    return False
+                pos = data.find(needle)
+                # a match has to be aligned to a value boundary
+                while pos != -1 and pos % c.SIZE_UINT64:
+                    pos = data.find(needle, pos + 1)
+                if pos != -1:
+                    return True
+
+    def contains_many(self, numbers):
+        """Returns the numbers of `numbers` which are in the store. The
+        numbers are grouped by bucket, and a bucket file is sorted once after
+        it was appended to, see `_sort_bucket`. Every number is then binary
+        searched in the one frame of the bucket which may hold it, instead of
+        scanning the whole bucket per number like `contains`.
+
+        Parameters
+        ----------
+        numbers : iterable of int
+
+        Returns
+        ------
+        array of uint64
+        """
+        groups = {}
+        for number in numbers:
+            idx = self.partition(number)
+            if idx not in groups:
+                groups[idx] = array('Q')
+            groups[idx].append(number)
+
+        hits = array('Q')
+        for idx, group in groups.items():
+            probes = set(group)
+            found = probes.intersection(self._buffers[idx])
+            if self.counts[idx] > len(self._buffers[idx]):
+                found.update(self._search(idx, sorted(probes - found)))
+            hits.extend(number for number in group if number in found)
+        return hits
+
+    def _sort_bucket(self, idx):
+        """Sorts bucket file `idx` in runs which fit in the scan chunk, see
+        `c.SORT_ELEMENT_SIZE`, and merges them back into it. Records the first
+        value of every frame of half a scan chunk of the sorted bucket.
+
+        Parameters
+        ----------
+        idx : int
+        """
+        path = self.path(idx)
+        run_size = max(
+            int(self.scan_size * c.SIZE_UINT64 // c.SORT_ELEMENT_SIZE), 1
+        )
+        runs = external_sort.write_runs(read_packed(path, run_size), run_size)
+
+        # the blocks of the runs and the frame being written share the scan
+        # chunk
+        frame_size = self._frame_size
+        block_size = max(frame_size // len(runs.paths), 1)
+        merged = heapq.merge(*(
+            chain.from_iterable(read_packed(run, block_size))
+            for run in runs.paths
+        ))
+        fences = array('Q')
+        with open(path, 'wb') as outfile:
+            while True:
+                frame = array('Q', islice(merged, frame_size))
+                if not frame:
+                    break
+                fences.append(frame[0])
+                write_packed(outfile, frame)
+        runs.cleanup()
+
+        self._fences[idx] = fences
+        self._sorted[idx] = runs.cardinality
+
+    def _search(self, idx, numbers):
+        """Yields the numbers of `numbers` which are in bucket file `idx`. The
+        bucket is sorted first if it was appended to since it was sorted.
+
+        Parameters
+        ----------
+        idx : int
+        numbers : list of int
+            Ascending numbers of the bucket, so a frame is read at most once
+
+        Yields
+        ------
+        int
+        """
+        if self._sorted[idx] != self.counts[idx] - len(self._buffers[idx]):
+            self._sort_bucket(idx)
+        path, fences = self.path(idx), self._fences[idx]
+        frame_bytes = self._frame_size * c.SIZE_UINT64
+
+        current, frame = None, None
+        for number in numbers:
+            pos = bisect_right(fences, number) - 1
+            if pos < 0:
+                continue
+            if pos != current:
+                current = pos
+                frame = next(read_packed(path, self._frame_size,
+                                         pos * frame_bytes,
+                                         (pos + 1) * frame_bytes))
+            found = bisect_left(frame, number)
+            if found < len(frame) and frame[found] == number:
+                yield number
+
+    def read_partition(self, idx, block_size):
+        """Reads every element of bucket `idx`, `block_size` elements at a
+        time.
+
+        Parameters
+        ----------
+        idx : int
+        block_size : int
+
+        Yields
+        ------
+        array of uint64
+        """
+        path = self.path(idx)
+        if os.path.isfile(path):
+            yield from read_packed(path, block_size)
+        if self._buffers[idx]:
+            yield array('Q', self._buffers[idx])
+
+    def __iter__(self):
+        """Yields blocks of every element of the store, bucket by bucket."""
+        for idx in range(self.n_partitions):
+            yield from self.read_partition(idx, c.SPILL_BUFFER_SIZE)
+
+    def cleanup(self):
+        """Removes the bucket files from disk."""
+        self.dir.cleanup()
+
+
+class RangePartitionedStore(PartitionedStore):
+    """A RangePartitionedStore partitions values by range instead of by hash.
+    [`low`, `high`) is split into `n_partitions` aligned ranges of 2^`shift`
+    values each, so a value's partition is the high bits of its offset from
+    `low`. Values below `low` go to the first partition and values past the
+    last range to the last one, see `bounds`.
+
+    The partitions of two stores of the same range hold the same ranges of
+    values, in ascending order of partition.
+    """
+
+    def __init__(self, low, high, n_partitions=c.SPILL_PARTITIONS,
+                 buffer_size=c.SPILL_BUFFER_SIZE, dir_=None):
+        """
+        Attributes
+        ---------
+        low : int
+        high : int
+        shift : int
+            log2 of the amount of values in the range of a partition
+        _below : int
+            The smallest value added, if it is below `low`
+        _above : int
+            One more than the largest value added, if it is past the last
+            range
+        """
+        super().__init__(n_partitions, buffer_size, dir_=dir_)
+        self.low = low
+        self.high = high
+        self.shift = range_shift(high - low, n_partitions)
+        self._below = low
+        self._above = low + (n_partitions << self.shift)
+
+    def bounds(self, idx):
+        """Returns the range of the values in partition `idx`. The first and
+        the last partition are stretched to the values outside of the ranges
+        which were added to them, so splitting up a partition by its bounds
+        always splits it into smaller ranges.
+
+        Returns
+        ------
+        int
+            The smallest value the partition can hold
+        int
+            One more than the largest value the partition can hold
+        """
+        low = self._below if idx == 0 else self.low + (idx << self.shift)
+        high = self._above if idx == self.n_partitions - 1 else \
+            self.low + ((idx + 1) << self.shift)
+        return low, high
+
+    def partition(self, number):
+        """Returns the partition of the range `number` is in.
+
+        Returns
+        ------
+        int
+        """
+        idx = (number - self.low) >> self.shift
+        return min(max(idx, 0), self.n_partitions - 1)
+
+    def add(self, number):
+        """Appends number to its partition, see `add_many`.
+
+        Parameters
+        ----------
+        number : int
+
+        Returns
+        ------
+        number : int
+        """
+        self.add_many((number,))
+        return number
+
+    def add_many(self, numbers):
+        """Appends every value of `numbers` to the store.
+
+        Parameters
+        ----------
+        numbers : iterable of int
+        """
+        low, shift = self.low, self.shift
+        last = self.n_partitions - 1
+        buffers, counts = self._buffers, self.counts
+        buffer_size = self.buffer_size
+        added = 0
+        for number in numbers:
+            idx = (number - low) >> shift
+            if idx < 0:
+                idx = 0
+                if number < self._below:
+                    self._below = number
+            elif idx > last:
+                idx = last
+                if number >= self._above:
+                    self._above = number + 1
+            buffer_ = buffers[idx]
+            buffer_.append(number)
+            counts[idx] += 1
+            added += 1
+            if len(buffer_) >= buffer_size:
+                self._write(idx)
+        self.cardinality += added
@@ -0,0 +1,120 @@
+import json
+import os
+
+# tuned configs are kept per regime of the size of the smaller file relative
+# to the memory limit: a regime holds the ratios up to its bound
+REGIMES = (
+    ('small', 1/4),
+    ('medium', 4),
+    ('large', float('inf')),
+)
+
+# profiles already read, by path
+_loaded = {}
+
+
+def profile_path():
+    """Returns where tuned configs are saved: the path in the
+    SISU_TUNED_PROFILE environment variable, or a file in the home dir.
+
+    Returns
+    ------
+    str
+    """
+    return os.environ.get(
+        'SISU_TUNED_PROFILE',
+        os.path.join(os.path.expanduser('~'), '.sisu', 'tuned.json')
+    )
+
+
+def load_profile(path=None):
+    """Returns the tuned configs, by strategy name and then by regime. A
+    profile is only read once per process.
+
+    Parameters
+    ----------
+    path : str, optional
+        Reads from `profile_path` if None
+
+    Returns
+    ------
+    dict of str to dict of str to dict
+        Empty if nothing was tuned
+    """
+    path = path or profile_path()
+    if path not in _loaded:
+        profile = {}
+        if os.path.isfile(path):
+            with open(path) as infile:
+                profile = json.load(infile)
+        _loaded[path] = profile
+    return _loaded[path]
+
+
+def save_profile(profile, path=None):
+    """Saves tuned configs.
+
+    Parameters
+    ----------
+    profile : dict of str to dict of str to dict
+        See `load_profile`
+    path : str, optional
+        Writes to `profile_path` if None
+
+    Returns
+    ------
+    str
+        The path written to
+    """
+    path = path or profile_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as outfile:
+        json.dump(profile, outfile, indent=2)
+    _loaded[path] = profile
+    return path
+
+
+def regime_of(file_size, mem_limit):
+    """Returns the regime of a smaller file of `file_size` bytes intersected
+    within `mem_limit` bytes.
+
+    Parameters
+    ----------
+    file_size : int
+    mem_limit : float
+
+    Returns
+    ------
+    str
+    """
+    ratio = file_size / max(mem_limit, 1)
+    for regime, bound in REGIMES:
+        if ratio <= bound:
+            return regime
+    return REGIMES[-1][0]
+
+
+def config_for(strategy, file_, mem_limit, config=None):
+    """Returns the config of `strategy` for intersecting `file_`, the smaller
+    file, within `mem_limit`. A config which is passed in is used as is,
+    otherwise the tuned values of the regime override the defaults.
+
+    Parameters
+    ----------
+    strategy : Strategy
+    file_ : str
+    mem_limit : float
+    config : dict, optional
+
+    Returns
+    ------
+    dict
+    """
+    if config:
+        return config
+    tuned = load_profile().get(strategy.__name__, {}).get(
+        regime_of(os.path.getsize(file_), mem_limit)
+    )
+    if not tuned:
+        return strategy.DEFAULT_CONFIG
+    return dict(strategy.DEFAULT_CONFIG, **tuned)
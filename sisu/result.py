@@ -0,0 +1,179 @@
+from array import array
+import math
+
+import sisu.constants as c
+
+
+class Counter():
+    """A Counter is a result which only counts the values added to it. Like
+    the input files, a strategy never adds a value twice, so the count is
+    the cardinality of the intersection.
+    """
+
+    def __init__(self):
+        """
+        Attributes
+        ---------
+        cardinality : int
+            The amount of values added
+        """
+        self.cardinality = 0
+
+    @property
+    def memory(self):
+        """Returns the memory in bytes the result needs.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return 0
+
+    def add(self, number):
+        """Counts number.
+
+        Parameters
+        ----------
+        number : int
+
+        Returns
+        ------
+        number : int
+        """
+        self.cardinality += 1
+        return number
+
+    def add_many(self, numbers):
+        """Counts every value of `numbers`.
+
+        Parameters
+        ----------
+        numbers : array of uint64
+        """
+        self.cardinality += len(numbers)
+
+    def close(self):
+        """Nothing to write."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StreamingResult(Counter):
+    """A StreamingResult counts the values added to it and appends them to a
+    newline delimited output file, `buffer_size` values at a time.
+    """
+
+    def __init__(self, output, buffer_size=c.RESULT_BUFFER_SIZE):
+        """
+        Attributes
+        ---------
+        output : str
+            Path of the output file
+        buffer_size : int
+            The amount of values buffered before they are written
+        _buffer : array of uint64
+            Values which are not written yet
+        """
+        super().__init__()
+        self.output = output
+        self.buffer_size = max(int(buffer_size), 1)
+        self._buffer = array('Q')
+        self._outfile = open(output, 'w')
+
+    @property
+    def memory(self):
+        """Returns the memory in bytes of the buffer and of formatting it.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        return self.buffer_size * (c.SIZE_UINT64 + c.LARGEST_ELEMENT_SIZE)
+
+    def add(self, number):
+        """Counts and buffers number.
+
+        Parameters
+        ----------
+        number : int
+
+        Returns
+        ------
+        number : int
+        """
+        self.cardinality += 1
+        self._buffer.append(number)
+        if len(self._buffer) >= self.buffer_size:
+            self._write()
+        return number
+
+    def add_many(self, numbers):
+        """Counts and buffers every value of `numbers`.
+
+        Parameters
+        ----------
+        numbers : array of uint64
+        """
+        for pos in range(0, len(numbers), self.buffer_size):
+            chunk = numbers[pos:pos + self.buffer_size]
+            self.cardinality += len(chunk)
+            self._buffer.extend(chunk)
+            if len(self._buffer) >= self.buffer_size:
+                self._write()
+
+    def _write(self):
+        """Appends the buffered values to the output file."""
+        self._outfile.write(''.join([f'{num}\n' for num in self._buffer]))
+        del self._buffer[:]
+
+    def close(self):
+        """Writes the buffered values and closes the output file."""
+        if not self._outfile.closed:
+            self._write()
+            self._outfile.close()
+
+
+class Estimate():
+    """An Estimate is the result of an approximate strategy: the estimated
+    cardinality of the intersection and its standard error. No values are
+    found, so none can be added to it.
+    """
+
+    def __init__(self, cardinality, error):
+        """
+        Attributes
+        ---------
+        cardinality : int
+            The estimated amount of values in both files
+        error : float
+            The standard error of the estimate
+        """
+        self.cardinality = cardinality
+        self.error = error
+
+    def bounds(self, errors=2):
+        """Returns the interval of `errors` standard errors around the
+        estimate, about 95% likely to hold the cardinality at 2.
+
+        Parameters
+        ----------
+        errors : float, optional
+
+        Returns
+        ------
+        int
+            The lower bound, at least 0
+        int
+            The upper bound
+        """
+        margin = errors * self.error
+        return (max(int(self.cardinality - margin), 0),
+                int(math.ceil(self.cardinality + margin)))
+
+    def __str__(self):
+        low, high = self.bounds()
+        return f'{self.cardinality} (95% between {low} and {high})'
@@ -1,31 +1,54 @@
-import os
-import tempfile
-from itertools import islice
-from glob import iglob
-
-from pybloom_live import ScalableBloomFilter
+from array import array
+from itertools import filterfalse
 
+from sisu.bloom import BloomFilter
+from sisu.hashset import Uint64HashSet
+from sisu.partition import PartitionedStore
 import sisu.constants as c
 import sisu.utils as u
 
+# the least memory a hash spills with: a single value per bucket and a single
+# value to scan with, see `PartitionedStore.resize_buffers`, and a bloom
+# filter of a single word
+MIN_SPILL_MEMORY = (c.SPILL_PARTITIONS + 2) * c.SIZE_UINT64
+
 
 class _DiskHash():
-    """A _DiskHash is a simple data structure that uses a directory as a simple
-    a hash map. Each write adds a file to a directory, where the name of the
-    file corresponds to the name of the element.
+    """A _DiskHash is an append-only set of ints stored on disk. Elements are
+    hash partitioned into a fixed number of bucket files of packed uint64s,
+    see `PartitionedStore`. Writes are buffered per bucket and a lookup only
+    scans the bucket the element hashes to.
     """
 
-    def __init__(self):
+    def __init__(self, n_partitions=c.SPILL_PARTITIONS,
+                 buffer_size=c.SPILL_BUFFER_SIZE):
         """
         Attributes
         ---------
-        cardinality : int
-            The amount of elements in the hash
-        dir : TemporaryDirectory
-            Output dir for values in the hash
+        _store : PartitionedStore
+            Bucket files holding the values in the hash
         """
-        self.cardinality = 0
-        self.dir = tempfile.TemporaryDirectory()
+        self._store = PartitionedStore(n_partitions, buffer_size)
+
+    @property
+    def cardinality(self):
+        """The amount of elements in the hash
+
+        Returns
+        ------
+        int
+        """
+        return self._store.cardinality
+
+    @property
+    def dir(self):
+        """Output dir for values in the hash
+
+        Returns
+        ------
+        TemporaryDirectory
+        """
+        return self._store.dir
 
     @u.require_int
     def __contains__(self, element):
@@ -40,14 +63,27 @@ class _DiskHash():
         ------
         bool
         """
+        return self._store.contains(element)
 
-        path = f'{self.dir.name}/{element}'
-        return os.path.isfile(path)
+    def contains_many(self, numbers):
+        """Returns the numbers of `numbers` which are in the hash, scanning
+        each bucket once for all of them, see
+        `PartitionedStore.contains_many`.
+
+        Parameters
+        ----------
+        numbers : iterable of int
+
+        Returns
+        ------
+        array of uint64
+        """
+        return self._store.contains_many(numbers)
 
     @u.require_int
     def add(self, element):
-        """Adds element to set by writing a file to disk with the element as
-        the name of the file.
+        """Adds element to set by appending it to the write buffer of its
+        bucket.
 
         Parameters
         ----------
@@ -58,11 +94,21 @@ class _DiskHash():
         ------
         element : int
         """
-        path = f'{self.dir.name}/{element}'
-        with open(path, 'a'):
-            pass
-        self.cardinality += 1
-        return element
+        return self._store.add(element)
+
+    def blocks(self, block_size):
+        """Yields the elements in the hash, `block_size` elements at a time.
+
+        Parameters
+        ----------
+        block_size : int
+
+        Yields
+        ------
+        array of uint64
+        """
+        for idx in range(self._store.n_partitions):
+            yield from self._store.read_partition(idx, block_size)
 
     def flush(self, output, block_size):
         """Writes all elements in set to `output` path `block_size` elements at a time.
@@ -78,54 +124,138 @@ class _DiskHash():
         ------
         Writes a file
         """
-        files = iglob(f'{self.dir.name}/*')
-
-        def _process(x):
-            return os.path.split(x)[-1] + '\n'
-
         with open(output, 'a') as outfile:
-            while True:
-                chunk = islice(files, block_size)
-                new_lines = [_process(file_) for file_ in chunk]
-                if not new_lines:
-                    break
-                new_lines = ''.join(new_lines)
-                outfile.write(new_lines)
+            for idx in range(self._store.n_partitions):
+                for block in self._store.read_partition(idx, block_size):
+                    outfile.write(''.join([f'{num}\n' for num in block]))
 
 
 class SpillableHash():
-    """A SpillableHash is a set data structure which keeps elements in memory
-    until it reaches a fixed capacity wherein it spills to a disk. Calls to
-    disk are minimized through the use of a ScalableBloomfilter.
+    """A SpillableHash is a set data structure which keeps elements in a
+    compact in memory hash set until it reaches a fixed capacity wherein it
+    spills to a disk. Calls to disk are minimized through the use of a fixed
+    size BloomFilter.
+
+    A filter passed in covers every element and is checked before the in
+    memory set. Otherwise a filter is created on the first spill and only
+    covers the spilled elements.
     """
 
-    def __init__(self, capacity):
+    def __init__(self, capacity, budget=None, name='spillable_hash',
+                 size_hint=None, bloom=None):
         """
         Attributes
         ---------
         cardinality : int
             The amount of elements in the hash
         capacity : int
-            The amount of ints the hash can fit in memory
-        dir : TemporaryDirectory
-            Output dir for values in the hash
-        _mem : set of int
+            The amount of ints the hash can fit in memory, see `capacity_for`
+        budget : MemoryBudget
+            Budget the in memory table, the bloom filter and once the hash
+            spills the write buffers are reserved from
+        name : str
+            Name of the reservations in `budget`
+        size_hint : int, optional
+            Expected amount of elements, see `Uint64HashSet`
+        bloom : BloomFilter, optional
+            Filter over every element of the hash
+        bloom_checks : int
+            The amount of lookups checked against the bloom filter
+        bloom_passes : int
+            The amount of those lookups which passed the filter
+        bloom_hits : int
+            The amount of those lookups which were in the hash
+        _mem : Uint64HashSet
             In memory set of items
-        _bloom : ScalableBloomFilter
-            Bloom filter which is used when mem capacity is reached
         _disk:  _DiskHash
             On disk hash where values spill
         """
         self.cardinality = 0
         self.capacity = capacity
-        self._mem = set()
-        # TODO account for memory footprint of bloom filter
-        # assuming it has a neglible footprint for now
-        self._bloom = ScalableBloomFilter(
-            mode=ScalableBloomFilter.SMALL_SET_GROWTH
-        )
+        self.budget = budget
+        self.name = name
+        self.bloom = bloom
+        self.bloom_checks = self.bloom_passes = self.bloom_hits = 0
+        self._bloom_all = bloom is not None
+        self._mem = Uint64HashSet(capacity, size_hint)
         self._disk = _DiskHash()
 
+        if budget is not None and capacity != float('inf'):
+            budget.reserve(name, Uint64HashSet.memory_for(capacity))
+        if budget is not None and bloom is not None:
+            budget.reserve(f'{name}.bloom', bloom.memory)
+
+    @staticmethod
+    def capacity_for(memory):
+        """Returns the amount of ints that fit in `memory` bytes before
+        the hash spills to disk, keeping enough of it to spill with.
+
+        Parameters
+        ----------
+        memory : int (in bytes)
+
+        Returns
+        ------
+        int
+        """
+        return Uint64HashSet.capacity_for(memory - MIN_SPILL_MEMORY)
+
+    @property
+    def spill_memory(self):
+        """Returns the memory in bytes used by the buffers of the disk hash
+        and the bloom filter over spilled elements. It is only reserved once
+        the hash spills.
+
+        Returns
+        ------
+        int (in bytes)
+        """
+        bloom_memory = 0
+        if self.bloom is not None and not self._bloom_all:
+            bloom_memory = self.bloom.memory
+        return self._disk._store.buffer_memory + bloom_memory
+
+    @property
+    def false_positive_rate(self):
+        """Returns the observed fraction of lookups of absent elements which
+        passed the bloom filter anyway.
+
+        Returns
+        ------
+        float U None
+            None if no absent element has been checked yet
+        """
+        negatives = self.bloom_checks - self.bloom_hits
+        if not negatives:
+            return None
+        return (self.bloom_passes - self.bloom_hits) / negatives
+
+    def trim(self):
+        """Lowers the capacity to the current cardinality and gives back the
+        memory reserved for the rest. The in memory table is shrunk if the
+        smaller table fits in the memory that is not reserved.
+
+        Returns
+        ------
+        int
+            The amount of bytes given back
+        """
+        if self._mem_full:
+            return 0
+
+        reserved = Uint64HashSet.memory_for(self.capacity)
+        needed = Uint64HashSet.memory_for(self.cardinality)
+        available = self.budget.available if self.budget is not None \
+            else float('inf')
+
+        if needed < self._mem.memory and needed <= available:
+            self._mem.resize(self.cardinality)
+
+        self.capacity = self.cardinality
+        if self.budget is not None:
+            self.budget.reserve(self.name, self._mem.memory)
+        return max(reserved - self._mem.memory, 0)
+
     @property
     def _mem_full(self):
         """Has in memory capacity been reached?
@@ -149,7 +279,8 @@ class SpillableHash():
 
         if self._mem_full:
             return 0
-        return (self.capacity - self.cardinality) * c.SIZE_INT
+        return Uint64HashSet.memory_for(self.capacity) - \
+            Uint64HashSet.memory_for(self.cardinality)
 
     @u.require_int
     def __contains__(self, number):
@@ -163,16 +294,84 @@ class SpillableHash():
         ------
         bool
         """
+        return bool(self.contains_many((number,)))
+
+    def contains_many(self, numbers):
+        """Returns the numbers of `numbers` which are in the hash. Numbers are
+        checked against the bloom filter a batch at a time and only the ones
+        which pass it are looked up.
+
+        Parameters
+        ----------
+        numbers : array of uint64
 
-        if number in self._mem:
-            return True
-        elif not self._mem_full:
-            return False
+        Returns
+        ------
+        array of uint64
+        """
+        if self._bloom_all:
+            checked = len(numbers)
+            numbers = self.bloom.contains_many(numbers)
+            passed = len(numbers)
+
+        if not self._disk.cardinality:
+            hits = self._mem.contains_many(numbers)
+            if self._bloom_all:
+                self._count_bloom(checked, passed, len(hits))
+            return hits
+
+        mem = self._mem
+        hits = array('Q')
+        misses = array('Q')
+        for number in numbers:
+            if number in mem:
+                hits.append(number)
+            else:
+                misses.append(number)
+
+        if self._bloom_all:
+            found = len(hits)
+        else:
+            # the filter only covers what is on disk
+            checked = len(misses)
+            misses = self.bloom.contains_many(misses)
+            passed = len(misses)
+            found = 0
+
+        disk_hits = self._disk.contains_many(misses)
+        hits.extend(disk_hits)
+        found += len(disk_hits)
+
+        self._count_bloom(checked, passed, found)
+        return hits
+
+    def lookup_many(self, numbers):
+        """Returns the numbers of `numbers` which are in the hash, see
+        `contains_many`, and the ones which are not. The latter are the
+        anti-probe of a hash join.
 
-        if number not in self._bloom:
-            return False
+        Parameters
+        ----------
+        numbers : array of uint64
 
-        return number in self._disk
+        Returns
+        ------
+        tuple of array of uint64
+            The hits and the misses
+        """
+        hits = self.contains_many(numbers)
+        if not hits:
+            return hits, numbers
+        if len(hits) == len(numbers):
+            return hits, array('Q')
+        found = set(hits)
+        return hits, array('Q', filterfalse(found.__contains__, numbers))
+
+    def _count_bloom(self, checks, passes, hits):
+        """Records the outcome of a batch of bloom filter lookups."""
+        self.bloom_checks += checks
+        self.bloom_passes += passes
+        self.bloom_hits += hits
 
     @u.require_int
     def add(self, element):
@@ -194,20 +393,106 @@ class SpillableHash():
         if not self._mem_full:
             self.cardinality += 1
             self._mem.add(element)
+            if self._bloom_all:
+                self.bloom.add(element)
             return element
 
+        self._spill(element)
+
+        return element
+
+    def add_many(self, elements):
+        """Adds every element of `elements` to memory until the in memory
+        capacity is reached and the rest to disk.
+
+        Parameters
+        ----------
+        elements : array of uint64
+        """
+        if self._bloom_all:
+            self.bloom.add_many(elements)
+
+        pos = 0
+        while pos < len(elements) and not self._mem_full:
+            free = max(int(min(self.capacity - self.cardinality,
+                               len(elements))), 1)
+            # avoid copying the block when all of it fits
+            chunk = elements if not pos and free >= len(elements) \
+                else elements[pos:pos + free]
+            self.cardinality += self._mem.add_many(chunk)
+            pos += len(chunk)
+
+        if pos >= len(elements):
+            return
+
+        mem = self._mem
+        for element in elements[pos:]:
+            if element not in mem:
+                self._spill(element)
+
+    def _spill(self, element):
+        """Adds element to disk"""
+
         # we are making the assumption that
         # `each integer appears at most once in each file.`
         # can never write same int twice
         # otherwise uncomment the following line
 
-        # if element not in self._bloom or element not in self._disk:
+        # if element not in self.bloom or element not in self._disk:
 
-        self._bloom.add(element)
+        if not self._disk.cardinality:
+            self._start_spilling()
+        if not self._bloom_all:
+            self.bloom.add(element)
         self._disk.add(element)
         self.cardinality += 1
 
-        return element
+    def _start_spilling(self):
+        """Sizes the write and scan buffers of the disk hash on the first
+        spill and reserves them, together with a new bloom filter over
+        spilled elements unless the hash has a filter over every element.
+
+        How many elements will spill is not known, so the filter is sized
+        for as many as fit in memory. With a budget, the buffers get at most
+        half of the memory which is not reserved yet and the filter at most
+        the rest, or all of it when there is no filter to create.
+        """
+        store = self._disk._store
+        capacity = max(self.capacity, 1)
+        bloom_memory = BloomFilter.memory_for(capacity)
+
+        if self.budget is not None:
+            available = self.budget.available
+            store.resize_buffers(available if self._bloom_all
+                                 else available // 2)
+            bloom_memory = min(bloom_memory, available - store.buffer_memory)
+
+        if not self._bloom_all:
+            self.bloom = BloomFilter(capacity, bloom_memory)
+        if self.budget is not None:
+            self.budget.reserve(f'{self.name}.spill', self.spill_memory)
+
+    def blocks(self, block_size):
+        """Yields the elements in the set `block_size` elements at a time,
+        the ones in memory first and then the spilled ones.
+
+        Parameters
+        ----------
+        block_size : int
+
+        Yields
+        ------
+        array of uint64
+        """
+        block = array('Q')
+        for element in self._mem:
+            block.append(element)
+            if len(block) >= block_size:
+                yield block
+                block = array('Q')
+        if block:
+            yield block
+        yield from self._disk.blocks(block_size)
 
     def flush(self, output, block_size):
         """Writes all elements in set to `output` path
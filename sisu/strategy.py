@@ -1,12 +1,28 @@
 from abc import ABCMeta, abstractmethod
+from array import array
+from itertools import chain
+import logging
+import math
 import os
-import subprocess
 import tempfile
 
-from sisu.spillable_hash import SpillableHash
+from sisu.bitmap import CHUNK_MEMORY, ChunkedBitmap
+from sisu.bloom import BloomFilter
+from sisu.estimate import KMinValues
+from sisu.hashset import Uint64HashSet
+from sisu.index import Index, build as build_index
+from sisu.memory import MemoryBudget
+from sisu.partition import PartitionedStore, RangePartitionedStore
+from sisu.result import Estimate, StreamingResult
+from sisu.spillable_hash import MIN_SPILL_MEMORY, SpillableHash
 import sisu.constants as c
+import sisu.estimate as estimate
+import sisu.external_sort as external_sort
+import sisu.profiles as profiles
 import sisu.utils as utils
 
+logger = logging.getLogger(__name__)
+
 
 class Strategy(metaclass=ABCMeta):
     """A strategy is an interface which expects a method called intersect to
@@ -16,14 +32,36 @@ class Strategy(metaclass=ABCMeta):
     Each file path is a  \n delimited file of ints in the range [0, 2^63]
 
     A config object is also passed in which holds certain memory tuning related
-    values
+    values. Input files are read with `reader`, a `utils.FileReader` unless
+    specified otherwise. Memory is reserved from `budget`, a
+    `memory.MemoryBudget` of `mem_limit` unless specified otherwise.
 
     Given those four inputs a Strategy returns a SpillableHash which contains
-    the result set.
+    the result set. When a `result` such as a `result.Counter` or a
+    `result.StreamingResult` is passed in instead, the intersecting values
+    are added to it and it is returned. Such a result does not hold the
+    values in memory, so the memory of the result set goes to the build side
+    and the read buffers.
+
+    A strategy which is not `exact` only estimates the cardinality of the
+    intersection and returns a `result.Estimate`.
+
+    More than two files are intersected with `intersect_many`. A strategy
+    which is `multiway` has a plan of its own for them, the others
+    intersect them a pair at a time.
+
+    The other set operations of two files are run with `combine`, by the
+    strategies which list them in their `operations`.
     """
+    exact = True
+    multiway = False
+    operations = ('intersect',)
+
     @abstractmethod
-    def intersect(file1, file2, mem_limit, **config):
-        """Returns a SpillableHash containing the intersecting values
+    def intersect(file1, file2, mem_limit, reader=None, budget=None,
+                  result=None, **config):
+        """Returns a SpillableHash, or `result`, containing the intersecting
+        values
 
         Parameters
         ----------
@@ -33,31 +71,104 @@ class Strategy(metaclass=ABCMeta):
             the path to the second file
         mem_limit : float
             The memory limit in bytes
+        reader : FileReader, optional
+            reads blocks of numbers from the files
+        budget : MemoryBudget, optional
+            memory of buffers and hash tables is reserved from the budget
+        result : Counter U StreamingResult, optional
+            intersecting values are added to the result
 
        config
             custom kwargs that can be different for each strategy
 
         Returns
         ------
-        SpillableHash
+        SpillableHash U Counter U StreamingResult
         """
 
         raise NotImplementedError('Implement this method.')
 
+    @classmethod
+    def combine(cls, file1, file2, mem_limit, op='intersect', reader=None,
+                budget=None, result=None, **config):
+        """Returns a SpillableHash, or `result`, containing the values of
+        the set operation `op` over the two files. A difference holds the
+        values of `file1` which are not in `file2`. A strategy only runs its
+        `operations`, this one only intersects.
+
+        Parameters
+        ----------
+        file1 : str
+            the path to the first file
+        file2 : str
+            the path to the second file
+        mem_limit : float
+            The memory limit in bytes
+        op : str, optional
+            One of `c.SET_OPERATIONS`
+
+        see `intersect` for the other parameters
+
+        Returns
+        ------
+        SpillableHash U Counter U StreamingResult
+        """
+        if op not in cls.operations:
+            raise ValueError(f'{cls.__name__} does not run {op}.')
+        return cls.intersect(file1, file2, mem_limit, reader=reader,
+                             budget=budget, result=result, **config)
+
+    @classmethod
+    def intersect_many(cls, files, mem_limit, reader=None, budget=None,
+                       result=None, **config):
+        """Returns a SpillableHash, or `result`, containing the values in
+        every one of `files`. The files are intersected a pair at a time,
+        smallest first: the intersection so far is streamed to a temporary
+        file which is intersected with the next file.
+
+        Parameters
+        ----------
+        files : list of str
+            the paths to at least two files
+        mem_limit : float
+            The memory limit in bytes
+
+        see `intersect` for the other parameters
+
+        Returns
+        ------
+        SpillableHash U Counter U StreamingResult
+        """
+        files = utils.order_by_file_size(files)
+        if len(files) < 2:
+            raise ValueError('An intersection takes at least two files.')
+
+        with tempfile.TemporaryDirectory() as dir_:
+            current = files[0]
+            for idx, file_ in enumerate(files[1:-1]):
+                path = os.path.join(dir_, str(idx))
+                with StreamingResult(path) as partial:
+                    cls.intersect(current, file_, mem_limit, reader=reader,
+                                  budget=budget, result=partial, **config)
+                current = path
+            return cls.intersect(current, files[-1], mem_limit,
+                                 reader=reader, budget=budget, result=result,
+                                 **config)
+
 
 class Naive(Strategy):
     """The naive strategy is a dummy testing solution that ignores the mem_limit
     parameter. This solution is intended as a base line benchmark.
     """
     @staticmethod
-    def intersect(file1, file2, _, **__):
-        file1_ids = utils.read_nums(file1)
-        file2_ids = utils.read_nums(file2)
+    def intersect(file1, file2, _, reader=None, result=None, **__):
+        file1_ids = utils.read_nums(file1, reader)
+        file2_ids = utils.read_nums(file2, reader)
 
-        hash_map = SpillableHash(float('inf'))
-        for num in file1_ids.intersection(file2_ids):
-            hash_map.add(num)
-        return hash_map
+        if result is None:
+            result = SpillableHash(float('inf'))
+        result.add_many(array('Q', file1_ids.intersection(file2_ids)))
+        return result
 
 
 class Hash(Strategy):
@@ -72,17 +183,19 @@ class Hash(Strategy):
         been implemented, there will be many, many seeks to disk and this
         method will be extremely slow.
     """
+    multiway = True
+    operations = c.SET_OPERATIONS
 
     DEFAULT_CONFIG = {
 
         # ideally we would like the memory capacity of build hash to equal the
-        # amount of ints in file1 ...however we do not know how many ints are
-        # in the file. That being said, better to overestimate the size than to
-        # underestimate and end up with many many many disk seeks ...
-        # err on the side of caution and make the size of the build hash bigger
-        # than you may expect
+        # amount of ints in file1 ...however we only know an estimate of it,
+        # sampled from the file, see `estimate.sample_file`. That being said,
+        # better to overestimate the size than to underestimate and end up
+        # with many many many disk seeks ... so the build hash gets room for
+        # this many times the estimate
 
-        'file_size_scale_up': 4,
+        'line_count_margin': 11/10,
         'build_hash_memory_threshold': 6/10,
 
         # of the memory remaining after allocating our
@@ -93,78 +206,611 @@ class Hash(Strategy):
         # and most likely there will not be 1:1 intersection
 
         'result_hash': 6/10,
+
+        # when file1 is not expected to fit in the build hash, a bloom filter
+        # over all of it is checked before every lookup. The filter gets
+        # this many bits per line of file1, but at most this fraction of the
+        # build hash memory. More bits mean fewer lookups on disk.
+        'bloom_filter_bits': c.BLOOM_BITS_PER_VALUE,
+        'bloom_filter_memory_threshold': 3/10,
+
+        # the same goes for the write and scan buffers the build hash spills
+        # with. They get at most this fraction of the build hash memory.
+        'spill_buffer_memory_threshold': 2/10,
     }
 
     @staticmethod
-    def determine_memory(file1, file2, mem_limit, **config):
+    def determine_memory(file1, file2, mem_limit, reader=None,
+                         result_memory=None, **config):
         """Given two files, a memory list and configuration settings
-        determines how much memeory to allocate to the two SpillableHashes
-        and for the blocksize in the `intersect` method
+        determines how much memeory to allocate to the two SpillableHashes,
+        the bloom filter of the build hash and for the blocksize in the
+        `intersect` method. `reader` estimates the amount of numbers in the
+        files and their overlap. `result_memory` is the memory of a result
+        which is not a SpillableHash, if there is one.
         """
-        if not config:
-            config = Hash.DEFAULT_CONFIG
+        config = profiles.config_for(Hash, file1, mem_limit, config)
+        reader = reader or utils.FileReader()
+
+        file1_lines = reader.stats(file1).lines
+        overlap = estimate.estimate_overlap(reader.stats(file1),
+                                            reader.stats(file2))
 
-        file1_size = os.path.getsize(file1)
+        # the build hash keeps some memory to spill with, see
+        # `SpillableHash.capacity_for`
+        build_hash_needed = Uint64HashSet.memory_for(
+            file1_lines * config['line_count_margin']
+        ) + MIN_SPILL_MEMORY
 
         build_hash_memory = min(
-            file1_size * config['file_size_scale_up'],
+            build_hash_needed,
             mem_limit * config['build_hash_memory_threshold']
         )
 
         remaining_memory = mem_limit - build_hash_memory
         result_hash_memory = remaining_memory * config['result_hash']
+        if overlap is not None:
+            # the rest goes to the read buffer
+            result_hash_memory = min(
+                result_hash_memory,
+                Uint64HashSet.memory_for(overlap * config['line_count_margin'])
+                + MIN_SPILL_MEMORY
+            )
+
+        if result_memory is not None:
+            # the share of the result set goes to the build hash, as far as
+            # file1 needs it, and the rest to the read buffer
+            build_hash_memory += min(
+                max(result_hash_memory - result_memory, 0),
+                max(build_hash_needed - build_hash_memory, 0)
+            )
+            result_hash_memory = result_memory
+            remaining_memory = mem_limit - build_hash_memory
+
         block_size_memory = remaining_memory - result_hash_memory
 
+        # a filter only pays off when lookups can go to disk
+        bloom_memory = 0
+        if file1_lines > SpillableHash.capacity_for(build_hash_memory):
+            bloom_memory = min(
+                BloomFilter.memory_for(file1_lines,
+                                       config['bloom_filter_bits']),
+                build_hash_memory * config['bloom_filter_memory_threshold']
+            )
+            # left unreserved, the build hash takes it on its first spill
+            spill_memory = min(
+                (c.SPILL_PARTITIONS * c.SPILL_BUFFER_SIZE +
+                 c.SPILL_SCAN_SIZE) * c.SIZE_UINT64,
+                build_hash_memory * config['spill_buffer_memory_threshold']
+            )
+            build_hash_memory -= bloom_memory + spill_memory
+
         return (
             int(build_hash_memory),
+            int(bloom_memory),
             int(result_hash_memory),
             int(block_size_memory)
         )
 
     @staticmethod
     @utils.reorder_by_file_size
-    def intersect(file1, file2, mem_limit, **config):
+    def intersect(file1, file2, mem_limit, reader=None, budget=None,
+                  result=None, **config):
         """The Hash strategy builds a hash table over the smaller file.
         It then walks through the numbers in the larger file and records
         ids present from second file that are in the first.
+
+        When the smaller file does not fit in memory, a bloom filter over
+        it is built alongside the table and filters the numbers of the
+        larger file before they are looked up in memory or on disk.
         """
+        reader = reader or utils.FileReader()
         (
             build_hash_memory,
+            bloom_memory,
             result_hash_memory,
             block_size_memory
-        ) = Hash.determine_memory(file1, file2, mem_limit, **config)
+        ) = Hash.determine_memory(
+            file1, file2, mem_limit, reader=reader,
+            result_memory=None if result is None else result.memory,
+            **config
+        )
+
+        budget = budget or MemoryBudget(mem_limit)
+        if result is not None:
+            budget.reserve('result', result_hash_memory)
 
-        build_hash_int_capacity = max(build_hash_memory // c.SIZE_INT, 1)
-        build_hash = SpillableHash(build_hash_int_capacity)
+        bloom = None
+        if bloom_memory:
+            bloom = BloomFilter(reader.estimate_count(file1), bloom_memory)
 
-        block_size = block_size_memory // c.LARGEST_ELEMENT_SIZE
+        build_hash_int_capacity = max(
+            SpillableHash.capacity_for(build_hash_memory), 1
+        )
+        build_hash = SpillableHash(build_hash_int_capacity, budget,
+                                   'build_hash', bloom=bloom)
 
-        for block in utils.read_file_by_block(file1, block_size):
-            for number in block:
-                build_hash.add(number)
+        budget.reserve('read_buffer', block_size_memory)
+        block_bytes = block_size_memory // c.PARSE_OVERHEAD
 
-        result_hash_int_capacity = result_hash_memory // c.SIZE_INT
+        for block in reader.blocks(file1, block_bytes):
+            build_hash.add_many(block)
 
-        # give back any unused capacity from the build hash map
-        unused_capacity = build_hash.available_memory // c.SIZE_INT
-        result_hash_int_capacity += unused_capacity
-        build_hash.capacity -= unused_capacity
+        if result is None:
+            # give back any unused memory from the build hash map, while the
+            # buffers of a spilled build hash may have taken some of the rest
+            result_hash_int_capacity = SpillableHash.capacity_for(min(
+                result_hash_memory + build_hash.trim(), budget.available
+            ))
+            result = SpillableHash(result_hash_int_capacity, budget,
+                                   'result_hash')
 
-        result_hash = SpillableHash(result_hash_int_capacity)
+        for block in reader.blocks(file2, block_bytes):
+            result.add_many(build_hash.contains_many(block))
 
-        for block in utils.read_file_by_block(file2, block_size):
-            for number in block:
-                if number in build_hash:
-                    result_hash.add(number)
+        if bloom is not None:
+            logger.info(
+                f'Bloom filter of {bloom.memory} bytes, estimated false '
+                f'positive rate {bloom.false_positive_rate:.4f}, observed '
+                f'{build_hash.false_positive_rate}'
+            )
 
-        return result_hash
+        for name in ('build_hash', 'build_hash.bloom', 'build_hash.spill',
+                     'read_buffer'):
+            budget.release(name)
+
+        return result
+
+    @staticmethod
+    def combine(file1, file2, mem_limit, op='intersect', reader=None,
+                budget=None, result=None, **config):
+        """Builds a hash table over the smaller file like `intersect` and
+        walks through the larger file. The numbers of the larger file which
+        are not in the table are its anti-probe, see
+        `SpillableHash.lookup_many`. The numbers of the table which the
+        larger file did find are kept in a set of their own, and the numbers
+        of the table which are not in that set are only in the smaller file.
+        A union adds the larger file's misses and then the whole table.
+        """
+        if op not in Hash.operations:
+            raise ValueError(f'Hash does not run {op}.')
+        if op == 'intersect':
+            return Hash.intersect(file1, file2, mem_limit, reader=reader,
+                                  budget=budget, result=result, **config)
+
+        build_file, probe_file = utils.order_by_file_size((file1, file2))
+        swapped = build_file != file1
+        # are the numbers which are only in the probe file, or only in the
+        # build file, part of the result?
+        probe_only = op in ('union', 'symdiff') or \
+            (op == 'difference' and swapped)
+        build_only = op == 'symdiff' or (op == 'difference' and not swapped)
+
+        reader = reader or utils.FileReader()
+        # the numbers the probe file found take the share of the result set
+        # when they are kept, a result passed in then takes its own memory
+        # from the read buffer
+        sized_result = None if result is None or build_only else \
+            result.memory
+        (
+            build_hash_memory,
+            bloom_memory,
+            result_hash_memory,
+            block_size_memory
+        ) = Hash.determine_memory(
+            build_file, probe_file, mem_limit, reader=reader,
+            result_memory=sized_result, **config
+        )
+
+        budget = budget or MemoryBudget(mem_limit)
+        if result is not None:
+            budget.reserve('result', result.memory)
+            if sized_result is None:
+                block_size_memory = max(block_size_memory - result.memory,
+                                        c.MIN_READ_SIZE * c.PARSE_OVERHEAD)
+
+        bloom = None
+        if bloom_memory:
+            bloom = BloomFilter(reader.estimate_count(build_file),
+                                bloom_memory)
+        build_hash = SpillableHash(
+            max(SpillableHash.capacity_for(build_hash_memory), 1), budget,
+            'build_hash', bloom=bloom
+        )
+
+        budget.reserve('read_buffer', block_size_memory)
+        block_bytes = block_size_memory // c.PARSE_OVERHEAD
+        # the table is read back in blocks of as many packed values
+        block_size = max(block_bytes // c.SIZE_UINT64, 1)
+
+        for block in reader.blocks(build_file, block_bytes):
+            build_hash.add_many(block)
+
+        spare_memory = result_hash_memory + build_hash.trim()
+        if result is None and build_only:
+            spare_memory //= 2
+        found = None
+        if build_only:
+            found = SpillableHash(
+                SpillableHash.capacity_for(min(spare_memory,
+                                               budget.available)),
+                budget, 'found'
+            )
+        if result is None:
+            result = SpillableHash(
+                SpillableHash.capacity_for(min(spare_memory,
+                                               budget.available)),
+                budget, 'result_hash'
+            )
+
+        for block in reader.blocks(probe_file, block_bytes):
+            hits, misses = build_hash.lookup_many(block)
+            if probe_only:
+                result.add_many(misses)
+            if build_only:
+                found.add_many(hits)
+
+        if op == 'union':
+            for block in build_hash.blocks(block_size):
+                result.add_many(block)
+        elif build_only:
+            for block in build_hash.blocks(block_size):
+                result.add_many(found.lookup_many(block)[1])
+            budget.release('found')
+            budget.release('found.spill')
+
+        for name in ('build_hash', 'build_hash.bloom', 'build_hash.spill',
+                     'read_buffer'):
+            budget.release(name)
+
+        return result
+
+    @staticmethod
+    def intersect_many(files, mem_limit, reader=None, budget=None,
+                       result=None, **config):
+        """Filters the values of the smallest file through every other file,
+        from small to large. A hash is built over the smallest file, then
+        every later file is probed against the values which survived the
+        files before it and the values it finds become the survivors. The
+        survivors only ever shrink, so the larger files probe ever smaller
+        sets.
+        """
+        files = utils.order_by_file_size(files)
+        if len(files) < 3:
+            return Hash.intersect(*files, mem_limit, reader=reader,
+                                  budget=budget, result=result, **config)
+
+        reader = reader or utils.FileReader()
+        # the survivors of the files before the last take the share of the
+        # result set, a result passed in only takes its own memory from the
+        # read buffer
+        (
+            build_hash_memory,
+            bloom_memory,
+            _,
+            block_size_memory
+        ) = Hash.determine_memory(files[0], files[1], mem_limit,
+                                  reader=reader, **config)
+
+        budget = budget or MemoryBudget(mem_limit)
+        if result is not None:
+            budget.reserve('result', result.memory)
+            block_size_memory = max(block_size_memory - result.memory,
+                                    c.MIN_READ_SIZE * c.PARSE_OVERHEAD)
+
+        bloom = None
+        if bloom_memory:
+            bloom = BloomFilter(reader.estimate_count(files[0]), bloom_memory)
+        survivors = SpillableHash(
+            max(SpillableHash.capacity_for(build_hash_memory), 1), budget,
+            'build_hash', bloom=bloom
+        )
+
+        budget.reserve('read_buffer', block_size_memory)
+        block_bytes = block_size_memory // c.PARSE_OVERHEAD
+
+        for block in reader.blocks(files[0], block_bytes):
+            survivors.add_many(block)
+        # the memory the build hash does not use goes to the survivors
+        survivors.trim()
+
+        for idx, file_ in enumerate(files[1:], 1):
+            if idx == len(files) - 1 and result is not None:
+                found = result
+            else:
+                # the survivors of this file are at most the survivors so
+                # far, and get what they need of the memory which is left
+                name = f'survivors_{idx}'
+                found = SpillableHash(max(SpillableHash.capacity_for(min(
+                    Uint64HashSet.memory_for(survivors.cardinality) +
+                    MIN_SPILL_MEMORY,
+                    budget.available
+                )), 1), budget, name)
+
+            for block in reader.blocks(file_, block_bytes):
+                found.add_many(survivors.contains_many(block))
+
+            for suffix in ('', '.bloom', '.spill'):
+                budget.release(survivors.name + suffix)
+            survivors = found
+
+        budget.release('read_buffer')
+
+        return survivors
+
+
+class GraceHash(Strategy):
+    """The grace hash strategy has the following tradeoffs
+
+        * Both files are read once and hash partitioned into binary partition
+        files on disk. Partition pairs are then joined in memory one at a time.
+        The time complexity is O(N) and I/O is sequential: every value is
+        written to disk once and read back once.
+
+        * The amount of partitions is chosen so each partition of the smaller
+        file fits in memory. A partition which is still too large is
+        partitioned again with an independent hash function. Unlike `Hash`,
+        a probe never has to go to disk.
+
+        * Compared to `Hash`, it pays for writing both files to disk even when
+        the smaller file nearly fits in memory.
+    """
+
+    DEFAULT_CONFIG = {
+        # like in `Hash` we only know an estimate of the amount of ints in
+        # file1, which gives the size of its hash table. A partition that
+        # turns out too big is split up again, so there is no need to
+        # overestimate.
+        'line_count_margin': 1,
+
+        # of the memory available for the result set, the in memory build
+        # table and the partition write buffers, what fraction goes to the
+        # result set? The result is upper bounded by the size of a single
+        # partition so it can be smaller than the build table.
+        'result_hash': 2/10,
+
+        # of the memory remaining after the result set what fraction goes
+        # to the build table of a partition?
+        'build_memory_threshold': 6/10,
+
+        # every partition has its own write buffer and file. Past this
+        # fan out a partition is split up recursively instead.
+        'max_partitions': 256,
+
+        # how many times a partition can be split up before giving up and
+        # joining it with a SpillableHash.
+        'max_depth': 4,
+    }
+
+    @staticmethod
+    def partitions_needed(build_size, build_memory):
+        """The smallest power of two amount of partitions s.t. a partition
+        of a `build_size` byte hash table fits in `build_memory`.
+
+        Parameters
+        ----------
+        build_size : int
+            Estimated size in bytes of the full build table
+        build_memory : int
+            Memory in bytes available to the build table of a partition
+
+        Returns
+        ------
+        int
+        """
+        needed = max(int(-(-build_size // max(build_memory, 1))), 1)
+        return 1 << (needed - 1).bit_length()
+
+    @staticmethod
+    def determine_memory(file1, file2, mem_limit, reader=None,
+                         result_memory=None, **config):
+        """Given two files, a memory list and configuration settings
+        determines the amount of partitions and how much memory to allocate to
+        the result set, the build table of a partition and the partition write
+        buffers. `result_memory` is the memory of a result which is not a
+        SpillableHash, if there is one. `reader` estimates the amount of
+        numbers in the files and their overlap.
+        """
+        config = profiles.config_for(GraceHash, file1, mem_limit, config)
+        reader = reader or utils.FileReader()
+
+        file1_lines = reader.stats(file1).lines
+        overlap = estimate.estimate_overlap(reader.stats(file1),
+                                            reader.stats(file2))
+
+        if result_memory is not None:
+            result_hash_memory = result_memory
+        else:
+            result_hash_memory = mem_limit * config['result_hash']
+            if overlap is not None:
+                result_hash_memory = min(
+                    result_hash_memory,
+                    Uint64HashSet.memory_for(
+                        overlap * config['line_count_margin']
+                    ) + MIN_SPILL_MEMORY
+                )
+        remaining_memory = mem_limit - result_hash_memory
+        build_memory = remaining_memory * config['build_memory_threshold']
+        buffer_memory = remaining_memory - build_memory
+
+        n_partitions = min(
+            GraceHash.partitions_needed(
+                Uint64HashSet.memory_for(
+                    file1_lines * config['line_count_margin']
+                ), build_memory
+            ),
+            config['max_partitions']
+        )
+
+        return (
+            n_partitions,
+            int(result_hash_memory),
+            int(build_memory),
+            int(buffer_memory),
+        )
+
+    @staticmethod
+    def _partition(blocks, n_partitions, buffer_memory, level, budget):
+        """Writes every value in `blocks` to a new `PartitionedStore`
+
+        Parameters
+        ----------
+        blocks : iterable of array of uint64
+        n_partitions : int
+        buffer_memory : int
+            Memory in bytes shared by the write buffers of all partitions
+        level : int
+            Which hash function to partition with
+        budget : MemoryBudget
+
+        Returns
+        ------
+        PartitionedStore
+        """
+        buffer_size = max(buffer_memory // (n_partitions * c.SIZE_UINT64), 1)
+        store = PartitionedStore(n_partitions, buffer_size, level=level)
+        store.resize_buffers(buffer_memory)
+        budget.reserve(f'partition_buffers.{level}', store.buffer_memory)
+        for block in blocks:
+            store.add_many(block)
+        store.close()
+        budget.release(f'partition_buffers.{level}')
+        return store
+
+    @staticmethod
+    def _join(store1, store2, result, build_memory, buffer_memory,
+              depth, config, budget):
+        """Joins every partition pair of `store1` and `store2`, adding
+        intersecting values to `result`. Partitions of `store1` which do
+        not fit in `build_memory` are partitioned again.
+
+        The buffer memory is split between reading a partition and the write
+        buffers of its sub partitions. While reading, the previous block is
+        still alive when the next one is read.
+        """
+        budget.reserve(f'partition_read_buffer.{depth}', buffer_memory // 2)
+        block_size = max(buffer_memory // (4 * c.SIZE_UINT64), 1)
+        build_capacity = max(SpillableHash.capacity_for(build_memory), 1)
+        build_hash = None
+
+        for idx in range(store1.n_partitions):
+
+            if not store1.counts[idx] or not store2.counts[idx]:
+                continue
+
+            build_blocks = store1.read_partition(idx, block_size)
+            probe_blocks = store2.read_partition(idx, block_size)
+
+            if store1.counts[idx] > build_capacity and \
+                    depth < config['max_depth']:
+
+                n_partitions = min(
+                    GraceHash.partitions_needed(
+                        Uint64HashSet.memory_for(store1.counts[idx]),
+                        build_memory
+                    ),
+                    config['max_partitions']
+                )
+                # the build hash of an earlier partition is dropped, so the
+                # sub partitions get all of the memory. The next partition
+                # which is not split reserves a new one.
+                build_hash = None
+                budget.release(f'build_hash.{depth}')
+                budget.release(f'build_hash.{depth}.spill')
+
+                sub_store1 = GraceHash._partition(
+                    build_blocks, n_partitions, buffer_memory // 2,
+                    depth + 1, budget
+                )
+                sub_store2 = GraceHash._partition(
+                    probe_blocks, n_partitions, buffer_memory // 2,
+                    depth + 1, budget
+                )
+                GraceHash._join(
+                    sub_store1, sub_store2, result, build_memory,
+                    buffer_memory // 2, depth + 1, config, budget
+                )
+                sub_store1.cleanup()
+                sub_store2.cleanup()
+                continue
+
+            # when the partition is still too large after `max_depth`
+            # splits the build hash spills
+            build_hash = SpillableHash(build_capacity, budget,
+                                       f'build_hash.{depth}',
+                                       size_hint=store1.counts[idx])
+            for block in build_blocks:
+                build_hash.add_many(block)
+
+            for block in probe_blocks:
+                result.add_many(build_hash.contains_many(block))
+
+        budget.release(f'build_hash.{depth}')
+        budget.release(f'build_hash.{depth}.spill')
+        budget.release(f'partition_read_buffer.{depth}')
+
+    @staticmethod
+    @utils.reorder_by_file_size
+    def intersect(file1, file2, mem_limit, reader=None, budget=None,
+                  result=None, **config):
+        """Hash partitions both files into partition files on disk and joins
+        each pair of partitions in memory.
+        """
+        config = profiles.config_for(GraceHash, file1, mem_limit, config)
+        reader = reader or utils.FileReader()
+
+        (
+            n_partitions,
+            result_hash_memory,
+            build_memory,
+            buffer_memory,
+        ) = GraceHash.determine_memory(
+            file1, file2, mem_limit,
+            reader=reader,
+            result_memory=None if result is None else result.memory,
+            **config
+        )
+
+        # while partitioning the memory of the build table is not used yet
+        # so it is given to the reader
+        budget = budget or MemoryBudget(mem_limit)
+        if result is not None:
+            budget.reserve('result', result_hash_memory)
+
+        budget.reserve('read_buffer', build_memory)
+        block_bytes = build_memory // c.PARSE_OVERHEAD
+
+        store1 = GraceHash._partition(
+            reader.blocks(file1, block_bytes),
+            n_partitions, buffer_memory, 0, budget
+        )
+        store2 = GraceHash._partition(
+            reader.blocks(file2, block_bytes),
+            n_partitions, buffer_memory, 0, budget
+        )
+        budget.release('read_buffer')
+
+        if result is None:
+            result = SpillableHash(
+                max(SpillableHash.capacity_for(result_hash_memory), 1),
+                budget, 'result_hash'
+            )
+
+        GraceHash._join(
+            store1, store2, result, build_memory, buffer_memory, 0,
+            config, budget
+        )
+        store1.cleanup()
+        store2.cleanup()
+
+        return result
 
 
 class Merge(Strategy):
     """The merge strategy has the following tradeoffs
 
         * The time complexity join is O(nln(n)). It needs to sort the file in
-        chunks and write those files to disk as preprocessing. However, doing
+        chunks and write those chunks to disk as preprocessing. However, doing
         this work upfront lets us handle arbitrarily large files in managable
         pieces at a time.
 
@@ -172,63 +818,133 @@ class Merge(Strategy):
         and where one file is not signifacantly smaller than the other, this
         seems like the better choice.
     """
+    multiway = True
+    operations = c.SET_OPERATIONS
 
     DEFAULT_CONFIG = {
-        # we do not know how many ints are in the smaller of the two lists
-        # let's do a rough estimate based on its file size of the smaller file
-        # if we overshoot oh well.
-        'result_hash_factor': 4,
-        'result_hash_threshold': (6/10)
+        # we do not know how many ints are in both lists. The result set gets
+        # room for this many times the estimated overlap, or the estimated
+        # amount of ints of the smaller file if the overlap is unknown. If we
+        # overshoot oh well.
+        'line_count_margin': 11/10,
+        'result_hash_threshold': (6/10),
+        # runs are delta encoded, which makes them smaller and lets the merge
+        # skip whole frames, at the cost of encoding and decoding them
+        'delta_runs': True,
     }
 
+    # fraction of the run memory used to read the file while sorting runs
+    RUN_READ_MEMORY = 1/8
+
     @staticmethod
-    def external_sort(file_, bytes_block_size):
-        """ Leverage unix `sort` to external sort the file to an output
-        `bytes_block_size` bytes at a time.
+    def external_sort(file_, run_memory, reader=None, budget=None,
+                      block_memory=None, delta=False, bloom=None):
+        """Splits the file into runs of `run_memory` bytes, sorts each run in
+        memory and writes it to disk as packed uint64s, or delta encoded if
+        `delta` is set. The runs are merged lazily with
+        `external_sort.merge_runs`.
 
         Parameters
         ----------
         file_: str
             the path to file
 
-        bytes_block_size: int
-            memory limit (in bytes)
+        run_memory: int
+            memory limit (in bytes) for sorting a single run
+
+        reader: FileReader, optional
+            reads blocks of numbers from the file
+
+        budget: MemoryBudget, optional
+            the run memory is reserved from the budget while sorting
+
+        block_memory: int, optional
+            memory the runs are merged with. Frames of delta encoded runs
+            are sized for a frame of every run to fit in it.
+
+        delta: bool, optional
+            delta encode the runs, see `external_sort.SortedRuns`
+
+        bloom: BloomFilter, optional
+            only the values which pass the filter are sorted
 
         Returns
         ------
-        TemporaryFile
+        SortedRuns
         """
+        reader = reader or utils.FileReader()
+        budget = budget or MemoryBudget(run_memory)
 
-        f = tempfile.NamedTemporaryFile()
+        # a run is held as packed values and sorted as a list of ints
+        read_memory = run_memory * Merge.RUN_READ_MEMORY
+        run_size = max(
+            int((run_memory - read_memory) // c.SORT_ELEMENT_SIZE), 1
+        )
 
-        cmd = [
-            'sort', '-n', '-o', f.name, '-S', f'{bytes_block_size}b',
-            '-u', file_
-        ]
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        result, err = p.communicate()
-        if p.returncode != 0:
-            raise IOError(err)
+        frame_size = c.DELTA_FRAME_SIZE
+        if block_memory is not None:
+            n_runs = -(-reader.stats(file_).lines // run_size)
+            frame_size = Merge.block_size(block_memory, n_runs, delta)
+
+        blocks = reader.blocks(file_, read_memory // c.PARSE_OVERHEAD)
+        if bloom is not None:
+            blocks = map(bloom.contains_many, blocks)
 
-        return f
+        budget.reserve('sort_run', run_memory)
+        runs = external_sort.write_runs(
+            blocks, run_size, delta, min(frame_size, c.DELTA_FRAME_SIZE)
+        )
+        budget.release('sort_run')
+
+        return runs
 
     @staticmethod
-    def determine_memory(file1, file2, mem_limit, **config):
-        """Given two files, a memory list and configuration settings
-        determines how much memeory to allocate to the SpillableHashes
-        result set and for the `block_size` read for each file
-        """
-        if not config:
-            config = Merge.DEFAULT_CONFIG
+    def block_size(block_memory, n_runs, delta=False):
+        """Returns the amount of values every one of `n_runs` runs reads at
+        a time when they are merged within `block_memory`. Besides a block
+        per run, there is one for when a run reads its next block and one
+        for the ints and generators held by the merge heap. A delta encoded
+        run also buffers its encoded bytes.
 
-        init_read_memory = mem_limit
-        file1_size = os.path.getsize(file1)
+        Returns
+        ------
+        int
+        """
+        value_memory = (2 if delta else 1) * c.SIZE_UINT64
+        return max(int(block_memory // ((n_runs + 2) * value_memory)), 1)
 
-        result_hash_memory = min(
-            mem_limit * config['result_hash_threshold'],
-            file1_size * config['result_hash_factor']
-        )
+    @staticmethod
+    def determine_memory(file1, file2, mem_limit, reader=None,
+                         result_memory=None, **config):
+        """Given two files, a memory list and configuration settings
+        determines how much memeory to allocate to sorting runs, the
+        SpillableHashes result set and for the read buffers of each file while
+        merging. `result_memory` is the memory of a result which is not a
+        SpillableHash, if there is one. `reader` estimates the amount of
+        numbers in the files and their overlap.
+        """
+        config = profiles.config_for(Merge, file1, mem_limit, config)
+        reader = reader or utils.FileReader()
+
+        if result_memory is None:
+            expected = estimate.estimate_overlap(reader.stats(file1),
+                                                 reader.stats(file2))
+            if expected is None:
+                expected = reader.stats(file1).lines
+
+            # runs are sorted before the result set holds any values so they
+            # can use all of the memory
+            run_memory = mem_limit
+            result_hash_memory = min(
+                mem_limit * config['result_hash_threshold'],
+                Uint64HashSet.memory_for(
+                    expected * config['line_count_margin']
+                ) + MIN_SPILL_MEMORY
+            )
+        else:
+            # a result passed in is alive while the runs are sorted
+            run_memory = mem_limit - result_memory
+            result_hash_memory = result_memory
 
         rest_memory = mem_limit - result_hash_memory
 
@@ -236,7 +952,7 @@ class Merge(Strategy):
         file1_block_memory = file2_block_memory = rest_memory // 2
 
         return (
-            int(init_read_memory),
+            int(run_memory),
             int(result_hash_memory),
             int(file1_block_memory),
             int(file2_block_memory),
@@ -244,63 +960,1082 @@ class Merge(Strategy):
 
     @staticmethod
     @utils.reorder_by_file_size
-    def intersect(file1, file2, mem_limit, **config):
-        """Sort both files using the linux `sort` command which performs
-        external sort. Once both files are sorted, use two pointers to walk
-        through both files and find identical elements.
+    def intersect(file1, file2, mem_limit, reader=None, budget=None,
+                  result=None, **config):
+        """Sort both files into sorted runs on disk. The runs of each file are
+        k-way merged into an ascending stream of values and two pointers walk
+        through both streams to find identical elements. The stream which is
+        behind skips to the other's value, with its runs galloping past the
+        values in between, so a much larger file is mostly skipped over
+        rather than walked. The fully sorted files are never written to
+        disk.
         """
+        return Merge.combine(file1, file2, mem_limit, 'intersect',
+                             reader=reader, budget=budget, result=result,
+                             **config)
+
+    @staticmethod
+    def combine(file1, file2, mem_limit, op='intersect', reader=None,
+                budget=None, result=None, **config):
+        """Walks through the merged streams of both files like `intersect`.
+        A value is added to the result on the branches `op` asks for: when
+        both streams agree on it, or when one stream is behind the other and
+        the value is only in its file. A stream which is behind and whose
+        values are not added skips ahead to the other.
+        """
+        if op not in Merge.operations:
+            raise ValueError(f'Merge does not run {op}.')
+        # which of the values in both files, only in file1 and only in
+        # file2 are part of the result?
+        both = op in ('intersect', 'union')
+        first_only = op != 'intersect'
+        second_only = op in ('union', 'symdiff')
+
+        reader = reader or utils.FileReader()
+        # memory is split by the smaller file like for an intersection
+        small_file, large_file = utils.order_by_file_size((file1, file2))
+        delta = profiles.config_for(Merge, small_file, mem_limit,
+                                    config)['delta_runs']
+
         (
-            init_read_memory,
+            run_memory,
             result_hash_memory,
             file1_block_memory,
             file2_block_memory,
-        ) = Merge.determine_memory(file1, file2, mem_limit, **config)
+        ) = Merge.determine_memory(
+            small_file, large_file, mem_limit,
+            reader=reader,
+            result_memory=None if result is None else result.memory,
+            **config
+        )
 
-        tempfile1 = Merge.external_sort(file1, init_read_memory)
-        tempfile2 = Merge.external_sort(file2, init_read_memory)
+        budget = budget or MemoryBudget(mem_limit)
+        if result is not None:
+            budget.reserve('result', result_hash_memory)
+
+        runs1 = Merge.external_sort(file1, run_memory, reader, budget,
+                                    file1_block_memory, delta)
+        runs2 = Merge.external_sort(file2, run_memory, reader, budget,
+                                    file2_block_memory, delta)
+
+        if result is None:
+            result_hash_int_capacity = SpillableHash.capacity_for(
+                result_hash_memory
+            )
+            result = SpillableHash(result_hash_int_capacity, budget,
+                                   'result_hash')
+        budget.reserve('merge_buffers',
+                       file1_block_memory + file2_block_memory)
+
+        # the block memory of a file is shared by all of its runs
+        block1_size = Merge.block_size(file1_block_memory, len(runs1.paths),
+                                       delta)
+        block2_size = Merge.block_size(file2_block_memory, len(runs2.paths),
+                                       delta)
+
+        file1_generator = external_sort.merge_runs(runs1.paths, block1_size,
+                                                   delta)
+        file2_generator = external_sort.merge_runs(runs2.paths, block2_size,
+                                                   delta)
+
+        block1_value = next(file1_generator, None)
+        block2_value = next(file2_generator, None)
+
+        # a stream which is behind and whose values are not added skips
+        # ahead to the other, passing over whole blocks and frames of its
+        # runs, see `merge_runs`
+        while block1_value is not None and block2_value is not None:
 
-        result_hash_int_capacity = result_hash_memory // c.SIZE_INT
+            if block1_value == block2_value:
+                if both:
+                    result.add(block1_value)
+                block1_value = next(file1_generator, None)
+                block2_value = next(file2_generator, None)
+            elif block1_value < block2_value:
+                if first_only:
+                    result.add(block1_value)
+                    block1_value = next(file1_generator, None)
+                else:
+                    block1_value = external_sort.skip_to(file1_generator,
+                                                         block2_value)
+            elif second_only:
+                result.add(block2_value)
+                block2_value = next(file2_generator, None)
+            else:
+                block2_value = external_sort.skip_to(file2_generator,
+                                                     block1_value)
 
-        result_hash = SpillableHash(result_hash_int_capacity)
+        # the values left in a stream are only in its file
+        if first_only and block1_value is not None:
+            result.add(block1_value)
+            for value in file1_generator:
+                result.add(value)
+        if second_only and block2_value is not None:
+            result.add(block2_value)
+            for value in file2_generator:
+                result.add(value)
 
-        block1_size = file1_block_memory // c.LARGEST_ELEMENT_SIZE
-        block2_size = file2_block_memory // c.LARGEST_ELEMENT_SIZE
+        runs1.cleanup()
+        runs2.cleanup()
+        budget.release('merge_buffers')
 
-        file1_generator = utils.read_file_by_block(tempfile1.name, block1_size)
-        file2_generator = utils.read_file_by_block(tempfile2.name, block2_size)
+        return result
 
-        block1_pointer = 0
-        block2_pointer = 0
+    @staticmethod
+    def intersect_many(files, mem_limit, reader=None, budget=None,
+                       result=None, **config):
+        """Sorts every file into sorted runs on disk and joins the merged
+        streams of all of them at once. The streams leapfrog: every stream
+        which is behind the largest current value skips to it, see
+        `external_sort.merge_runs`, until all of them agree on a value which
+        is then in every file.
+        """
+        files = utils.order_by_file_size(files)
+        if len(files) < 3:
+            return Merge.intersect(*files, mem_limit, reader=reader,
+                                   budget=budget, result=result, **config)
 
-        block1 = next(file1_generator)
-        block2 = next(file2_generator)
+        reader = reader or utils.FileReader()
+        delta = profiles.config_for(Merge, files[0], mem_limit,
+                                    config)['delta_runs']
 
-        while True:
+        (
+            run_memory,
+            result_hash_memory,
+            file1_block_memory,
+            file2_block_memory,
+        ) = Merge.determine_memory(
+            files[0], files[1], mem_limit,
+            reader=reader,
+            result_memory=None if result is None else result.memory,
+            **config
+        )
+        # the read buffers of two files are shared by all of them
+        block_memory = (file1_block_memory + file2_block_memory) // len(files)
 
-            if block1_pointer == len(block1):
-                block1_pointer = 0
-                try:
-                    block1 = next(file1_generator)
-                except StopIteration:
-                    break
+        budget = budget or MemoryBudget(mem_limit)
+        if result is not None:
+            budget.reserve('result', result_hash_memory)
 
-            if block2_pointer == len(block2):
-                block2_pointer = 0
-                try:
-                    block2 = next(file2_generator)
-                except StopIteration:
-                    break
+        all_runs = [
+            Merge.external_sort(file_, run_memory, reader, budget,
+                                block_memory, delta)
+            for file_ in files
+        ]
 
-            block1_value = block1[block1_pointer]
-            block2_value = block2[block2_pointer]
+        if result is None:
+            result = SpillableHash(
+                SpillableHash.capacity_for(result_hash_memory), budget,
+                'result_hash'
+            )
+        budget.reserve('merge_buffers', block_memory * len(files))
+
+        streams = [
+            external_sort.merge_runs(
+                runs.paths,
+                Merge.block_size(block_memory, len(runs.paths), delta),
+                delta
+            )
+            for runs in all_runs
+        ]
 
-            if block1_value == block2_value:
-                result_hash.add(block1_value)
-                block1_pointer += 1
-                block2_pointer += 1
-            elif block1_value < block2_value:
-                block1_pointer += 1
+        values = [next(stream, None) for stream in streams]
+        while None not in values:
+            high = max(values)
+            if min(values) == high:
+                result.add(high)
+                values = [next(stream, None) for stream in streams]
             else:
-                block2_pointer += 1
+                values = [
+                    value if value == high
+                    else external_sort.skip_to(stream, high)
+                    for value, stream in zip(values, streams)
+                ]
+
+        for runs in all_runs:
+            runs.cleanup()
+        budget.release('merge_buffers')
+
+        return result
+
+
+class Radix(Strategy):
+    """The radix strategy has the following tradeoffs
+
+        * Both files are read once and range partitioned into partition
+        files by the high bits of their values, see `RangePartitionedStore`.
+        Aligned partitions of the two files hold the same range of values, so
+        every pair is intersected on its own: the partition of the smaller
+        file is read into a set and the partition of the larger file is
+        streamed against it. I/O is sequential and there is no global sort.
+
+        * Unlike `GraceHash` nothing is hashed while partitioning and a pair
+        of partitions is a natural unit of work for a worker. But the
+        partitions are only about even when the values are spread evenly
+        over the sampled range of the smaller file. A partition which turns
+        out too large is split up by range again.
+    """
+
+    DEFAULT_CONFIG = {
+        # like in `GraceHash`, the amount of ints in file1 is estimated, and
+        # a partition that turns out too big is split up again
+        'line_count_margin': 1,
+
+        # of the memory available for the result set, the set of a partition
+        # and the partition write buffers, what fraction goes to the result
+        # set? The result is upper bounded by the size of a single partition.
+        'result_hash': 2/10,
+
+        # of the memory remaining after the result set what fraction goes
+        # to the set of a partition?
+        'join_memory_threshold': 6/10,
+
+        # every partition has its own write buffer and file. Past this fan
+        # out a partition is split up recursively instead.
+        'max_partitions': 256,
+    }
+
+    @staticmethod
+    def determine_memory(file1, file2, mem_limit, reader=None,
+                         result_memory=None, **config):
+        """Given two files, a memory limit and configuration settings
+        determines the amount of partitions and how much memory to allocate to
+        the result set, the set of a partition and the partition write
+        buffers. `result_memory` is the memory of a result which is not a
+        SpillableHash, if there is one. `reader` estimates the amount of
+        numbers in the files and their overlap.
+        """
+        config = profiles.config_for(Radix, file1, mem_limit, config)
+        reader = reader or utils.FileReader()
+
+        stats1 = reader.stats(file1)
+        overlap = estimate.estimate_overlap(stats1, reader.stats(file2))
+
+        if result_memory is not None:
+            result_hash_memory = result_memory
+        else:
+            result_hash_memory = mem_limit * config['result_hash']
+            if overlap is not None:
+                result_hash_memory = min(
+                    result_hash_memory,
+                    Uint64HashSet.memory_for(
+                        overlap * config['line_count_margin']
+                    ) + MIN_SPILL_MEMORY
+                )
+        remaining_memory = mem_limit - result_hash_memory
+        join_memory = remaining_memory * config['join_memory_threshold']
+        buffer_memory = remaining_memory - join_memory
+
+        n_partitions = min(
+            GraceHash.partitions_needed(
+                stats1.lines * config['line_count_margin'] *
+                c.SET_ELEMENT_SIZE, join_memory
+            ),
+            config['max_partitions']
+        )
+
+        return (
+            n_partitions,
+            int(result_hash_memory),
+            int(join_memory),
+            int(buffer_memory),
+        )
+
+    @staticmethod
+    def _partition(blocks, low, high, n_partitions, buffer_memory, depth,
+                   budget):
+        """Writes every value in `blocks` to a new `RangePartitionedStore`
+        of [`low`, `high`).
+
+        Returns
+        ------
+        RangePartitionedStore
+        """
+        buffer_size = max(buffer_memory // (n_partitions * c.SIZE_UINT64), 1)
+        store = RangePartitionedStore(low, high, n_partitions, buffer_size)
+        store.resize_buffers(buffer_memory)
+        budget.reserve(f'partition_buffers.{depth}', store.buffer_memory)
+        for block in blocks:
+            store.add_many(block)
+        store.close()
+        budget.release(f'partition_buffers.{depth}')
+        return store
+
+    @staticmethod
+    def _join(store1, store2, result, join_memory, buffer_memory, depth,
+              config, budget):
+        """Intersects every partition pair of `store1` and `store2`, adding
+        intersecting values to `result`. Partitions of `store1` whose set
+        does not fit in `join_memory` are partitioned again by range. As the
+        ranges shrink with every split, a partition fits eventually.
+
+        The buffer memory is split between reading a partition and the write
+        buffers of its sub partitions, like in `GraceHash._join`.
+        """
+        budget.reserve(f'partition_read_buffer.{depth}', buffer_memory // 2)
+        block_size = max(buffer_memory // (4 * c.SIZE_UINT64), 1)
+        join_capacity = max(int(join_memory // c.SET_ELEMENT_SIZE), 1)
+
+        for idx in range(store1.n_partitions):
+
+            if not store1.counts[idx] or not store2.counts[idx]:
+                continue
+
+            build_blocks = store1.read_partition(idx, block_size)
+            probe_blocks = store2.read_partition(idx, block_size)
+
+            if store1.counts[idx] > join_capacity:
+                low, high = store1.bounds(idx)
+                n_partitions = min(
+                    GraceHash.partitions_needed(
+                        store1.counts[idx] * c.SET_ELEMENT_SIZE, join_memory
+                    ),
+                    config['max_partitions']
+                )
+                sub_store1 = Radix._partition(
+                    build_blocks, low, high, n_partitions,
+                    buffer_memory // 2, depth + 1, budget
+                )
+                sub_store2 = Radix._partition(
+                    probe_blocks, low, high, n_partitions,
+                    buffer_memory // 2, depth + 1, budget
+                )
+                Radix._join(
+                    sub_store1, sub_store2, result, join_memory,
+                    buffer_memory // 2, depth + 1, config, budget
+                )
+                sub_store1.cleanup()
+                sub_store2.cleanup()
+                continue
+
+            budget.reserve(f'join_set.{depth}',
+                           store1.counts[idx] * c.SET_ELEMENT_SIZE)
+            values = set()
+            for block in build_blocks:
+                values.update(block)
+
+            for block in probe_blocks:
+                result.add_many(array('Q', values.intersection(block)))
+
+            del values
+            budget.release(f'join_set.{depth}')
+
+        budget.release(f'partition_read_buffer.{depth}')
+
+    @staticmethod
+    @utils.reorder_by_file_size
+    def intersect(file1, file2, mem_limit, reader=None, budget=None,
+                  result=None, **config):
+        """Range partitions both files into partition files on disk over the
+        sampled range of the smaller file and intersects each pair of
+        aligned partitions in memory.
+        """
+        config = profiles.config_for(Radix, file1, mem_limit, config)
+        reader = reader or utils.FileReader()
+
+        (
+            n_partitions,
+            result_hash_memory,
+            join_memory,
+            buffer_memory,
+        ) = Radix.determine_memory(
+            file1, file2, mem_limit,
+            reader=reader,
+            result_memory=None if result is None else result.memory,
+            **config
+        )
+
+        # values outside of the sampled range go to the outer partitions
+        stats1 = reader.stats(file1)
+        low = stats1.low or 0
+        high = c.MAX_NUMBER if stats1.high is None else stats1.high + 1
+
+        # while partitioning the memory of the sets is not used yet so it is
+        # given to the reader
+        budget = budget or MemoryBudget(mem_limit)
+        if result is not None:
+            budget.reserve('result', result_hash_memory)
+
+        budget.reserve('read_buffer', join_memory)
+        block_bytes = join_memory // c.PARSE_OVERHEAD
+
+        store1 = Radix._partition(
+            reader.blocks(file1, block_bytes), low, high, n_partitions,
+            buffer_memory, 0, budget
+        )
+        store2 = Radix._partition(
+            reader.blocks(file2, block_bytes), low, high, n_partitions,
+            buffer_memory, 0, budget
+        )
+        budget.release('read_buffer')
+
+        if result is None:
+            result = SpillableHash(
+                max(SpillableHash.capacity_for(result_hash_memory), 1),
+                budget, 'result_hash'
+            )
+
+        Radix._join(
+            store1, store2, result, join_memory, buffer_memory, 0, config,
+            budget
+        )
+        store1.cleanup()
+        store2.cleanup()
+
+        return result
+
+
+class Bitmap(Strategy):
+    """The bitmap strategy has the following tradeoffs
+
+        * Both files are read into `ChunkedBitmap`s, a bit per value in
+        chunks of 2^16 values which are only allocated where there are
+        values. The bitmaps are intersected with a word wise AND of their
+        chunks, which also yields the result in ascending order. Nothing is
+        hashed and nothing is written to disk.
+
+        * A chunk takes 8KB however few values it holds, so this only pays
+        off for values in dense, or a few dense clusters of, ranges. When
+        the chunks of the smaller file do not fit in memory, its range of
+        chunks is split into windows which are intersected one at a time,
+        each reading both files once more. Sparse ranges, or ranges which
+        take too many windows, are left to the other strategies.
+    """
+
+    DEFAULT_CONFIG = {
+        # the range of the smaller file is sampled, see `estimate.FileStats`,
+        # so it may take a few more chunks than its sampled range holds
+        'chunk_count_margin': 5/4,
+
+        # like in `Merge`, the result set gets room for this many times the
+        # estimated overlap, but at most this fraction of the memory
+        'line_count_margin': 11/10,
+        'result_hash_threshold': 4/10,
+
+        # of the memory left after the result set, this fraction goes to the
+        # read buffer. A bigger buffer does not read any faster.
+        'read_buffer_threshold': 1/4,
+
+        # a chunk takes as much memory as a hash set of about 700 values.
+        # When the chunks do not fit, a range with fewer sampled values per
+        # chunk than this, or one which takes more windows than this, is not
+        # run, see `determine_memory`.
+        'min_chunk_density': 512,
+        'max_windows': 32,
+    }
+
+    @staticmethod
+    def determine_memory(file1, file2, mem_limit, reader=None,
+                         result_memory=None, **config):
+        """Given two files, a memory limit and configuration settings
+        determines the amount of windows the range of the smaller file is
+        split into and how much memory to allocate to the bitmaps of a
+        window, the SpillableHashes result set and the read buffer.
+        `result_memory` is the memory of a result which is not a
+        SpillableHash, if there is one. `reader` estimates the range of the
+        files and their overlap.
+
+        The amount of windows is infinite when the range of the smaller file
+        is too sparse for its bitmaps to be worth reading both files once per
+        window, so the cost model never picks Bitmap then.
+        """
+        config = profiles.config_for(Bitmap, file1, mem_limit, config)
+        reader = reader or utils.FileReader()
+
+        stats1 = reader.stats(file1)
+        if result_memory is None:
+            expected = estimate.estimate_overlap(stats1, reader.stats(file2))
+            if expected is None:
+                expected = stats1.lines
+            result_hash_memory = min(
+                mem_limit * config['result_hash_threshold'],
+                Uint64HashSet.memory_for(
+                    expected * config['line_count_margin']
+                ) + MIN_SPILL_MEMORY
+            )
+        else:
+            result_hash_memory = result_memory
+
+        rest_memory = mem_limit - result_hash_memory
+        block_size_memory = min(rest_memory * config['read_buffer_threshold'],
+                                c.READ_BUFFER_SIZE * c.PARSE_OVERHEAD)
+        bitmap_memory = rest_memory - block_size_memory
+
+        # without a sampled range every value may take a chunk
+        chunks, density = stats1.lines, 1
+        if stats1.low is not None:
+            chunks = ChunkedBitmap.chunks_for(
+                stats1.low, stats1.high, stats1.lines
+            )
+            density = stats1.lines / max(chunks, 1)
+            chunks *= config['chunk_count_margin']
+        # the bitmap of file2 only holds the chunks of the bitmap of file1
+        n_windows = max(
+            math.ceil(2 * chunks * CHUNK_MEMORY / bitmap_memory), 1
+        )
+        if n_windows > config['max_windows'] or \
+                (n_windows > 1 and density < config['min_chunk_density']):
+            n_windows = math.inf
+
+        return (
+            n_windows,
+            int(bitmap_memory),
+            int(result_hash_memory),
+            int(block_size_memory),
+        )
+
+    @staticmethod
+    def windows(stats, n_windows):
+        """Splits the chunk keys of the sampled range of a file into
+        `n_windows` windows of about as many keys. The first and the last
+        window are open ended, since the range is sampled.
+
+        Parameters
+        ----------
+        stats : FileStats
+        n_windows : int
+
+        Returns
+        ------
+        list of (int, int U float)
+            [low, high) chunk keys of every window
+        """
+        if n_windows == 1 or not stats.lines:
+            return [(0, float('inf'))]
+
+        low_key = ChunkedBitmap.key_of(stats.low)
+        width = (ChunkedBitmap.key_of(stats.high) - low_key + 1) / n_windows
+        bounds = [0] + [
+            low_key + math.ceil(width * idx) for idx in range(1, n_windows)
+        ] + [float('inf')]
+        return list(zip(bounds, bounds[1:]))
+
+    @staticmethod
+    @utils.reorder_by_file_size
+    def intersect(file1, file2, mem_limit, reader=None, budget=None,
+                  result=None, **config):
+        """Reads the values of the smaller file in a window of its range into
+        a bitmap, then the values of the larger file which fall in the
+        chunks of that bitmap into another one, and ANDs the two. Repeats
+        for every window.
+        """
+        reader = reader or utils.FileReader()
+        (
+            n_windows,
+            bitmap_memory,
+            result_hash_memory,
+            block_size_memory,
+        ) = Bitmap.determine_memory(
+            file1, file2, mem_limit,
+            reader=reader,
+            result_memory=None if result is None else result.memory,
+            **config
+        )
+        if math.isinf(n_windows):
+            raise ValueError('The values are too sparse for a bitmap, their '
+                             'chunks take too many windows.')
+
+        budget = budget or MemoryBudget(mem_limit)
+        if result is None:
+            result = SpillableHash(
+                SpillableHash.capacity_for(result_hash_memory), budget,
+                'result_hash'
+            )
+        else:
+            budget.reserve('result', result_hash_memory)
+
+        budget.reserve('bitmaps', bitmap_memory)
+        budget.reserve('read_buffer', block_size_memory)
+        block_bytes = block_size_memory // c.PARSE_OVERHEAD
+
+        for low_key, high_key in Bitmap.windows(reader.stats(file1),
+                                                n_windows):
+            bitmap1 = ChunkedBitmap(low_key, high_key)
+            for block in reader.blocks(file1, block_bytes):
+                bitmap1.add_many(block)
+
+            bitmap2 = bitmap1.like()
+            for block in reader.blocks(file2, block_bytes):
+                bitmap2.add_many(block)
+
+            for values in bitmap1.intersection(bitmap2):
+                result.add_many(values)
+
+        budget.release('bitmaps')
+        budget.release('read_buffer')
+
+        return result
+
+
+class Indexed(Strategy):
+    """The indexed strategy has the following tradeoffs
+
+        * One file is an `index.Index`, built once by `index.build` and
+        reused for every file it is intersected with. Only the other file
+        is read and sorted into runs. Like the streams of `Merge`, its merged
+        runs and the index leapfrog, and the index seeks past whole
+        partitions and frames it is not asked for.
+
+        * The numbers of the other file are checked against the bloom
+        filter of the index before they are sorted, so numbers which are
+        not in the index are mostly never written to disk.
+
+        * Given two plain files it first builds a temporary index of the
+        smaller one, which costs about as much as sorting it for `Merge`.
+        Two indexes are joined without sorting anything.
+    """
+
+    DEFAULT_CONFIG = {
+        # like in `Merge` the result set gets room for this many times the
+        # smaller of the amount of numbers of the index and of the file
+        'line_count_margin': 11/10,
+        'result_hash_threshold': 6/10,
+        # the bloom filter of the index is only read when it takes at most
+        # this fraction of the memory limit
+        'bloom_memory_threshold': 1/4,
+        'delta_runs': True,
+    }
+
+    @staticmethod
+    def determine_memory(index_, file_, mem_limit, reader=None,
+                         result_memory=None, **config):
+        """Given an index, a file, a memory limit and configuration settings
+        determines how much memory to allocate to the bloom filter of the
+        index and to sorting the runs of the file, and then to the result
+        set and the read buffers of the index and of the runs while merging.
+        The filter is only alive while sorting. `result_memory` is the memory
+        of a result which is not a SpillableHash, if there is one.
+
+        `file_` is a path, or an `index.Index` which is read like the first
+        one and not sorted.
+        """
+        is_index = isinstance(file_, Index)
+        path = file_.path if is_index else file_
+        config = profiles.config_for(Indexed, path, mem_limit, config)
+        reader = reader or utils.FileReader()
+
+        bloom_memory = index_.bloom_memory
+        if is_index or \
+                bloom_memory > mem_limit * config['bloom_memory_threshold']:
+            bloom_memory = 0
+        rest_memory = mem_limit - index_.memory
+        if is_index:
+            rest_memory -= file_.memory
+
+        if result_memory is None:
+            lines = file_.count if is_index else reader.stats(file_).lines
+            expected = min(index_.count, lines)
+            # runs are sorted before the result set holds any values
+            run_memory = rest_memory - bloom_memory
+            result_hash_memory = min(
+                rest_memory * config['result_hash_threshold'],
+                Uint64HashSet.memory_for(
+                    expected * config['line_count_margin']
+                ) + MIN_SPILL_MEMORY
+            )
+        else:
+            run_memory = rest_memory - bloom_memory - result_memory
+            result_hash_memory = result_memory
+
+        # an index only reads a block at a time, the runs of a file a block
+        # each
+        block_memory = rest_memory - result_hash_memory
+        index_block_memory = block_memory // (2 if is_index else 4)
+        file_block_memory = block_memory - index_block_memory
+
+        return (
+            int(bloom_memory),
+            int(run_memory),
+            int(result_hash_memory),
+            int(index_block_memory),
+            int(file_block_memory),
+        )
+
+    @staticmethod
+    def intersect(file1, file2, mem_limit, reader=None, budget=None,
+                  result=None, **config):
+        """Intersects an index with a file, either of which can come first.
+        The numbers of the file which pass the bloom filter of the index are
+        sorted into runs, and the merged runs and the index skip ahead to
+        each other until they agree on a number. When neither is an index,
+        one is built over the smaller file in a temporary directory.
+        """
+        if Index.is_index(file2) and not Index.is_index(file1):
+            file1, file2 = file2, file1
+        if not Index.is_index(file1):
+            file1, file2 = utils.order_by_file_size((file1, file2))
+            result_memory = 0 if result is None else result.memory
+            with tempfile.TemporaryDirectory() as dir_:
+                path = os.path.join(dir_, 'index')
+                build_index(file1, path, mem_limit - result_memory,
+                            reader=reader, budget=budget)
+                return Indexed.intersect(path, file2, mem_limit,
+                                         reader=reader, budget=budget,
+                                         result=result, **config)
+
+        reader = reader or utils.FileReader()
+        index1 = Index(file1)
+        index2 = Index(file2) if Index.is_index(file2) else None
+        delta = profiles.config_for(Indexed, file2, mem_limit,
+                                    config)['delta_runs']
+
+        (
+            bloom_memory,
+            run_memory,
+            result_hash_memory,
+            index_block_memory,
+            file_block_memory,
+        ) = Indexed.determine_memory(
+            index1, file2 if index2 is None else index2, mem_limit,
+            reader=reader,
+            result_memory=None if result is None else result.memory,
+            **config
+        )
+
+        budget = budget or MemoryBudget(mem_limit)
+        budget.reserve('index', index1.memory)
+        if index2 is not None:
+            budget.reserve('index2', index2.memory)
+        if result is not None:
+            budget.reserve('result', result_hash_memory)
+
+        runs = None
+        if index2 is None:
+            bloom = None
+            if bloom_memory:
+                budget.reserve('index.bloom', bloom_memory)
+                bloom = index1.bloom()
+            runs = Merge.external_sort(file2, run_memory, reader, budget,
+                                       file_block_memory, delta, bloom)
+            del bloom
+            budget.release('index.bloom')
+
+        if result is None:
+            result = SpillableHash(
+                SpillableHash.capacity_for(result_hash_memory), budget,
+                'result_hash'
+            )
+        budget.reserve('merge_buffers',
+                       index_block_memory + file_block_memory)
+
+        # a block of an index comes with its encoded frames, which are
+        # briefly held twice while the next ones are read
+        stream1 = index1.values(
+            max(index_block_memory // (4 * c.SIZE_UINT64), 1)
+        )
+        if runs is None:
+            stream2 = index2.values(
+                max(file_block_memory // (4 * c.SIZE_UINT64), 1)
+            )
+        else:
+            stream2 = external_sort.merge_runs(
+                runs.paths,
+                Merge.block_size(file_block_memory, len(runs.paths), delta),
+                delta
+            )
+
+        value1 = next(stream1, None)
+        value2 = next(stream2, None)
+        while value1 is not None and value2 is not None:
+            if value1 == value2:
+                result.add(value1)
+                value1 = next(stream1, None)
+                value2 = next(stream2, None)
+            elif value1 < value2:
+                value1 = external_sort.skip_to(stream1, value2)
+            else:
+                value2 = external_sort.skip_to(stream2, value1)
+
+        if runs is not None:
+            runs.cleanup()
+        for name in ('merge_buffers', 'index', 'index2'):
+            budget.release(name)
+
+        return result
+
+
+class Streamed(Strategy):
+    """The streamed strategy has the following tradeoffs
+
+        * Either input, or both, can be a stream: stdin, a named pipe or a
+        binary file object, see `utils.is_stream`. A stream is read once and
+        its size is not known up front, so nothing is sampled or planned
+        from it.
+
+        * A file which is not a stream and is expected to fit in the build
+        table is read into it and the stream probes it, like `Hash`.
+        Otherwise the stream fills the table until it ends or the table is
+        full. If it ends in time the other input probes the table while it
+        is read, and nothing is written to disk.
+
+        * Once the table is full it switches to partitioning, like
+        `GraceHash`: the table and the rest of the stream are hash
+        partitioned to disk, then the other input, and the partition pairs
+        are joined in memory. Only then is anything written to disk, but
+        then both inputs are.
+    """
+
+    DEFAULT_CONFIG = {
+        # like in `Hash` the table only takes a file which is not a stream
+        # if it has room for this many times its estimated amount of numbers
+        'line_count_margin': 11/10,
+
+        # the size of the intersection is not known either, so the result
+        # set gets this fraction of the memory limit
+        'result_hash': 2/10,
+
+        # of the memory remaining after the result set what fraction goes
+        # to the build table? The rest is split between the read buffer and
+        # the partition write buffers.
+        'build_memory_threshold': 6/10,
+
+        # like in `GraceHash`. The size of a stream does not tell how many
+        # partitions it needs, so it is split into the most and a partition
+        # which is still too large is split up again.
+        'max_partitions': 256,
+        'max_depth': 4,
+    }
+
+    @staticmethod
+    def config_for(file1, file2, mem_limit, config=None):
+        """Returns the config of the strategy, see `profiles.config_for`, for
+        the first input which is not a stream. The defaults are used when
+        both are streams.
+
+        Returns
+        ------
+        dict
+        """
+        files = [file_ for file_ in (file1, file2)
+                 if not utils.is_stream(file_)]
+        if files:
+            return profiles.config_for(Streamed, files[0], mem_limit, config)
+        return config or Streamed.DEFAULT_CONFIG
+
+    @staticmethod
+    def determine_memory(file1, file2, mem_limit, reader=None,
+                         result_memory=None, **config):
+        """Given a memory limit and configuration settings determines how
+        much memory to allocate to the result set, the build table, the read
+        buffer and the partition write buffers. None of them depend on the
+        inputs, which may be streams. `result_memory` is the memory of a
+        result which is not a SpillableHash, if there is one.
+        """
+        config = Streamed.config_for(file1, file2, mem_limit, config)
+
+        if result_memory is not None:
+            result_hash_memory = result_memory
+        else:
+            result_hash_memory = mem_limit * config['result_hash']
+        remaining_memory = mem_limit - result_hash_memory
+        build_memory = remaining_memory * config['build_memory_threshold']
+        buffer_memory = remaining_memory - build_memory
+
+        return (
+            int(result_hash_memory),
+            int(build_memory),
+            int(buffer_memory // 2),
+            int(buffer_memory - buffer_memory // 2),
+        )
+
+    @staticmethod
+    def _fill(table, blocks):
+        """Adds the numbers of `blocks` to `table` until it is full.
+
+        Parameters
+        ----------
+        table : Uint64HashSet
+        blocks : iterator of array of uint64
+
+        Returns
+        ------
+        array of uint64 U None
+            The numbers of the block the table filled up on which were not
+            added, None if every number was
+        """
+        for block in blocks:
+            pos = 0
+            while pos < len(block):
+                room = table.max_size - len(table)
+                if not room:
+                    return block[pos:]
+                table.add_many(block[pos:pos + room])
+                pos += room
+        return None
+
+    @staticmethod
+    def intersect(file1, file2, mem_limit, reader=None, budget=None,
+                  result=None, **config):
+        """Reads the first input into a build table and probes it with the
+        second. When the table fills up, the numbers of the first input and
+        then those of the second are hash partitioned to disk instead and
+        the partitions are joined like `GraceHash`. Each input is read once,
+        so either can be a stream.
+        """
+        config = Streamed.config_for(file1, file2, mem_limit, config)
+        reader = reader or utils.FileReader()
+
+        (
+            result_hash_memory,
+            build_memory,
+            read_memory,
+            partition_memory,
+        ) = Streamed.determine_memory(
+            file1, file2, mem_limit, reader=reader,
+            result_memory=None if result is None else result.memory,
+            **config
+        )
+        capacity = max(Uint64HashSet.capacity_for(build_memory), 1)
+
+        # a file which fits is read into the table before a stream, which
+        # then never has to be written to disk. Otherwise the stream goes
+        # first, it may still turn out to fit.
+        stream1, stream2 = utils.is_stream(file1), utils.is_stream(file2)
+        if stream1 != stream2:
+            stream, file_ = (file1, file2) if stream1 else (file2, file1)
+            fits = reader.stats(file_).lines * config['line_count_margin'] \
+                <= capacity
+            file1, file2 = (file_, stream) if fits else (stream, file_)
+        elif not stream1:
+            file1, file2 = utils.order_by_file_size((file1, file2))
+
+        budget = budget or MemoryBudget(mem_limit)
+        if result is not None:
+            budget.reserve('result', result_hash_memory)
+
+        # the table is allocated whole, so it never grows past its memory
+        budget.reserve('build_hash', Uint64HashSet.memory_for(capacity))
+        table = Uint64HashSet(capacity)
+        budget.reserve('read_buffer', read_memory)
+        blocks = reader.blocks(file1, read_memory // c.PARSE_OVERHEAD)
+        rest = Streamed._fill(table, blocks)
+
+        if rest is None:
+            if result is None:
+                result = SpillableHash(
+                    max(SpillableHash.capacity_for(result_hash_memory), 1),
+                    budget, 'result_hash'
+                )
+            for block in reader.blocks(file2,
+                                       read_memory // c.PARSE_OVERHEAD):
+                result.add_many(table.contains_many(block))
+            budget.release('build_hash')
+            budget.release('read_buffer')
+            return result
+
+        logger.info(f'The build table filled up at {len(table)} numbers, '
+                    'partitioning both inputs')
+        store1 = GraceHash._partition(
+            chain((table, rest), blocks), config['max_partitions'],
+            partition_memory, 0, budget
+        )
+        del table, rest
+        budget.release('build_hash')
+
+        # like in `GraceHash` the memory of the table goes to the reader
+        # until the partitions are joined
+        budget.reserve('read_buffer', build_memory)
+        store2 = GraceHash._partition(
+            reader.blocks(file2, build_memory // c.PARSE_OVERHEAD),
+            config['max_partitions'], partition_memory, 0, budget
+        )
+        budget.release('read_buffer')
+
+        if result is None:
+            result = SpillableHash(
+                max(SpillableHash.capacity_for(result_hash_memory), 1),
+                budget, 'result_hash'
+            )
+
+        GraceHash._join(
+            store1, store2, result, build_memory,
+            read_memory + partition_memory, 0, config, budget
+        )
+        store1.cleanup()
+        store2.cleanup()
+
+        return result
+
+
+class Approximate(Strategy):
+    """The approximate strategy has the following tradeoffs
+
+        * Each file is read once, sequentially, into a `KMinValues` sketch of
+        the smallest hashes of its values. Nothing is written to disk and the
+        sketches take a fixed amount of memory, a small part of the limit.
+
+        * The result is an estimate of the cardinality with a standard error,
+        not the intersecting values. The error shrinks with the size of the
+        sketches and grows as the overlap gets small relative to the union of
+        the files: about 1 / sqrt(k * overlap / union) relative to the
+        overlap.
+    """
+
+    exact = False
+
+    DEFAULT_CONFIG = {
+        # hashes kept per file. A relative error of about 1% needs about
+        # 10000 shared hashes, so this is enough for overlaps of more than
+        # about 60% of the union.
+        'sketch_size': 1 << 14,
+
+        # but both sketches together take at most this fraction of the
+        # memory limit
+        'sketch_memory_threshold': 1/4,
+    }
+
+    @staticmethod
+    def determine_memory(file1, file2, mem_limit, **config):
+        """Given the memory limit and configuration settings determines the
+        amount of hashes each sketch keeps and how much memory to allocate to
+        the read buffer.
+        """
+        config = profiles.config_for(Approximate, file1, mem_limit, config)
+
+        sketch_size = max(min(
+            config['sketch_size'],
+            KMinValues.capacity_for(
+                mem_limit * config['sketch_memory_threshold'] / 2
+            )
+        ), 1)
+        sketch_memory = 2 * KMinValues.memory_for(sketch_size)
+
+        # a bigger buffer does not read any faster
+        block_size_memory = min(mem_limit - sketch_memory,
+                                c.READ_BUFFER_SIZE * c.PARSE_OVERHEAD)
+
+        return int(sketch_size), int(block_size_memory)
+
+    @staticmethod
+    def intersect(file1, file2, mem_limit, reader=None, budget=None,
+                  result=None, **config):
+        """Reads both files into sketches and estimates the cardinality of
+        the intersection from the hashes they share, see
+        `KMinValues.intersection`.
+        """
+        if result is not None:
+            raise ValueError('An approximate intersection finds no values '
+                             'to add to a result.')
+
+        reader = reader or utils.FileReader()
+        sketch_size, block_size_memory = Approximate.determine_memory(
+            file1, file2, mem_limit, **config
+        )
+
+        budget = budget or MemoryBudget(mem_limit)
+        budget.reserve('sketches', 2 * KMinValues.memory_for(sketch_size))
+        budget.reserve('read_buffer', block_size_memory)
+        block_bytes = block_size_memory // c.PARSE_OVERHEAD
+
+        sketches = []
+        for file_ in (file1, file2):
+            sketch = KMinValues(sketch_size)
+            for block in reader.blocks(file_, block_bytes):
+                sketch.add_many(block)
+            sketches.append(sketch)
+
+        budget.release('sketches')
+        budget.release('read_buffer')
 
-        return result_hash
+        estimate, error = sketches[0].intersection(sketches[1])
+        return Estimate(int(round(estimate)), error)
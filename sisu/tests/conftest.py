@@ -2,9 +2,20 @@ import os
 import py
 import pytest
 
+import sisu.profiles as profiles
+
 _TEST_DIR = os.path.abspath(os.path.dirname(__file__))
 
 
 @pytest.fixture
 def datadir():
     return py.path.local(os.path.join(_TEST_DIR, 'data'))
+
+
+@pytest.fixture(autouse=True)
+def no_profiles(tmp_path, monkeypatch):
+    # the machine constants and tuned configs saved on this machine would
+    # change which strategy is picked and how it splits its memory
+    monkeypatch.setenv('SISU_MACHINE_PROFILE', str(tmp_path / 'machine.json'))
+    monkeypatch.setenv('SISU_TUNED_PROFILE', str(tmp_path / 'tuned.json'))
+    monkeypatch.setattr(profiles, '_loaded', {})
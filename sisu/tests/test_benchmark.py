@@ -0,0 +1,55 @@
+import json
+
+import sisu.benchmark as benchmark
+import sisu.utils as utils
+
+_SUITE = {
+    'lines': (300,),
+    'ratios': (2,),
+    'overlaps': (0.5,),
+    'budgets': (1,),
+}
+
+
+def test_dataset(tmpdir):
+    file1, file2, expected = benchmark.dataset(str(tmpdir), 300, 2, 0.5)
+
+    nums1, nums2 = utils.read_nums(file1), utils.read_nums(file2)
+    assert len(nums1) == 300
+    assert len(nums2) == 600
+    assert len(nums1 & nums2) == expected == 150
+    assert max(nums1 | nums2) < 1 << 63
+
+
+def test_cases():
+    suite = dict(_SUITE, lines=(50,))
+    cases = list(benchmark.cases(suite))
+    assert {case['strategy'] for case in cases} == set(benchmark.strategies())
+
+    # the chunks of a bitmap do not fit in the budget
+    assert 'Bitmap' not in {case['strategy'] for case in
+                            benchmark.cases(_SUITE)}
+
+    # the files do not fit in the budget
+    suite = dict(_SUITE, lines=(100000,))
+    assert 'Naive' not in {case['strategy'] for case in
+                           benchmark.cases(suite)}
+
+
+def test_run_and_compare(tmpdir):
+    results = benchmark.run(_SUITE, str(tmpdir), ['Hash', 'Merge'],
+                            log=lambda line: None)
+
+    assert len(results) == 2
+    for result in results:
+        assert result['correct']
+        assert result['peak_rss'] > 0
+    json.dumps(results)
+
+    assert not benchmark.compare(results, results)
+
+    slower = [dict(result, wall_time=result['wall_time'] + 1)
+              for result in results]
+    regressions = benchmark.compare(slower, results)
+    assert [regression['metric'] for regression in regressions] == \
+        ['wall_time', 'wall_time']
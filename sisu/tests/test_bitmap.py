@@ -0,0 +1,45 @@
+from array import array
+
+from sisu.bitmap import ChunkedBitmap
+import sisu.bitmap as bitmap
+import sisu.constants as c
+
+
+def test_chunks_for():
+    assert ChunkedBitmap.chunks_for(0, c.BITMAP_CHUNK_BITS - 1, 1000) == 1
+    assert ChunkedBitmap.chunks_for(0, c.BITMAP_CHUNK_BITS, 1000) == 2
+    # values far apart take a chunk each
+    assert ChunkedBitmap.chunks_for(0, c.MAX_NUMBER, 1000) == 1000
+
+
+def test_chunked_bitmap():
+    chunk = c.BITMAP_CHUNK_BITS
+    values = array('Q', [0, 7, 8, 63, 64, chunk - 1, 5 * chunk + 3,
+                         c.MAX_NUMBER - 1])
+
+    bitmap1 = ChunkedBitmap()
+    bitmap1.add_many(values)
+    assert bitmap1.keys == [0, 5, ChunkedBitmap.key_of(c.MAX_NUMBER - 1)]
+    assert bitmap1.memory == 3 * bitmap.CHUNK_MEMORY
+    for value in values:
+        assert value in bitmap1
+    assert 1 not in bitmap1 and chunk not in bitmap1
+
+    # the other bitmap only holds the chunks of the first one
+    bitmap2 = bitmap1.like()
+    bitmap2.add_many(array('Q', [7, 64, 65, 2 * chunk, 5 * chunk + 3]))
+    assert bitmap2.keys == bitmap1.keys
+    assert 2 * chunk not in bitmap2
+
+    both = [list(values) for values in bitmap1.intersection(bitmap2)]
+    assert both == [[7, 64], [5 * chunk + 3]]
+    # the chunks are released
+    assert bitmap1.memory == bitmap2.memory == 0
+
+
+def test_window():
+    chunk = c.BITMAP_CHUNK_BITS
+    window = ChunkedBitmap(low_key=1, high_key=3)
+    window.add_many(array('Q', [1, chunk, 2 * chunk + 1, 3 * chunk]))
+    assert window.keys == [1, 2]
+    assert chunk in window and 1 not in window
@@ -0,0 +1,78 @@
+from array import array
+import os
+
+import sisu.bloom as bloom
+import sisu.constants as c
+
+
+def test_hashes_for():
+    assert bloom.BloomFilter.hashes_for(0) == 1
+    assert bloom.BloomFilter.hashes_for(c.BLOOM_BITS_PER_VALUE) > 1
+    assert bloom.BloomFilter.hashes_for(1000) == bloom.MAX_HASHES
+
+
+def test_memory_for():
+    assert bloom.BloomFilter.memory_for(0) == c.SIZE_UINT64
+    assert bloom.BloomFilter.memory_for(64, 8) == 64
+    assert bloom.BloomFilter.memory_for(65, 8) == 72
+
+
+def test_bloom_filter():
+    capacity = 10000
+    memory = bloom.BloomFilter.memory_for(capacity)
+    bloom_filter = bloom.BloomFilter(capacity, memory)
+
+    assert bloom_filter.memory == memory
+    assert bloom_filter.false_positive_rate == 0
+
+    # add
+    for i in range(0, capacity, 2):
+        bloom_filter.add(i)
+    bloom_filter.add_many(array('Q', range(1, capacity, 2)))
+    assert bloom_filter.cardinality == capacity
+
+    # no false negatives
+    for i in range(capacity):
+        assert i in bloom_filter
+    assert list(bloom_filter.contains_many(range(capacity))) == \
+        list(range(capacity))
+
+    # the estimated false positive rate matches the observed one
+    absent = range(c.MAX_NUMBER - 10 * capacity, c.MAX_NUMBER)
+    observed = len(bloom_filter.contains_many(absent)) / len(absent)
+    estimated = bloom_filter.false_positive_rate
+
+    assert 0 < estimated < 0.05
+    assert abs(observed - estimated) < estimated / 2
+
+    # a filter can be estimated before it is created
+    assert bloom.BloomFilter.false_positive_rate_for(
+        capacity, bloom_filter.memory
+    ) == estimated
+
+
+def test_bloom_filter_tiny():
+    # a filter of a single word still has no false negatives
+    bloom_filter = bloom.BloomFilter(100, 0)
+    bloom_filter.add_many(range(100))
+
+    assert bloom_filter.memory == c.SIZE_UINT64
+    assert len(bloom_filter.contains_many(range(100))) == 100
+
+
+def test_write_read(tmpdir):
+    capacity = 1000
+    memory = bloom.BloomFilter.memory_for(capacity)
+    bloom_filter = bloom.BloomFilter(capacity, memory)
+    bloom_filter.add_many(array('Q', range(capacity)))
+
+    path = str(tmpdir / 'bloom')
+    with open(path, 'wb') as outfile:
+        bloom_filter.write(outfile)
+    assert os.path.getsize(path) == memory
+
+    with open(path, 'rb') as infile:
+        read = bloom.BloomFilter.read(infile, capacity, memory)
+    assert read.n_hashes == bloom_filter.n_hashes
+    assert read.cardinality == capacity
+    assert list(read.contains_many(range(capacity))) == list(range(capacity))
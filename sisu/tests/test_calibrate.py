@@ -0,0 +1,21 @@
+import sisu.calibrate as calibrate
+
+
+def test_calibrate(tmpdir):
+    machine = calibrate.calibrate(1 << 12, str(tmpdir))
+
+    assert set(machine) == set(calibrate.DEFAULT_MACHINE)
+    assert all(value > 0 for value in machine.values())
+
+
+def test_save_and_load_machine(tmpdir, monkeypatch):
+    path = str(tmpdir / 'profile' / 'machine.json')
+    monkeypatch.setenv('SISU_MACHINE_PROFILE', path)
+
+    # nothing saved yet
+    assert calibrate.load_machine() == calibrate.DEFAULT_MACHINE
+
+    assert calibrate.save_machine({'hash_rate': 1.0}) == path
+    machine = calibrate.load_machine()
+    assert machine['hash_rate'] == 1.0
+    assert machine['parse_rate'] == calibrate.DEFAULT_MACHINE['parse_rate']
@@ -0,0 +1,139 @@
+from array import array
+import os
+
+from sisu.estimate import HyperLogLog, KMinValues
+import sisu.estimate as estimate
+
+
+def test_hyperloglog():
+    sketch = HyperLogLog(precision=10)
+    assert sketch.memory == 1 << 10
+    assert sketch.cardinality == 0
+
+    sketch.add_many(range(100))
+    # duplicates do not count
+    sketch.add_many(range(100))
+    assert abs(sketch.cardinality - 100) < 5
+
+    big = HyperLogLog()
+    big.add_many(range(100000))
+    assert abs(big.cardinality - 100000) < 3 * big.error * 100000
+
+    other = HyperLogLog()
+    other.add_many(range(50000, 150000))
+    union = big.union(other)
+    assert abs(union.cardinality - 150000) < 3 * union.error * 150000
+
+
+def test_k_min_values():
+    sketch = KMinValues(100)
+    sketch.add_many(range(50))
+    # duplicates do not count
+    sketch.add_many(range(50))
+    assert sketch.theta == 1
+    assert sketch.cardinality == 50
+
+    sketch1, sketch2 = KMinValues(4096), KMinValues(4096)
+    sketch1.add_many(range(100000))
+    sketch2.add_many(range(50000, 250000))
+    assert sketch1.theta < 1
+    assert len(sketch1.sample()) == 4095
+
+    estimate, error = sketch1.intersection(sketch2)
+    assert 0 < error < 5000
+    assert abs(estimate - 50000) < 4 * error
+
+    union = sketch1.merge(sketch2)
+    assert union.k == 4096
+    assert abs(union.cardinality - 250000) < 10000
+
+    # sketches which hold every hash intersect exactly
+    small1, small2 = KMinValues(100), KMinValues(100)
+    small1.add_many(range(10))
+    small2.add_many(range(5, 20))
+    assert small1.intersection(small2) == (5, 0)
+
+    assert KMinValues.capacity_for(KMinValues.memory_for(100)) == 100
+
+
+def test_sample_file(datadir, tmpdir):
+    # small files are read whole
+    path = str(datadir / 'medium-diff-0.lst')
+    with open(path) as infile:
+        numbers = [int(line) for line in infile]
+
+    stats = estimate.sample_file(path)
+    assert stats.exact
+    assert stats.lines == len(numbers)
+    assert (stats.low, stats.high) == (min(numbers), max(numbers))
+
+    # larger files are sampled
+    path = str(datadir / 'medium-large-same-0.lst')
+    stats = estimate.sample_file(path, n_samples=4, sample_size=1000)
+    with open(path, 'rb') as infile:
+        lines = sum(1 for _ in infile)
+    assert not stats.exact
+    assert abs(stats.lines - lines) < lines / 10
+
+    path = os.path.join(tmpdir, 'empty.lst')
+    open(path, 'w').close()
+    stats = estimate.sample_file(path)
+    assert stats.lines == 0
+    assert stats.low is None
+
+
+def test_sample_packed_file(tmpdir):
+    path = os.path.join(tmpdir, 'packed')
+    with open(path, 'wb') as outfile:
+        array('Q', range(10, 10010)).tofile(outfile)
+
+    stats = estimate.sample_file(path, packed=True, n_samples=4,
+                                 sample_size=800)
+    assert stats.lines == 10000
+    assert stats.fraction == 4 * 100 / 10000
+    assert stats.low >= 10 and stats.high <= 10009
+
+
+def test_file_stats(tmpdir):
+    path = os.path.join(tmpdir, 'numbers.lst')
+    with open(path, 'w') as outfile:
+        outfile.write('1\n2\n3\n')
+
+    stats = estimate.file_stats(path)
+    assert stats.lines == 3
+    assert estimate.file_stats(path) is stats
+
+    # a changed file is sampled again
+    with open(path, 'a') as outfile:
+        outfile.write('4\n')
+    assert estimate.file_stats(path).lines == 4
+
+
+def test_estimate_overlap(datadir, tmpdir):
+    def overlap(name):
+        return estimate.estimate_overlap(
+            estimate.file_stats(str(datadir / f'{name}-0.lst')),
+            estimate.file_stats(str(datadir / f'{name}-1.lst')),
+        )
+
+    # files which are read whole have an all but exact overlap
+    assert overlap('medium-diff') == 82
+
+    # sampled files give a rough one
+    with open(str(datadir / 'medium-large-same-intersection.lst')) as infile:
+        shared = sum(1 for _ in infile)
+    assert abs(overlap('medium-large-same') - shared) < shared / 10
+
+    # the overlap of the samples of large files is lost in the error of
+    # the sketches
+    assert overlap('large-diff') is None
+
+    # disjoint ranges
+    path1 = os.path.join(tmpdir, 'low.lst')
+    path2 = os.path.join(tmpdir, 'high.lst')
+    with open(path1, 'w') as outfile:
+        outfile.write('1\n2\n')
+    with open(path2, 'w') as outfile:
+        outfile.write('3\n4\n')
+    assert estimate.estimate_overlap(estimate.file_stats(path1),
+                                     estimate.file_stats(path2)) == 0
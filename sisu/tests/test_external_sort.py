@@ -0,0 +1,74 @@
+from array import array
+import os
+
+import sisu.external_sort as external_sort
+
+
+def test_write_runs():
+    blocks = ([3, 1, 2], [9, 7], [5])
+    runs = external_sort.write_runs(blocks, 2)
+
+    assert len(runs.paths) == len(blocks)
+    assert runs.cardinality == 6
+    assert all(os.path.isfile(path) for path in runs.paths)
+
+    single = external_sort.write_runs(blocks, 6)
+    assert len(single.paths) == 1
+    single.cleanup()
+
+    runs.cleanup()
+    assert not any(os.path.isfile(path) for path in runs.paths)
+
+
+def test_merge_runs():
+    # duplicates across runs are merged away
+    blocks = ([30, 10, 20], [25, 5, 10], [1], [])
+    runs = external_sort.write_runs(blocks, 1)
+
+    merged = list(external_sort.merge_runs(runs.paths, 2))
+
+    assert merged == [1, 5, 10, 20, 25, 30]
+
+    assert list(external_sort.merge_runs([], 2)) == []
+
+    runs.cleanup()
+
+
+def test_delta_runs():
+    blocks = ([30, 10, 20], [25, 5, 10], [1 << 62], [])
+    runs = external_sort.write_runs(blocks, 3, delta=True)
+    assert runs.delta
+
+    merged = list(external_sort.merge_runs(runs.paths, 2, delta=True))
+
+    assert merged == [5, 10, 20, 25, 30, 1 << 62]
+    runs.cleanup()
+
+
+def test_gallop():
+    block = array('Q', range(0, 200, 2))
+
+    assert external_sort.gallop(block, 0) == 0
+    assert external_sort.gallop(block, 7) == 4
+    assert external_sort.gallop(block, 8, pos=4) == 4
+    assert external_sort.gallop(block, 151, pos=10) == 76
+    assert external_sort.gallop(block, 1000, pos=10) == len(block)
+    assert external_sort.gallop(array('Q'), 1) == 0
+
+
+def test_skip_to():
+    blocks = (range(0, 1000, 2), range(1, 1000, 4), [500, 998])
+    for delta in (False, True):
+        runs = external_sort.write_runs(blocks, 500, delta=delta,
+                                        frame_size=16)
+        merged = external_sort.merge_runs(runs.paths, 8, delta)
+
+        assert next(merged) == 0
+        assert external_sort.skip_to(merged, 101) == 101
+        assert next(merged) == 102
+        # runs skip past whole blocks and frames
+        assert external_sort.skip_to(merged, 601) == 601
+        assert external_sort.skip_to(merged, 997) == 997
+        assert list(merged) == [998]
+        assert external_sort.skip_to(merged, 1000) is None
+        runs.cleanup()
@@ -0,0 +1,71 @@
+from array import array
+
+import pytest
+
+import sisu.constants as c
+import sisu.hashset as hashset
+
+
+def test_capacity_for():
+    for memory in (c.SIZE_UINT64, 1000, c.MEGABYTE, 3 * c.MEGABYTE + 5):
+        capacity = hashset.Uint64HashSet.capacity_for(memory)
+        assert hashset.Uint64HashSet.memory_for(capacity) <= memory
+
+    # a table sized for n elements holds them
+    for n in (1, 7, 1000, 281290):
+        assert hashset.Uint64HashSet.capacity_for(
+            hashset.Uint64HashSet.memory_for(n)
+        ) >= n
+
+    assert hashset.Uint64HashSet.capacity_for(0) == 0
+    assert hashset.Uint64HashSet.capacity_for(c.MEGABYTE) > \
+        c.MEGABYTE // (2 * c.SIZE_UINT64)
+
+
+def test_uint64_hash_set():
+    hash_set = hashset.Uint64HashSet(initial_slots=4)
+    range_limit = 1000
+
+    # add
+    for i in range(range_limit):
+        assert hash_set.add(i)
+    assert not hash_set.add(0)
+
+    # the table grew
+    assert len(hash_set) == range_limit
+    assert hash_set.memory >= hashset.Uint64HashSet.memory_for(range_limit)
+
+    # __contains__
+    for i in range(range_limit):
+        assert i in hash_set
+    assert range_limit not in hash_set
+
+    # __iter__
+    assert set(hash_set) == set(range(range_limit))
+
+    # largest id
+    assert c.MAX_NUMBER - 1 not in hash_set
+    hash_set.add(c.MAX_NUMBER - 1)
+    assert c.MAX_NUMBER - 1 in hash_set
+
+
+def test_uint64_hash_set_bulk():
+    hash_set = hashset.Uint64HashSet()
+
+    assert hash_set.add_many(array('Q', range(0, 100, 2))) == 50
+    assert hash_set.add_many(array('Q', range(0, 100, 4))) == 0
+
+    hits = hash_set.contains_many(array('Q', range(100)))
+    assert list(hits) == list(range(0, 100, 2))
+
+
+def test_uint64_hash_set_max_size():
+    max_size = 10
+    hash_set = hashset.Uint64HashSet(max_size, initial_slots=2)
+
+    hash_set.add_many(range(max_size))
+    assert len(hash_set) == max_size
+    assert hash_set.memory == hashset.Uint64HashSet.memory_for(max_size)
+
+    with pytest.raises(ValueError):
+        hash_set.add(max_size)
@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+from sisu.memory import MemoryBudget
+from sisu.result import StreamingResult
+import sisu.constants as c
+import sisu.incremental as incremental
+import sisu.utils as utils
+
+
+def _lines(path):
+    with open(path, 'rb') as infile:
+        return infile.readlines()
+
+
+def test_update(datadir, tmpdir):
+    lines1 = _lines(str(datadir / 'medium-large-diff-0.lst'))
+    lines2 = _lines(str(datadir / 'medium-large-diff-1.lst'))
+    file1, file2 = str(tmpdir / 'a.lst'), str(tmpdir / 'b.lst')
+    path = str(tmpdir / 'checkpoint')
+
+    # the last line of the first file is still being written
+    with open(file1, 'wb') as outfile:
+        outfile.writelines(lines1[:len(lines1) // 2])
+        outfile.write(lines1[len(lines1) // 2][:-2])
+    with open(file2, 'wb') as outfile:
+        outfile.writelines(lines2[:len(lines2) // 3])
+
+    budget = MemoryBudget(c.MEGABYTE, strict=True)
+    checkpoint = incremental.update(file1, file2, path, c.MEGABYTE,
+                                    budget=budget, max_indexes=1)
+    assert not budget._reservations
+    before = utils.read_nums(file1) & utils.read_nums(file2)
+    before.discard(int(lines1[len(lines1) // 2][:-2]))
+    assert checkpoint.count == len(before)
+
+    # nothing was appended
+    assert incremental.update(file1, file2, path, c.MEGABYTE).count == \
+        len(before)
+
+    stages = ((len(lines1) * 3 // 4, len(lines2) // 2),
+              (len(lines1), len(lines2)))
+    for stage, (end1, end2) in enumerate(stages):
+        with open(file1, 'wb') as outfile:
+            outfile.writelines(lines1[:end1])
+        with open(file2, 'wb') as outfile:
+            outfile.writelines(lines2[:end2])
+
+        output = str(tmpdir / f'output-{stage}')
+        with StreamingResult(output) as result:
+            checkpoint = incremental.update(file1, file2, path, c.MEGABYTE,
+                                            result=result, max_indexes=1)
+
+        after = utils.read_nums(file1) & utils.read_nums(file2)
+        assert checkpoint.count == len(after)
+        assert utils.read_nums(output) == after - before
+        before = after
+
+    # the indexes of a side were merged into one, the others removed
+    assert [len(paths) for paths in checkpoint.indexes] == [1, 1]
+    assert sorted(os.listdir(str(tmpdir))) == sorted(
+        ['a.lst', 'b.lst', 'checkpoint', 'output-0', 'output-1'] +
+        [os.path.basename(path) for paths in checkpoint.indexes
+         for path in paths]
+    )
+
+
+def test_update_errors(datadir, tmpdir):
+    file1 = str(datadir / 'small-diff-0.lst')
+    file2 = str(datadir / 'small-diff-1.lst')
+    path = str(tmpdir / 'checkpoint')
+    checkpoint = incremental.update(file1, file2, path, c.MEGABYTE)
+    assert checkpoint.count == \
+        len(utils.read_nums(str(datadir / 'small-diff-intersection.lst')))
+
+    # of other files
+    with pytest.raises(ValueError):
+        incremental.update(file2, file1, path, c.MEGABYTE)
+
+    # a file which shrank
+    with open(str(tmpdir / 'short.lst'), 'w') as outfile:
+        outfile.write('1\n')
+    path = str(tmpdir / 'short')
+    incremental.update(file1, str(tmpdir / 'short.lst'), path, c.MEGABYTE)
+    with open(str(tmpdir / 'short.lst'), 'w') as outfile:
+        outfile.write('')
+    with pytest.raises(ValueError):
+        incremental.update(file1, str(tmpdir / 'short.lst'), path,
+                           c.MEGABYTE)
+
+
+def test_update_relative(datadir, tmpdir, monkeypatch):
+    file1 = str(datadir / 'small-diff-0.lst')
+    file2 = str(datadir / 'small-diff-1.lst')
+    tmpdir.mkdir('checkpoints')
+    monkeypatch.chdir(str(tmpdir))
+    checkpoint = incremental.update(file1, file2, 'checkpoints/checkpoint',
+                                    c.MEGABYTE)
+
+    # the indexes are found from another working directory
+    monkeypatch.chdir(str(datadir))
+    path = str(tmpdir / 'checkpoints' / 'checkpoint')
+    assert incremental.Checkpoint(path).indexes == [
+        [str(tmpdir / path_) for path_ in paths]
+        for paths in checkpoint.indexes
+    ]
+    assert incremental.update(file1, file2, path, c.MEGABYTE).count == \
+        checkpoint.count
+
+
+def test_update_failure(datadir, tmpdir, monkeypatch):
+    file1 = str(datadir / 'small-diff-0.lst')
+    file2 = str(datadir / 'small-diff-1.lst')
+    path = str(tmpdir / 'checkpoint')
+
+    def fail(*args):
+        raise OSError('No space left on device')
+
+    # the indexes written before the failure are removed
+    monkeypatch.setattr(incremental, '_new_numbers', fail)
+    with pytest.raises(OSError):
+        incremental.update(file1, file2, path, c.MEGABYTE)
+    assert os.listdir(str(tmpdir)) == []
@@ -0,0 +1,89 @@
+from bisect import bisect_left
+
+from sisu.memory import MemoryBudget
+import sisu.constants as c
+import sisu.external_sort as external_sort
+import sisu.index as index
+import sisu.utils as utils
+
+
+def test_build(datadir, tmpdir):
+    file_ = str(datadir / 'medium-large-diff-1.lst')
+    path = str(tmpdir / 'index')
+    budget = MemoryBudget(c.MEGABYTE, strict=True)
+
+    built = index.build(file_, path, c.MEGABYTE, budget=budget,
+                        bloom_bits=c.BLOOM_BITS_PER_VALUE, n_partitions=16)
+    assert not budget._reservations
+
+    nums = sorted(utils.read_nums(file_))
+    assert index.Index.is_index(path)
+    assert not index.Index.is_index(file_)
+    assert (built.count, built.low, built.high) == \
+        (len(nums), nums[0], nums[-1])
+
+    # partitions of whole frames, each starting with its first number
+    assert 1 < len(built.fences) <= 16
+    assert built.fences[0] == nums[0]
+    assert all(nums[bisect_left(nums, fence)] == fence
+               for fence in built.fences)
+
+    # the filter is read back whole and holds every number
+    bloom = built.bloom()
+    assert bloom.memory == built.bloom_memory <= c.MEGABYTE / 4
+    assert len(bloom.contains_many(nums)) == len(nums)
+
+    assert list(index.Index(path).values(100)) == nums
+
+
+def test_values_skip(datadir, tmpdir):
+    file_ = str(datadir / 'medium-large-diff-0.lst')
+    path = str(tmpdir / 'index')
+    built = index.build(file_, path, c.MEGABYTE)
+    assert built.bloom() is None
+
+    nums = sorted(utils.read_nums(file_))
+    # skips within a block, over frames and to later partitions
+    for step in (2, 1000, nums[-1] // 50, nums[-1] // 3):
+        values = built.values(64)
+        value = next(values)
+        target = value + step
+        while value is not None:
+            value = external_sort.skip_to(values, target)
+            pos = bisect_left(nums, target)
+            assert value == (nums[pos] if pos < len(nums) else None)
+            if value is not None:
+                target = value + step
+
+
+def test_empty(datadir, tmpdir):
+    path = str(tmpdir / 'index')
+    built = index.build(str(datadir / 'small-diff-intersection.lst'), path,
+                        c.MEGABYTE, bloom_bits=c.BLOOM_BITS_PER_VALUE)
+    assert built.count == 0
+    assert built.bloom() is None
+    assert list(built.values(10)) == []
+
+
+def test_merge(datadir, tmpdir):
+    files = [str(datadir / f'medium-large-diff-{idx}.lst') for idx in (0, 1)]
+    indexes = [index.build(file_, str(tmpdir / f'index-{idx}'), c.MEGABYTE)
+               for idx, file_ in enumerate(files)]
+    budget = MemoryBudget(c.MEGABYTE, strict=True)
+    merged = index.merge(indexes, str(tmpdir / 'merged'), c.MEGABYTE,
+                         budget=budget)
+    assert not budget._reservations
+
+    nums = sorted(utils.read_nums(files[0]) | utils.read_nums(files[1]))
+    assert merged.count == len(nums)
+    assert list(merged.values(100)) == nums
+    assert merged.bloom() is None
+
+
+def test_main(datadir, tmpdir, capsys):
+    path = str(tmpdir / 'index')
+    index.main(['build', str(datadir / 'medium-diff-0.lst'), '--output',
+                path, '--mem_limit', '1'])
+    assert index.Index(path).count == \
+        len(utils.read_nums(str(datadir / 'medium-diff-0.lst')))
+    assert capsys.readouterr().out.startswith('Indexed')
@@ -0,0 +1,57 @@
+from array import array
+
+import pytest
+
+from sisu.memory import MemoryBudget, MemoryLimitExceeded
+import sisu.constants as c
+
+
+def test_memory_budget_reserve():
+    budget = MemoryBudget(100)
+
+    assert budget.reserve('a', 30) == 30
+    assert budget.reserve('b', 50) == 50
+    assert budget.reserved == 80
+    assert budget.available == 20
+
+    # reserving a name again resizes its reservation
+    budget.reserve('a', 10)
+    assert budget.reservation('a') == 10
+    assert budget.reserved == 60
+
+    budget.release('b')
+    budget.release('missing')
+    assert budget.reserved == 10
+    assert budget.peak_reserved == 80
+
+    # a lenient budget only records going over the limit
+    budget.reserve('c', 1000)
+    assert budget.available == 0
+    assert budget.peak_reserved == 1010
+
+
+def test_memory_budget_strict():
+    budget = MemoryBudget(100, strict=True)
+    budget.reserve('a', 60)
+
+    with pytest.raises(MemoryLimitExceeded):
+        budget.reserve('b', 50)
+
+    assert budget.reservation('b') == 0
+    assert budget.reserved == 60
+
+
+def test_memory_budget_track():
+    budget = MemoryBudget(c.MEGABYTE, strict=True)
+
+    with budget.track():
+        block = array('Q', (0,)) * (c.MEGABYTE // (4 * c.SIZE_UINT64))
+        del block
+
+    assert c.MEGABYTE // 4 <= budget.measured_peak <= c.MEGABYTE
+    assert budget.rss_peak >= 0
+
+    with pytest.raises(MemoryLimitExceeded):
+        with budget.track():
+            block = array('Q', (0,)) * (c.MEGABYTE // c.SIZE_UINT64 + 1)
+            del block
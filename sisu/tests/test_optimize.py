@@ -1,39 +1,152 @@
+import math
 import os
+import random
 
+import pytest
 import unittest.mock as mock
+from sisu.estimate import FileStats, HyperLogLog
+import sisu.calibrate as calibrate
 import sisu.constants as c
 import sisu.optimize as optimize
 import sisu.strategy as s
 
 
-def test_optimal_strategy():
-    config = optimize.DEFAULT_CONFIG
+class _Reader():
+    """Estimates 20 bytes a line without opening the files. Nothing is
+    sampled, so the overlap is unknown.
+    """
+
+    @staticmethod
+    def stats(file_):
+        size = os.path.getsize(file_)
+        return FileStats(size, int(size // 20), None, None, 0, HyperLogLog())
+
+    @staticmethod
+    def estimate_count(file_):
+        return _Reader.stats(file_).lines
+
 
+def test_optimal_strategy():
     file_sizes = {
-        'small_file': config['small_file'] * (9/10),
-        'medium_file': (config['small_file'] + config['large_file']) / 2,
-        'big_file': config['large_file'] * 2 * 100
+        'small_file': 2 * c.MEGABYTE,
+        'medium_file': 50 * c.MEGABYTE,
+        'big_file': 500 * c.MEGABYTE,
     }
+    machine = calibrate.DEFAULT_MACHINE
 
     with mock.patch.object(os.path, 'getsize') as getsize:
         getsize.side_effect = lambda x: file_sizes[x]
-        strat = optimize.optimal_strategy(
-            'small_file', 'small_file',
-            1.75 * file_sizes['small_file']
-        )
 
-        assert strat is s.Hash
+        def seconds(file1, file2, mem_limit):
+            return {
+                cost.strategy: cost.seconds
+                for cost in optimize.estimate_costs(
+                    file1, file2, mem_limit, reader=_Reader(), machine=machine
+                )
+            }
 
-        strat = optimize.optimal_strategy(
-            'small_file', 'medium_file',
-            1.75 * file_sizes['small_file']
-        )
+        # the build hash fits in memory
+        costs = seconds('small_file', 'medium_file', 64 * c.MEGABYTE)
+        assert costs[s.Hash] < min(costs[s.GraceHash], costs[s.Merge])
+
+        # the build hash spills and most probes go to disk
+        costs = seconds('big_file', 'big_file', c.MEGABYTE)
+        assert costs[s.Merge] < costs[s.Hash]
+
+        # on a machine which partitions quickly grace hashing wins
+        costs = seconds('medium_file', 'medium_file', c.MEGABYTE)
+        assert costs[s.Merge] < costs[s.GraceHash]
+        machine = dict(machine, partition_rate=machine['partition_rate'] * 100)
+        costs = seconds('medium_file', 'medium_file', c.MEGABYTE)
+        assert costs[s.GraceHash] < costs[s.Merge]
+
+        # without sampled ranges a bitmap may take a chunk per value
+        assert costs[s.Bitmap] == max(costs.values())
+
+        # range partitioning hashes nothing
+        machine = calibrate.DEFAULT_MACHINE
+        assert optimize.optimal_strategy(
+            'medium_file', 'medium_file', c.MEGABYTE, reader=_Reader(),
+            machine=machine
+        ) is s.Radix
+
+
+def test_dense_range(datadir):
+    # the ids of the files are in [0, 320000)
+    file1 = str(datadir / 'medium-large-diff-0.lst')
+    file2 = str(datadir / 'medium-large-diff-1.lst')
+    assert optimize.optimal_strategy(
+        file1, file2, c.MEGABYTE, machine=calibrate.DEFAULT_MACHINE
+    ) is s.Bitmap
 
-        assert strat is s.Hash
 
-        strat = optimize.optimal_strategy(
-            'big_file', 'big_file',
-            1.75 * file_sizes['small_file']
+def test_sparse_range(tmpdir):
+    # ids spread over 61 bits take a chunk each
+    ids = random.Random(0).sample(range(1 << 61), 30000)
+    file1, file2 = str(tmpdir / 'a.lst'), str(tmpdir / 'b.lst')
+    for path, values in ((file1, ids[:20000]), (file2, ids[10000:])):
+        with open(path, 'w') as outfile:
+            outfile.writelines(f'{value}\n' for value in values)
+
+    costs = {
+        cost.strategy: cost.seconds
+        for cost in optimize.estimate_costs(
+            file1, file2, c.MEGABYTE, machine=calibrate.DEFAULT_MACHINE
         )
+    }
+    assert costs[s.Bitmap] == math.inf
+    assert optimize.optimal_strategy(
+        file1, file2, c.MEGABYTE, machine=calibrate.DEFAULT_MACHINE
+    ) is not s.Bitmap
+    with pytest.raises(ValueError):
+        s.Bitmap.intersect(file1, file2, c.MEGABYTE)
+
+
+def test_explain(datadir):
+    file1 = str(datadir / 'medium-diff-0.lst')
+    file2 = str(datadir / 'medium-diff-1.lst')
+
+    costs = optimize.estimate_costs(file1, file2, c.MEGABYTE)
+    assert {cost.strategy for cost in costs} == set(optimize.COST_MODELS)
+    assert [cost.seconds for cost in costs] == \
+        sorted(cost.seconds for cost in costs)
+    assert optimize.optimal_strategy(file1, file2, c.MEGABYTE) is \
+        costs[0].strategy
+
+    explanation = optimize.explain(file1, file2, c.MEGABYTE).splitlines()
+    assert explanation[0] == \
+        f'Picked {costs[0].strategy.__name__}, the predicted fastest of'
+    assert len(explanation) == len(costs) + 1
+
+
+def test_optimal_strategy_many(datadir):
+    files = [str(datadir / f'medium-diff-{type_}.lst')
+             for type_ in ('1', '0', 'intersection')]
+
+    strat = optimize.optimal_strategy_many(files, c.MEGABYTE)
+    assert strat.multiway
+
+    explanation = optimize.explain(
+        files[2], files[1], c.MEGABYTE, multiway=True
+    ).splitlines()
+    assert explanation[0] == \
+        f'Picked {strat.__name__}, the predicted fastest of'
+    assert len(explanation) == 1 + len(
+        [model for model in optimize.COST_MODELS if model.multiway]
+    )
+
+
+def test_optimal_strategy_op(datadir):
+    file1 = str(datadir / 'medium-diff-0.lst')
+    file2 = str(datadir / 'medium-diff-1.lst')
+
+    for op in c.SET_OPERATIONS:
+        strat = optimize.optimal_strategy(file1, file2, c.MEGABYTE, op=op)
+        assert op in strat.operations
 
-        assert strat is s.Merge
+    explanation = optimize.explain(file1, file2, c.MEGABYTE,
+                                   op='union').splitlines()
+    assert len(explanation) == 1 + len(
+        [model for model in optimize.COST_MODELS if 'union' in
+         model.operations]
+    )
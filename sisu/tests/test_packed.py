@@ -0,0 +1,81 @@
+from array import array
+import os
+
+import pytest
+
+import sisu.constants as c
+import sisu.packed as packed
+
+
+def test_read_packed(tmpdir):
+    path = os.path.join(tmpdir, 'packed')
+    with open(path, 'wb') as outfile:
+        packed.write_packed(outfile, range(10))
+
+    # values are little endian whatever the machine
+    with open(path, 'rb') as infile:
+        assert infile.read(2 * c.SIZE_UINT64) == \
+            packed.pack(0) + packed.pack(1)
+    assert packed.pack(1) == b'\x01' + bytes(7)
+
+    blocks = list(packed.read_packed(path, 4))
+    assert [len(block) for block in blocks] == [4, 4, 2]
+    assert sum(map(list, blocks), []) == list(range(10))
+
+    blocks = list(packed.read_packed(path, 4, 2 * c.SIZE_UINT64,
+                                     5 * c.SIZE_UINT64))
+    assert sum(map(list, blocks), []) == [2, 3, 4]
+
+
+def test_encode_deltas():
+    header = 2 * c.SIZE_UINT64 + 5
+
+    values = array('Q', [3, 5, 5, 300])
+    frame = packed.encode_deltas(values)
+    # a header, then 2 bytes per delta for the gap of 295
+    assert len(frame) == header + 2 * (len(values) - 1)
+    assert packed.decode_deltas(frame) == values
+
+    # a frame of equal values has no delta bytes
+    same = array('Q', [7, 7, 7])
+    assert len(packed.encode_deltas(same)) == header
+    assert packed.decode_deltas(packed.encode_deltas(same)) == same
+
+    wide = array('Q', [0, c.MAX_NUMBER - 1])
+    assert packed.decode_deltas(packed.encode_deltas(wide)) == wide
+
+
+def test_read_deltas(tmpdir):
+    path = os.path.join(tmpdir, 'deltas')
+    values = array('Q', range(0, 30000, 3))
+    with open(path, 'wb') as outfile:
+        packed.write_deltas(outfile, values, frame_size=1000)
+
+    # small gaps take a byte each
+    assert os.path.getsize(path) < len(values) * 2
+
+    # blocks hold whole frames
+    blocks = list(packed.read_deltas(path, 1500))
+    assert [len(block) for block in blocks] == [2000] * 5
+    assert array('Q', sum(map(list, blocks), [])) == values
+
+    # skipping returns the frame of the value skipped to
+    blocks = packed.read_deltas(path, 10)
+    assert next(blocks)[0] == 0
+    block = blocks.send(20000)
+    assert (block[0], block[-1]) == (18000, 20997)
+    # from the offset of a frame
+    frame_bytes = os.path.getsize(path) // 10
+    blocks = packed.read_deltas(path, 10, 3 * frame_bytes)
+    assert next(blocks)[0] == 9000
+
+    # past the last frame
+    blocks = packed.read_deltas(path, 10)
+    next(blocks)
+    with pytest.raises(StopIteration):
+        blocks.send(30000)
+
+    empty = os.path.join(tmpdir, 'empty')
+    with open(empty, 'wb') as outfile:
+        packed.write_deltas(outfile, array('Q'))
+    assert list(packed.read_deltas(empty, 10)) == []
@@ -0,0 +1,54 @@
+import os
+
+import sisu.constants as c
+import sisu.parallel as parallel
+import sisu.strategy as strategy
+import sisu.utils as utils
+
+
+def _parallel_test_helper(dir_, test_file_name, mem_limit, workers,
+                          **kwargs):
+    base_name = str(dir_ / test_file_name)
+    file1_name, file2_name = f'{base_name}-0.lst', f'{base_name}-1.lst'
+
+    cardinality = parallel.intersect(file1_name, file2_name, mem_limit,
+                                     workers, **kwargs)
+
+    expected = utils.read_nums(file1_name) & utils.read_nums(file2_name)
+    assert cardinality == len(expected)
+
+
+def test_partitions_for():
+    assert parallel.partitions_for(1) == c.PARTITIONS_PER_WORKER
+    assert parallel.partitions_for(3) == 16
+    assert parallel.partitions_for(4) == 16
+
+
+def test_parallel_intersect(datadir):
+    mem_limit = c.MEGABYTE
+
+    for strat in (None, strategy.Hash, strategy.GraceHash, strategy.Merge):
+        _parallel_test_helper(datadir, 'medium-same', mem_limit, 2,
+                              strategy=strat)
+
+    _parallel_test_helper(datadir, 'small-diff', mem_limit, 3)
+
+    reader = utils.MappedReader()
+    _parallel_test_helper(datadir, 'medium-diff', mem_limit, 2,
+                          reader=reader, strict=True)
+
+    # the counters of the workers' readers are added up
+    assert reader.bytes_read == sum(
+        os.path.getsize(str(datadir / f'medium-diff-{idx}.lst'))
+        for idx in range(2)
+    )
+
+
+def test_parallel_output(datadir, tmpdir):
+    output = str(tmpdir / 'result.lst')
+    _parallel_test_helper(datadir, 'medium-diff', c.MEGABYTE, 2,
+                          output=output)
+
+    assert utils.read_nums(output) == utils.read_nums(
+        str(datadir / 'medium-diff-intersection.lst')
+    )
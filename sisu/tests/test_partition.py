@@ -0,0 +1,143 @@
+import os
+
+import pytest
+
+import sisu.packed as packed
+import sisu.partition as partition
+
+
+def test_partition_bits():
+    assert partition.partition_bits(1) == 0
+    assert partition.partition_bits(64) == 6
+
+    with pytest.raises(ValueError):
+        partition.partition_bits(3)
+
+
+def test_partition_of():
+    bits = 3
+    nums = range(1000)
+
+    parts = [partition.partition_of(num, bits) for num in nums]
+    assert set(parts) == set(range(1 << bits))
+
+    # a different level gives a different partitioning
+    other = [partition.partition_of(num, bits, level=1) for num in nums]
+    assert parts != other
+
+
+def test_partitioned_store(tmpdir):
+    n_partitions = 4
+    store = partition.PartitionedStore(n_partitions, buffer_size=3)
+    range_limit = 100
+
+    # add
+    for i in range(range_limit):
+        store.add(i)
+    store.add_many(range(range_limit, 2 * range_limit))
+
+    assert store.cardinality == 2 * range_limit
+    assert sum(store.counts) == 2 * range_limit
+
+    # buffers were written out as they filled up
+    assert os.listdir(store.dir.name)
+
+    # contains
+    for i in range(2 * range_limit):
+        assert store.contains(i)
+    assert not store.contains(2 * range_limit)
+
+    # read_partition
+    for idx in range(n_partitions):
+        nums = [num for block in store.read_partition(idx, 7) for num in block]
+        assert len(nums) == store.counts[idx]
+        assert all(store.partition(num) == idx for num in nums)
+
+    # close
+    store.close()
+    assert not any(store._buffers)
+    assert {num for block in store for num in block} == \
+        set(range(2 * range_limit))
+
+    store.cleanup()
+    assert not os.path.isdir(store.dir.name)
+
+
+def test_contains_many(monkeypatch):
+    n_partitions = 4
+    store = partition.PartitionedStore(n_partitions, buffer_size=16)
+    store.scan_size = 64
+    store.add_many(range(0, 4000, 2))
+    assert sorted(store.contains_many(range(4000))) == \
+        list(range(0, 4000, 2))
+
+    reads = []
+
+    def read_packed(path, *args):
+        reads.append(path)
+        return packed.read_packed(path, *args)
+
+    # a sorted bucket is searched by frames, each read at most once per
+    # call rather than the whole bucket once per number
+    monkeypatch.setattr(partition, 'read_packed', read_packed)
+    numbers = [1, 2, 3, 1000, 1001, 1002, 3998]
+    assert sorted(store.contains_many(numbers)) == [2, 1000, 1002, 3998]
+    frames = sum(
+        -(-(count - len(buffer_)) // store._frame_size)
+        for count, buffer_ in zip(store.counts, store._buffers)
+    )
+    assert 0 < len(reads) <= len(numbers) < frames
+
+    # a bucket which was appended to is sorted again
+    store.add_many(range(4001, 4100, 2))
+    assert sorted(store.contains_many(range(3990, 4100))) == \
+        sorted([*range(3990, 4000, 2), *range(4001, 4100, 2)])
+    store.cleanup()
+
+
+def test_resize_buffers():
+    store = partition.PartitionedStore(4, buffer_size=100)
+
+    store.resize_buffers(400)
+    assert store.buffer_size == 6
+    assert store.buffer_memory <= 400
+
+    # buffers never go below a single value
+    store.resize_buffers(0)
+    assert store.buffer_size == store.scan_size == 1
+
+    store.cleanup()
+
+
+def test_range_shift():
+    assert partition.range_shift(0, 4) == 0
+    assert partition.range_shift(16, 4) == 2
+    assert partition.range_shift(17, 4) == 3
+    assert partition.range_shift(1 << 63, 256) == 55
+
+
+def test_range_partitioned_store():
+    store = partition.RangePartitionedStore(100, 116, n_partitions=4,
+                                            buffer_size=3)
+    assert store.shift == 2
+    assert store.bounds(0) == (100, 104)
+    assert store.bounds(1) == (104, 108)
+    assert store.bounds(3) == (112, 116)
+
+    # values outside of the range go to the outer partitions, which stretch
+    # to hold them
+    store.add_many([3, 99, 100, 103, 104, 111, 115, 116, 2 ** 63])
+    store.add(107)
+    assert store.counts == [4, 2, 1, 3]
+    assert store.bounds(0) == (3, 104)
+    assert store.bounds(3) == (112, 2 ** 63 + 1)
+
+    for idx in range(4):
+        low, high = store.bounds(idx)
+        nums = [num for block in store.read_partition(idx, 2)
+                for num in block]
+        assert all(low <= num < high for num in nums)
+        assert all(store.partition(num) == idx for num in nums)
+
+    assert store.contains(107) and not store.contains(108)
+    store.cleanup()
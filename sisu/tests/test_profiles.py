@@ -0,0 +1,39 @@
+import sisu.constants as c
+import sisu.profiles as profiles
+import sisu.strategy as strategy
+
+
+def test_regime_of():
+    assert profiles.regime_of(c.MEGABYTE // 8, c.MEGABYTE) == 'small'
+    assert profiles.regime_of(2 * c.MEGABYTE, c.MEGABYTE) == 'medium'
+    assert profiles.regime_of(500 * c.MEGABYTE, c.MEGABYTE) == 'large'
+
+
+def test_config_for(datadir, tmpdir, monkeypatch):
+    path = str(tmpdir / 'tuned.json')
+    monkeypatch.setenv('SISU_TUNED_PROFILE', path)
+    file1 = str(datadir / 'medium-diff-0.lst')
+    file2 = str(datadir / 'medium-diff-1.lst')
+    mem_limit = c.MEGABYTE
+
+    # nothing tuned yet
+    assert profiles.config_for(strategy.Hash, file1, mem_limit) is \
+        strategy.Hash.DEFAULT_CONFIG
+    default_memory = strategy.Hash.determine_memory(file1, file2, mem_limit)
+
+    profiles.save_profile({
+        'Hash': {'small': {'line_count_margin': 40}},
+    })
+    config = profiles.config_for(strategy.Hash, file1, mem_limit)
+    assert config == dict(strategy.Hash.DEFAULT_CONFIG,
+                          line_count_margin=40)
+
+    # strategies load the tuned config
+    assert strategy.Hash.determine_memory(file1, file2, mem_limit) != \
+        default_memory
+
+    # a config which is passed in wins, and other regimes are not tuned
+    assert profiles.config_for(strategy.Hash, file1, mem_limit,
+                               {'a': 1}) == {'a': 1}
+    assert profiles.config_for(strategy.Hash, file1, 1) is \
+        strategy.Hash.DEFAULT_CONFIG
@@ -0,0 +1,43 @@
+from array import array
+
+from sisu.result import Counter, Estimate, StreamingResult
+import sisu.constants as c
+import sisu.utils as utils
+
+
+def test_counter():
+    result = Counter()
+    assert result.memory == 0
+
+    with result:
+        assert result.add(5) == 5
+        result.add_many(array('Q', range(10)))
+
+    assert result.cardinality == 11
+
+
+def test_streaming_result(tmpdir):
+    output = str(tmpdir / 'result.lst')
+    numbers = array('Q', range(2, 25, 2))
+
+    with StreamingResult(output, buffer_size=5) as result:
+        assert result.memory == 5 * (c.SIZE_UINT64 + c.LARGEST_ELEMENT_SIZE)
+        result.add(1)
+        # spans several buffers
+        result.add_many(numbers)
+        result.add(2 ** 64 - 1)
+
+    assert result.cardinality == len(numbers) + 2
+    assert utils.read_nums(output) == set(numbers) | {1, 2 ** 64 - 1}
+
+    # closing twice does not write twice
+    result.close()
+    with open(output) as infile:
+        assert len(infile.readlines()) == result.cardinality
+
+
+def test_estimate():
+    estimate = Estimate(100, 10.5)
+    assert estimate.bounds() == (79, 121)
+    assert estimate.bounds(errors=20) == (0, 310)
+    assert str(estimate) == '100 (95% between 79 and 121)'
@@ -1,3 +1,8 @@
+from array import array
+
+from sisu.bloom import BloomFilter
+from sisu.memory import MemoryBudget
+import sisu.constants as c
 import sisu.spillable_hash as spillable
 import sisu.utils as utils
 
@@ -54,3 +59,84 @@ def test_spillable_hash(tmpdir):
     nums_from_disk = utils.read_nums(output)
 
     assert set(nums_from_disk) == set(range(range_))
+
+
+def test_spillable_hash_bulk():
+    capacity = 5
+    spillable_hash = spillable.SpillableHash(capacity)
+    range_ = 10
+
+    # add_many
+    spillable_hash.add_many(array('Q', range(range_)))
+
+    assert spillable_hash.cardinality == range_
+    assert len(spillable_hash._mem) == capacity
+    assert spillable_hash._disk.cardinality == range_ - capacity
+
+    # contains_many
+    hits = spillable_hash.contains_many(array('Q', range(2 * range_)))
+    assert sorted(hits) == list(range(range_))
+
+    # lookup_many, the misses keep their order
+    hits, misses = spillable_hash.lookup_many(array('Q', range(2 * range_)))
+    assert sorted(hits) == list(range(range_))
+    assert list(misses) == list(range(range_, 2 * range_))
+
+    # blocks, in memory and spilled
+    blocks = list(spillable_hash.blocks(3))
+    assert all(len(block) <= 3 for block in blocks)
+    assert sorted(sum(map(list, blocks), [])) == list(range(range_))
+
+
+def test_spillable_hash_memory():
+    memory = c.MEGABYTE
+    capacity = spillable.SpillableHash.capacity_for(memory)
+    spillable_hash = spillable.SpillableHash(capacity)
+
+    # the table only grows when needed
+    spillable_hash.add(1)
+    assert 0 < spillable_hash.available_memory <= memory
+
+
+def test_spillable_hash_bloom():
+    capacity = 5
+    range_ = 100
+    bloom = BloomFilter(range_, BloomFilter.memory_for(range_))
+    budget = MemoryBudget(c.MEGABYTE)
+    spillable_hash = spillable.SpillableHash(capacity, budget, 'hash',
+                                             bloom=bloom)
+
+    assert budget.reservation('hash.bloom') == bloom.memory
+
+    # the filter covers the elements in memory and on disk
+    spillable_hash.add(0)
+    spillable_hash.add_many(array('Q', range(1, range_)))
+    assert bloom.cardinality == range_
+
+    assert spillable_hash.false_positive_rate is None
+
+    absent = range(c.MAX_NUMBER - 1000, c.MAX_NUMBER)
+    hits = spillable_hash.contains_many(array('Q', range(range_)))
+    assert sorted(hits) == list(range(range_))
+    assert not spillable_hash.contains_many(array('Q', absent))
+
+    assert spillable_hash.bloom_checks == range_ + len(absent)
+    assert spillable_hash.bloom_hits == range_
+    assert 0 <= spillable_hash.false_positive_rate < 0.1
+
+
+def test_spillable_hash_spill_budget():
+    memory = c.MEGABYTE // 4
+    budget = MemoryBudget(memory, strict=True)
+    capacity = spillable.SpillableHash.capacity_for(memory)
+    spillable_hash = spillable.SpillableHash(capacity, budget, 'hash')
+
+    # spilling into the remaining memory stays within the budget
+    spillable_hash.add_many(array('Q', range(capacity + 100)))
+
+    assert spillable_hash._disk.cardinality == 100
+    assert budget.reservation('hash.spill') == spillable_hash.spill_memory
+    assert budget.reserved <= memory
+    assert sorted(spillable_hash.contains_many(
+        array('Q', range(capacity - 10, capacity + 100))
+    )) == list(range(capacity - 10, capacity + 100))
@@ -1,6 +1,19 @@
+import inspect
+import io
+import logging
+import os
 import subprocess
+import threading
+
+import pytest
+
+from sisu.memory import MemoryBudget
+from sisu.result import Counter, StreamingResult
 import sisu.strategy as strategy
 import sisu.constants as c
+import sisu.external_sort as external_sort
+import sisu.index as index
+import sisu.partition as partition
 import sisu.utils as utils
 
 
@@ -71,18 +84,21 @@ def test_merge_external_sort(datadir):
 
     unsorted_file = str(datadir / 'medium-same-1.lst')
 
-    arbitrary_size = 3 * c.MEGABYTE
+    # small enough to need several runs
+    run_memory = 100 * c.LARGEST_ELEMENT_SIZE
+
+    runs = strategy.Merge.external_sort(unsorted_file, run_memory)
 
-    f = strategy.Merge.external_sort(unsorted_file, arbitrary_size)
+    assert len(runs.paths) > 1
+    assert runs.cardinality == len(utils.read_nums(unsorted_file))
 
     nums = sorted(utils.read_nums(unsorted_file))
-    with open(f.name, 'r') as infile:
-        ints = [
-            int(num.strip()) for num in infile.readlines()
-        ]
+    ints = list(external_sort.merge_runs(runs.paths, 16))
 
     assert ints == nums
 
+    runs.cleanup()
+
 
 def test_hash_intersect(datadir):
     mem_limit = c.MEGABYTE
@@ -95,6 +111,22 @@ def test_hash_intersect(datadir):
     _strategy_test_helper(datadir, strategy.Hash, 'medium-same', mem_limit)
     _strategy_test_helper(datadir, strategy.Hash, 'medium-diff', mem_limit)
 
+    _strategy_test_helper(datadir, strategy.Hash, 'medium-diff', mem_limit,
+                          reader=utils.MappedReader())
+
+    # a build hash too small for file1 spills and gets a bloom filter
+    config = dict(strategy.Hash.DEFAULT_CONFIG, line_count_margin=1/8)
+    _, bloom_memory, _, _ = strategy.Hash.determine_memory(
+        str(datadir / 'medium-same-0.lst'), str(datadir / 'medium-same-1.lst'),
+        mem_limit, **config
+    )
+    assert bloom_memory
+
+    _strategy_test_helper(datadir, strategy.Hash, 'medium-same', mem_limit,
+                          **config)
+    _strategy_test_helper(datadir, strategy.Hash, 'medium-diff', mem_limit,
+                          **config)
+
     mem_limit = c.MEGABYTE
 
     # _strategy_test_helper(datadir, strategy.Hash, 'medium-large-same',
@@ -104,6 +136,63 @@ def test_hash_intersect(datadir):
     # mem_limit)
 
 
+def test_determine_memory_signatures():
+    # the strategies are sized through the same leading parameters
+    expected = ['file1', 'file2', 'mem_limit', 'reader', 'result_memory',
+                'config']
+    for strat in (strategy.Hash, strategy.GraceHash, strategy.Merge,
+                  strategy.Radix, strategy.Bitmap):
+        assert list(
+            inspect.signature(strat.determine_memory).parameters
+        ) == expected
+
+
+def test_grace_hash_partitions_needed():
+    assert strategy.GraceHash.partitions_needed(10, 100) == 1
+    assert strategy.GraceHash.partitions_needed(100, 100) == 1
+    assert strategy.GraceHash.partitions_needed(101, 100) == 2
+    assert strategy.GraceHash.partitions_needed(500, 100) == 8
+
+
+def test_grace_hash_intersect(datadir):
+    mem_limit = c.MEGABYTE
+
+    _strategy_test_helper(datadir, strategy.GraceHash, 'small-diff',
+                          mem_limit)
+    _strategy_test_helper(datadir, strategy.GraceHash, 'small-same',
+                          mem_limit)
+    _strategy_test_helper(datadir, strategy.GraceHash, 'medium-same',
+                          mem_limit)
+    _strategy_test_helper(datadir, strategy.GraceHash, 'medium-diff',
+                          mem_limit)
+
+    # force partitions to be split up recursively
+    config = dict(strategy.GraceHash.DEFAULT_CONFIG, max_partitions=2)
+    mem_limit = c.MEGABYTE // 8
+
+    _strategy_test_helper(datadir, strategy.GraceHash, 'medium-large-diff',
+                          mem_limit, **config)
+
+
+def test_grace_hash_recursion_memory(tmpdir):
+    # the first partition is joined in memory and only the second is split
+    # up further, which gets the memory of the first build hash
+    small = [num for num in range(2000) if partition.partition_of(num, 1) == 0]
+    large = [num for num in range(100000)
+             if partition.partition_of(num, 1) == 1]
+    path = str(tmpdir / 'skewed.lst')
+    with open(path, 'w') as outfile:
+        outfile.writelines(f'{num}\n' for num in small[:100] + large[:20000])
+
+    config = dict(strategy.GraceHash.DEFAULT_CONFIG, max_partitions=2)
+    mem_limit = c.MEGABYTE // 8
+    budget = MemoryBudget(mem_limit)
+    result = strategy.GraceHash.intersect(path, path, mem_limit,
+                                          budget=budget, **config)
+    assert result.cardinality == 20100
+    assert budget.peak_reserved <= mem_limit
+
+
 def test_merge_strategy(datadir):
     mem_limit = c.MEGABYTE
 
@@ -113,7 +202,289 @@ def test_merge_strategy(datadir):
     _strategy_test_helper(datadir, strategy.Merge, 'medium-same', mem_limit)
     _strategy_test_helper(datadir, strategy.Merge, 'medium-diff', mem_limit)
 
+    _strategy_test_helper(datadir, strategy.Merge, 'medium-diff', mem_limit,
+                          reader=utils.MappedReader())
+
     # _strategy_test_helper(datadir, strategy.Hash, 'medium-large-same',
     # mem_limit)
     # _strategy_test_helper(datadir, strategy.Hash, 'medium-large-diff',
     # mem_limit)
+
+
+def test_radix_strategy(datadir):
+    mem_limit = c.MEGABYTE
+
+    _strategy_test_helper(datadir, strategy.Radix, 'small-diff', mem_limit)
+    _strategy_test_helper(datadir, strategy.Radix, 'medium-same', mem_limit)
+    _strategy_test_helper(datadir, strategy.Radix, 'medium-large-diff',
+                          mem_limit)
+
+    # partitions which do not fit are split up by range again
+    config = dict(strategy.Radix.DEFAULT_CONFIG, max_partitions=2)
+    _strategy_test_helper(datadir, strategy.Radix, 'medium-large-diff',
+                          mem_limit, **config)
+
+
+def test_bitmap_strategy(datadir):
+    mem_limit = c.MEGABYTE
+
+    _strategy_test_helper(datadir, strategy.Bitmap, 'small-diff', mem_limit)
+    _strategy_test_helper(datadir, strategy.Bitmap, 'medium-same', mem_limit)
+    _strategy_test_helper(datadir, strategy.Bitmap, 'medium-large-diff',
+                          mem_limit)
+
+    # chunks which do not fit are intersected a window of keys at a time
+    config = dict(strategy.Bitmap.DEFAULT_CONFIG, chunk_count_margin=100)
+    n_windows, _, _, _ = strategy.Bitmap.determine_memory(
+        str(datadir / 'medium-large-diff-0.lst'),
+        str(datadir / 'medium-large-diff-1.lst'), mem_limit, **config
+    )
+    assert n_windows > 1
+    _strategy_test_helper(datadir, strategy.Bitmap, 'medium-large-diff',
+                          mem_limit, **config)
+
+
+def test_indexed_strategy(datadir, tmpdir):
+    mem_limit = c.MEGABYTE
+
+    # without an index one is built over the smaller file
+    _strategy_test_helper(datadir, strategy.Indexed, 'small-diff', mem_limit)
+    _strategy_test_helper(datadir, strategy.Indexed, 'medium-same', mem_limit)
+    _strategy_test_helper(datadir, strategy.Indexed, 'medium-large-diff',
+                          mem_limit)
+
+    file1 = str(datadir / 'medium-large-diff-0.lst')
+    file2 = str(datadir / 'medium-large-diff-1.lst')
+    expected = _file_len(str(datadir / 'medium-large-diff-intersection.lst'))
+    index1 = str(tmpdir / 'index-0')
+    index2 = str(tmpdir / 'index-1')
+    index.build(file1, index1, mem_limit,
+                bloom_bits=c.BLOOM_BITS_PER_VALUE)
+    index.build(file2, index2, mem_limit)
+
+    # the index comes first or second, or both files are indexes
+    for pair in ((index1, file2), (file2, index1), (index2, index1)):
+        budget = MemoryBudget(mem_limit, strict=True)
+        result = strategy.Indexed.intersect(*pair, mem_limit, budget=budget,
+                                            result=Counter())
+        assert result.cardinality == expected
+        assert set(budget._reservations) <= {'result'}
+
+    # the filter of the index is only read when it fits
+    assert strategy.Indexed.determine_memory(
+        index.Index(index1), file2, mem_limit
+    )[0] > 0
+    config = dict(strategy.Indexed.DEFAULT_CONFIG, bloom_memory_threshold=0)
+    assert strategy.Indexed.determine_memory(
+        index.Index(index1), file2, mem_limit, **config
+    )[0] == 0
+    assert strategy.Indexed.intersect(
+        index1, file2, mem_limit, **config
+    ).cardinality == expected
+
+
+def test_streamed_strategy(datadir, tmpdir, caplog):
+    mem_limit = c.MEGABYTE
+    _strategy_test_helper(datadir, strategy.Streamed, 'small-diff', mem_limit)
+    _strategy_test_helper(datadir, strategy.Streamed, 'medium-large-diff',
+                          mem_limit)
+
+    # the smaller file fits in the table, the larger one does not
+    file1 = str(datadir / 'medium-large-diff-0.lst')
+    file2 = str(datadir / 'medium-large-diff-1.lst')
+    expected = _file_len(str(datadir / 'medium-large-diff-intersection.lst'))
+
+    # a stream which fits is probed, otherwise the file which fits is. Only
+    # two streams which do not fit are partitioned.
+    for pair, partitioned in (
+        ((io.BytesIO, str), False),
+        ((str, io.BytesIO), False),
+        ((io.BytesIO, io.BytesIO), False),
+        ((io.BytesIO, io.BytesIO), True),
+    ):
+        paths = (file2, file1) if partitioned else (file1, file2)
+        inputs = [
+            kind(open(path, 'rb').read()) if kind is io.BytesIO else path
+            for kind, path in zip(pair, paths)
+        ]
+        budget = MemoryBudget(mem_limit)
+        caplog.clear()
+        with caplog.at_level(logging.INFO, logger='sisu.strategy'):
+            result = strategy.Streamed.intersect(*inputs, mem_limit,
+                                                 budget=budget,
+                                                 result=Counter())
+        assert result.cardinality == expected
+        assert ('partitioning' in caplog.text) == partitioned
+        assert budget.peak_reserved <= mem_limit
+        assert set(budget._reservations) <= {'result'}
+
+    # a named pipe is read as it is written
+    fifo = str(tmpdir / 'fifo')
+    os.mkfifo(fifo)
+    assert utils.is_stream(fifo)
+    assert not utils.is_stream(file1)
+
+    def write():
+        with open(fifo, 'wb') as outfile, open(file2, 'rb') as infile:
+            outfile.write(infile.read())
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    assert strategy.Streamed.intersect(
+        file1, fifo, mem_limit
+    ).cardinality == expected
+    writer.join()
+
+
+def test_approximate_strategy(datadir):
+    mem_limit = c.MEGABYTE
+
+    # sketches of small files hold every hash, so the estimate is exact
+    estimate = strategy.Approximate.intersect(
+        str(datadir / 'medium-diff-0.lst'), str(datadir / 'medium-diff-1.lst'),
+        mem_limit
+    )
+    assert estimate.cardinality == 82
+    assert estimate.error == 0
+
+    budget = MemoryBudget(mem_limit)
+    estimate = strategy.Approximate.intersect(
+        str(datadir / 'medium-large-same-0.lst'),
+        str(datadir / 'medium-large-same-1.lst'), mem_limit, budget=budget
+    )
+    expected = _file_len(str(datadir / 'medium-large-same-intersection.lst'))
+    low, high = estimate.bounds(errors=4)
+    assert low <= expected <= high
+    assert budget.peak_reserved <= mem_limit
+
+    with pytest.raises(ValueError):
+        strategy.Approximate.intersect(
+            str(datadir / 'medium-diff-0.lst'),
+            str(datadir / 'medium-diff-1.lst'), mem_limit, result=Counter()
+        )
+
+
+def test_strict_memory_budget(datadir):
+    mem_limit = c.MEGABYTE
+
+    for strat in (strategy.Hash, strategy.GraceHash, strategy.Merge,
+                  strategy.Radix, strategy.Bitmap):
+        budget = MemoryBudget(mem_limit, strict=True)
+        with budget.track():
+            _strategy_test_helper(datadir, strat, 'medium-diff', mem_limit,
+                                  budget=budget)
+
+        assert budget.peak_reserved <= mem_limit
+        assert budget.measured_peak <= mem_limit
+        # only the returned result set is still holding memory
+        assert set(budget._reservations) <= {'result_hash',
+                                             'result_hash.spill'}
+
+
+def test_result_sinks(datadir, tmpdir):
+    mem_limit = c.MEGABYTE
+
+    for strat in (strategy.Naive, strategy.Hash, strategy.GraceHash,
+                  strategy.Merge, strategy.Radix, strategy.Bitmap):
+        result = Counter()
+        _strategy_test_helper(datadir, strat, 'medium-same', mem_limit,
+                              result=result)
+
+        output = str(tmpdir / f'{strat.__name__}.lst')
+        budget = MemoryBudget(mem_limit, strict=True)
+        with StreamingResult(output) as result:
+            _strategy_test_helper(datadir, strat, 'medium-diff', mem_limit,
+                                  budget=budget, result=result)
+
+        assert utils.read_nums(output) == utils.read_nums(
+            str(datadir / 'medium-diff-intersection.lst')
+        )
+        # nothing but the sink is left reserved
+        assert set(budget._reservations) <= {'result'}
+
+
+def test_intersect_many(datadir, tmpdir):
+    mem_limit = c.MEGABYTE
+    files = [str(datadir / f'medium-same-{type_}.lst')
+             for type_ in ('0', '1', 'intersection')]
+    files.append(str(datadir / 'medium-diff-1.lst'))
+
+    expected = set.intersection(*map(utils.read_nums, files))
+
+    for strat in (strategy.Hash, strategy.Merge):
+        assert strat.multiway
+        budget = MemoryBudget(mem_limit, strict=True)
+        output = str(tmpdir / f'{strat.__name__}.lst')
+        with StreamingResult(output) as result:
+            strat.intersect_many(files, mem_limit, budget=budget,
+                                 result=result)
+        assert utils.read_nums(output) == expected
+        # nothing but the sink is left reserved
+        assert set(budget._reservations) <= {'result'}
+
+        # without a result the survivors are returned
+        assert strat.intersect_many(files, mem_limit).cardinality == \
+            len(expected)
+
+    # the others intersect a pair at a time
+    assert not strategy.GraceHash.multiway
+    result = strategy.GraceHash.intersect_many(files, mem_limit,
+                                               result=Counter())
+    assert result.cardinality == len(expected)
+
+    # two files are a plain intersection
+    assert strategy.Merge.intersect_many(
+        files[:2], mem_limit, result=Counter()
+    ).cardinality == _file_len(files[2])
+
+    with pytest.raises(ValueError):
+        strategy.GraceHash.intersect_many(files[:1], mem_limit)
+
+
+def test_combine(datadir):
+    mem_limit = c.MEGABYTE
+    for name in ('small-diff', 'medium-diff', 'medium-same'):
+        file1 = str(datadir / f'{name}-0.lst')
+        file2 = str(datadir / f'{name}-1.lst')
+        nums1 = utils.read_nums(file1)
+        nums2 = utils.read_nums(file2)
+        expected = {
+            'intersect': nums1 & nums2,
+            'union': nums1 | nums2,
+            'difference': nums1 - nums2,
+            'symdiff': nums1 ^ nums2,
+        }
+
+        for strat in (strategy.Hash, strategy.Merge):
+            for op in c.SET_OPERATIONS:
+                budget = MemoryBudget(mem_limit, strict=True)
+                result = strat.combine(file1, file2, mem_limit, op,
+                                       budget=budget)
+                assert {num for block in result.blocks(c.MEGABYTE)
+                        for num in block} == expected[op]
+            # a difference keeps the order of the files
+            assert strat.combine(
+                file2, file1, mem_limit, 'difference', result=Counter()
+            ).cardinality == len(nums2 - nums1)
+
+    # files larger than the memory limit
+    file1 = str(datadir / 'medium-large-diff-0.lst')
+    file2 = str(datadir / 'medium-large-diff-1.lst')
+    nums1 = utils.read_nums(file1)
+    nums2 = utils.read_nums(file2)
+    for strat in (strategy.Hash, strategy.Merge):
+        budget = MemoryBudget(mem_limit, strict=True)
+        result = strat.combine(file1, file2, mem_limit, 'symdiff',
+                               budget=budget, result=Counter())
+        assert result.cardinality == len(nums1 ^ nums2)
+        assert set(budget._reservations) <= {'result'}
+        assert strat.combine(
+            file2, file1, mem_limit, 'difference', result=Counter()
+        ).cardinality == len(nums2 - nums1)
+
+    # the other strategies only intersect
+    assert strategy.GraceHash.combine(
+        file1, file2, mem_limit, result=Counter()
+    ).cardinality == len(nums1 & nums2)
+    with pytest.raises(ValueError):
+        strategy.GraceHash.combine(file1, file2, mem_limit, 'union')
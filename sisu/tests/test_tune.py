@@ -0,0 +1,20 @@
+import sisu.tune as tune
+
+
+def test_grid_points():
+    points = list(tune.grid_points({'b': (1, 2), 'a': (3,)}))
+    assert points == [{'a': 3, 'b': 1}, {'a': 3, 'b': 2}]
+
+
+def test_tune(tmpdir):
+    grids = {'Merge': {'line_count_margin': (1, 2)}}
+    corpus = {'small': ((300, 2, 1/2, 1),)}
+    logged = []
+
+    profile = tune.tune(str(tmpdir), grids=grids, corpus=corpus,
+                        log=logged.append)
+
+    assert len(logged) == 2
+    assert set(profile) == {'Merge'}
+    assert set(profile['Merge']) == {'small'}
+    assert profile['Merge']['small'] in list(tune.grid_points(grids['Merge']))
@@ -1,4 +1,7 @@
+from array import array
 import argparse
+import io
+import mmap
 import os
 import random as r
 
@@ -46,6 +49,56 @@ def test_parse_args():
     }
 
     assert actual == expected
+    assert not parsed_args.mmap
+    assert not parsed_args.strict_memory
+    assert parsed_args.workers == 1
+    assert parsed_args.output is None
+    assert not parsed_args.explain
+    assert not parsed_args.approx
+
+    # an estimate has no values to write
+    with mock.patch.object(os.path, 'isfile') as isfile, \
+            mock.patch.object(os.path, 'getsize') as getsize:
+        isfile.return_value = True
+        getsize.return_value = 10000000
+        with pytest.raises(argparse.ArgumentTypeError):
+            utils.parse_args(args + ['--approx', '--output', 'out.lst'])
+
+        # more files
+        assert parsed_args.files == ['hello', 'world']
+        parsed_args = utils.parse_args(args + ['--more_files', 'a', 'b'])
+        assert parsed_args.files == ['hello', 'world', 'a', 'b']
+        # are intersected exactly on one process
+        with pytest.raises(argparse.ArgumentTypeError):
+            utils.parse_args(args + ['--more_files', 'a', '--workers', '2'])
+
+        # set operations
+        assert parsed_args.op == 'intersect'
+        assert utils.parse_args(args + ['--op', 'symdiff']).op == 'symdiff'
+        # are of two files on one process
+        with pytest.raises(argparse.ArgumentTypeError):
+            utils.parse_args(args + ['--op', 'union', '--more_files', 'a'])
+        with pytest.raises(argparse.ArgumentTypeError):
+            utils.parse_args(args + ['--op', 'union', '--workers', '2'])
+
+        # a checkpoint is of the intersection of two files
+        assert parsed_args.checkpoint is None
+        assert utils.parse_args(args + ['--checkpoint', 'c']).checkpoint == \
+            'c'
+        with pytest.raises(argparse.ArgumentTypeError):
+            utils.parse_args(args + ['--checkpoint', 'c', '--approx'])
+        with pytest.raises(argparse.ArgumentTypeError):
+            utils.parse_args(args + ['--checkpoint', 'c', '--op', 'union'])
+
+        # stdin is read once by an exact intersection of two inputs
+        assert utils.parse_args(args + ['--file_1', '-']).files == \
+            ['-', 'world']
+        with pytest.raises(argparse.ArgumentTypeError):
+            utils.parse_args(args + ['--file_1', '-', '--file_2', '-'])
+        with pytest.raises(argparse.ArgumentTypeError):
+            utils.parse_args(args + ['--file_1', '-', '--workers', '2'])
+        with pytest.raises(argparse.ArgumentTypeError):
+            utils.parse_args(args + ['--file_1', '-', '--mmap'])
 
     expected = {
         'mem_limit': -1,
@@ -110,6 +163,140 @@ def test_read_file_by_block(datadir):
     assert set(map(int, flat)) == utils.read_nums(path)
 
 
+def test_read_file_by_block_offsets(datadir, tmpdir):
+    path = str(tmpdir / 'appended.lst')
+    with open(str(datadir / 'small-same-0.lst'), 'rb') as infile:
+        lines = infile.readlines()
+    with open(path, 'wb') as outfile:
+        outfile.writelines(lines)
+        outfile.write(b'123')
+
+    # a line without a newline is read unless it may still be appended to
+    end = utils.line_end(path)
+    assert end == os.path.getsize(path) - 3
+    assert sum(utils.read_file_by_block(path, 7), []) == \
+        list(map(int, lines)) + [123]
+    assert sum(utils.read_file_by_block(path, 7, complete_lines=True), []) \
+        == list(map(int, lines))
+
+    start = len(b''.join(lines[:10]))
+    stop = len(b''.join(lines[:25]))
+    blocks = list(utils.read_file_by_block(path, 4, start, stop,
+                                           block_bytes=64))
+    assert list(map(len, blocks)) == [4, 4, 4, 3]
+    assert sum(blocks, []) == list(map(int, lines[10:25]))
+
+
+def test_read_stream(datadir):
+    path = str(datadir / 'medium-same-0.lst')
+    with open(path, 'rb') as infile:
+        stream = io.BytesIO(infile.read())
+    assert utils.is_stream(stream)
+    assert utils.is_stream('-')
+
+    reader = utils.FileReader()
+    blocks = list(reader.blocks(stream, constants.MIN_READ_SIZE))
+    assert len(blocks) > 1
+    assert set(sum(map(list, blocks), [])) == utils.read_nums(path)
+    # the size of a stream is not known
+    assert reader.bytes_read == 0
+
+
+def test_read_packed_blocks(datadir, tmpdir):
+    path = os.path.join(str(datadir), 'medium-same-0.lst')
+    blocks = list(utils.read_packed_blocks(path, constants.MIN_READ_SIZE))
+
+    # numbers split between buffers are stitched back together
+    assert len(blocks) > 1
+    assert all(block.typecode == 'Q' for block in blocks)
+    assert sum(map(len, blocks)) == 1000
+    assert set().union(*blocks) == utils.read_nums(path)
+
+    # no trailing newline
+    path = os.path.join(tmpdir, 'no-newline.lst')
+    with open(path, 'w') as outfile:
+        outfile.write('1\n22\n333')
+
+    blocks = utils.read_packed_blocks(path, 1)
+    assert sum(map(list, blocks), []) == [1, 22, 333]
+
+
+def test_mapped_reader(datadir, tmpdir):
+    path = os.path.join(str(datadir), 'medium-large-diff-0.lst')
+    size = os.path.getsize(path)
+    block_bytes = 4 * mmap.PAGESIZE
+
+    reader = utils.MappedReader()
+    blocks = list(reader.blocks(path, block_bytes))
+
+    assert len(blocks) > 1
+    assert sum(map(len, blocks)) == 30000
+    assert set().union(*blocks) == utils.read_nums(path)
+
+    # stats
+    assert reader.bytes_read == size
+    assert reader.touched_bytes == size
+    if hasattr(mmap, 'MADV_DONTNEED'):
+        assert reader.peak_resident_bytes <= block_bytes + mmap.PAGESIZE
+
+    # lines longer than a block and no trailing newline
+    path = os.path.join(tmpdir, 'long-lines.lst')
+    with open(path, 'w') as outfile:
+        outfile.write('1\n' + '0' * 100 + '7\n333')
+
+    blocks = reader.blocks(path, 1)
+    assert sum(map(list, blocks), []) == [1, 7, 333]
+
+    # empty file
+    path = os.path.join(tmpdir, 'empty.lst')
+    open(path, 'w').close()
+    assert list(reader.blocks(path, 1)) == []
+
+
+def test_line_ranges(datadir):
+    path = os.path.join(str(datadir), 'medium-same-0.lst')
+    nums = utils.read_nums(path)
+
+    ranges = utils.line_ranges(path, 3)
+    assert len(ranges) == 3
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == os.path.getsize(path)
+
+    # every range is read on its own, by both readers
+    for reader in (utils.FileReader(), utils.MappedReader()):
+        blocks = [
+            block
+            for start, end in ranges
+            for block in reader.blocks(path, constants.MIN_READ_SIZE,
+                                       start, end)
+        ]
+        assert sum(map(len, blocks)) == len(nums)
+        assert set().union(*blocks) == nums
+        assert reader.bytes_read == os.path.getsize(path)
+
+    # more ranges than lines
+    path = os.path.join(str(datadir), 'small-same-0.lst')
+    assert len(utils.line_ranges(path, 1000)) == 100
+
+
+def test_packed_reader(tmpdir):
+    path = os.path.join(tmpdir, 'packed')
+    with open(path, 'wb') as outfile:
+        array('Q', range(100)).tofile(outfile)
+
+    reader = utils.PackedReader()
+    assert reader.estimate_count(path) == 100
+
+    blocks = list(reader.blocks(path, 10 * constants.SIZE_UINT64))
+    assert len(blocks) == 10
+    assert sum(map(list, blocks), []) == list(range(100))
+
+    blocks = reader.blocks(path, 64, 10 * constants.SIZE_UINT64,
+                           20 * constants.SIZE_UINT64)
+    assert sum(map(list, blocks), []) == list(range(10, 20))
+    assert reader.bytes_read == 110 * constants.SIZE_UINT64
+
+
 def test_require_int():
 
     @utils.require_int
@@ -144,6 +331,15 @@ def test_reorder_by_file_size():
         mock_func.foo.assert_called_with('file1', 'file2', mem_limit)
 
 
+def test_order_by_file_size():
+    sizes = {'a': 300, 'b': 100, 'c': 300, 'd': 200}
+
+    with mock.patch.object(os.path, 'getsize') as getsize:
+        getsize.side_effect = lambda x: sizes[x]
+        # files of the same size keep their order
+        assert utils.order_by_file_size('abcd') == ['b', 'd', 'a', 'c']
+
+
 def test_read_nums(tmpdir, ten_random_one):
 
     r.seed(0)
@@ -161,6 +357,26 @@ def test_mb_to_bytes():
     assert utils.mb_to_bytes(2.34) == int(constants.MEGABYTE * 2.34)
 
 
+def test_estimate_line_count(datadir, tmpdir):
+    path = str(datadir / 'medium-same-0.lst')
+    lines = len(utils.read_nums(path))
+
+    # small files are counted exactly
+    assert utils.estimate_line_count(path) == lines
+
+    estimate = utils.estimate_line_count(path, sample_size=1000)
+    assert abs(estimate - lines) < lines / 10
+
+    path = f'{tmpdir}/lines'
+    with open(path, 'w') as outfile:
+        outfile.write('1\n2')
+    assert utils.estimate_line_count(path) == 2
+
+    with open(path, 'w') as outfile:
+        outfile.write('')
+    assert utils.estimate_line_count(path) == 0
+
+
 def test_bytes_to_ints():
     assert utils.bytes_to_ints(1000) == 1000 // constants.SIZE_INT
     assert utils.bytes_to_ints(1234) == 1234 // constants.SIZE_INT
@@ -0,0 +1,202 @@
+import argparse
+import itertools
+import time
+
+from sisu.memory import MemoryBudget
+from sisu.result import Counter
+import sisu.benchmark as benchmark
+import sisu.constants as c
+import sisu.profiles as profiles
+
+# the values every tuned config parameter is tried with
+GRIDS = {
+    'Hash': {
+        'line_count_margin': (1, 11/10, 5/4),
+        'build_hash_memory_threshold': (4/10, 6/10, 8/10),
+        'result_hash': (2/10, 6/10),
+    },
+    'GraceHash': {
+        'line_count_margin': (1, 5/4),
+        'result_hash': (1/10, 2/10, 4/10),
+        'build_memory_threshold': (4/10, 6/10, 8/10),
+    },
+    'Radix': {
+        'result_hash': (1/10, 2/10, 4/10),
+        'join_memory_threshold': (4/10, 6/10, 8/10),
+    },
+    'Merge': {
+        'line_count_margin': (1, 11/10, 5/4),
+        'result_hash_threshold': (4/10, 6/10, 8/10),
+        'delta_runs': (False, True),
+    },
+}
+
+# representative datasets of every regime, see `profiles.REGIMES`: the lines
+# of the smaller file, the size of the larger file relative to it, the
+# fraction of the smaller file in both files and the budget in megabytes.
+# Ids take about 20 bytes a line.
+CORPUS = {
+    'small': ((10000, 1, 1/2, 1), (20000, 10, 1/10, 4)),
+    'medium': ((50000, 1, 1/2, 1), (200000, 4, 1/10, 4)),
+    'large': ((300000, 1, 1/2, 1),),
+}
+
+
+def grid_points(grid):
+    """Yields every combination of the values of `grid`.
+
+    Parameters
+    ----------
+    grid : dict of str to tuple
+
+    Yields
+    ------
+    dict
+    """
+    names = sorted(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def measure(strat, file1, file2, mem_limit, config, expected, repeat=1,
+            count_only=False):
+    """Returns the fastest of `repeat` runs of `strat` in seconds, or None if
+    it found the wrong cardinality or reserved more than `mem_limit`. The
+    intersection is kept in a result set, or only counted if `count_only`
+    is set.
+
+    Returns
+    ------
+    float U None
+    """
+    fastest = float('inf')
+    for _ in range(repeat):
+        budget = MemoryBudget(mem_limit)
+        start = time.perf_counter()
+        result = strat.intersect(file1, file2, mem_limit, budget=budget,
+                                 result=Counter() if count_only else None,
+                                 **config)
+        fastest = min(fastest, time.perf_counter() - start)
+
+        if result.cardinality != expected or \
+                budget.peak_reserved > mem_limit:
+            return None
+    return fastest
+
+
+def tune(data_dir, names=None, grids=None, corpus=None, repeat=1,
+         count_only=False, log=print):
+    """Grid searches the config of every strategy in every regime. A config
+    is scored by its total run time over the datasets of the regime.
+
+    Parameters
+    ----------
+    data_dir : str
+        Datasets are generated in, and reused from, this dir
+    names : list of str, optional
+        Names of the strategies to tune. Tunes every strategy of `grids` if
+        None
+    grids : dict, optional
+        See `GRIDS`
+    corpus : dict, optional
+        See `CORPUS`
+    repeat : int, optional
+        Runs per dataset, the fastest counts
+    count_only : bool, optional
+        Tune for runs which only count the intersection. The result set
+        parameters of a config only matter when the intersection is kept.
+    log : callable, optional
+        Called with a line of progress per config
+
+    Returns
+    ------
+    dict
+        The best config of every regime by strategy name, see
+        `profiles.load_profile`
+    """
+    grids = grids or GRIDS
+    corpus = corpus or CORPUS
+    strategies = benchmark.strategies()
+    profile = {}
+
+    for name in names or sorted(grids):
+        strat = strategies[name]
+        profile[name] = {}
+        for regime, shapes in corpus.items():
+            datasets = [
+                benchmark.dataset(data_dir, lines, ratio, overlap) +
+                (budget * c.MEGABYTE,)
+                for lines, ratio, overlap, budget in shapes
+            ]
+
+            best, best_seconds = None, float('inf')
+            for point in grid_points(grids[name]):
+                config = dict(strat.DEFAULT_CONFIG, **point)
+                seconds = 0
+                for file1, file2, expected, mem_limit in datasets:
+                    measured = measure(strat, file1, file2, mem_limit,
+                                       config, expected, repeat, count_only)
+                    seconds = float('inf') if measured is None \
+                        else seconds + measured
+                    # the config can not win any more
+                    if seconds >= best_seconds:
+                        break
+
+                log(f'{name} {regime} {point}: {seconds:.3f} seconds')
+                if seconds < best_seconds:
+                    best, best_seconds = point, seconds
+
+            if best is not None:
+                profile[name][regime] = best
+    return profile
+
+
+def parse_args(args=None):
+    """Parses the command line args of the tuning.
+
+    Parameters
+    ----------
+    args : list of str, optional
+        Reads from argv if None
+
+    Returns
+    ------
+    Namespace
+    """
+    parser = argparse.ArgumentParser(
+        description='Grid search the memory splits of the strategies'
+    )
+    parser.add_argument('--strategies', nargs='+', choices=sorted(GRIDS),
+                        help='Tunes every strategy if not given')
+    parser.add_argument('--data_dir', default='benchmark-data',
+                        help='Where datasets are generated and reused from')
+    parser.add_argument('--profile', help='Where to save the tuned configs, '
+                        'see `profiles.profile_path` for the default')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--count_only', action='store_true',
+                        help='Tune for runs which only count the '
+                        'intersection, like the command line does')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Tunes the strategies and saves their configs, keeping the saved
+    configs of strategies which were not tuned this time.
+    """
+    args = parse_args(args)
+    tuned = tune(args.data_dir, args.strategies, repeat=args.repeat,
+                 count_only=args.count_only)
+
+    profile = dict(profiles.load_profile(args.profile))
+    for name, regimes in tuned.items():
+        profile[name] = dict(profile.get(name, {}), **regimes)
+    path = profiles.save_profile(profile, args.profile)
+
+    for name, regimes in tuned.items():
+        for regime, config in regimes.items():
+            print(f'{name} {regime}: {config}')
+    print(f'Saved to {path}')
+
+
+if __name__ == '__main__':
+    main()
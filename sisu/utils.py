@@ -1,18 +1,26 @@
-from itertools import islice
+from array import array
+from itertools import chain, islice
 import argparse
+import contextlib
+import mmap
 import os
 import random as r
+import stat
+import sys
 import time
 from functools import wraps
 
+from sisu.packed import read_packed
 import sisu.constants as c
+import sisu.estimate as estimate
 
 
 def parse_args(args=None):
     """Parses command line args and validates the following conditions
 
-        * Files exists
-        * Files are smaller than 500 MB
+        * Files exists, `files` lists all of them
+        * Files are smaller than 500 MB, streams like `-` for stdin or a
+        named pipe are not checked
         * Memlimit is greater than 1MB
 
     Parameters
@@ -31,22 +39,80 @@ def parse_args(args=None):
     parser.add_argument(
         '--file_1',
         required=True,
-        help='The first file containing newline delimited ascii numbers.',
+        help='The first file containing newline delimited ascii numbers, '
+        '- for stdin or a named pipe.',
         type=str)
 
     parser.add_argument(
         '--file_2',
         required=True,
-        help='The second file containing newline delimited ascii numbers.',
+        help='The second file containing newline delimited ascii numbers, '
+        '- for stdin or a named pipe.',
         type=str
     )
 
+    parser.add_argument(
+        '--more_files',
+        nargs='+',
+        default=[],
+        help='Further files whose numbers the intersection also has to be '
+        'in.',
+        type=str
+    )
+
+    parser.add_argument(
+        '--op',
+        choices=c.SET_OPERATIONS,
+        default='intersect',
+        help='The set operation of the two files. A difference holds the '
+        'numbers of the first file which are not in the second.')
+
     parser.add_argument(
         '--mem_limit',
         required=True,
         help='The upper limit for RAM in MB',
         type=lambda x: float(x) * c.MEGABYTE)
 
+    parser.add_argument(
+        '--mmap',
+        help='Scan the input files through memory maps.',
+        action='store_true')
+
+    parser.add_argument(
+        '--strict_memory',
+        help='Measure allocations and fail when the memory limit is exceeded.',
+        action='store_true')
+
+    parser.add_argument(
+        '--output',
+        help='Write the intersecting numbers, or those of --op, to this '
+        'file.',
+        type=str)
+
+    parser.add_argument(
+        '--workers',
+        help='Intersect partitions of the files on this many processes.',
+        default=1,
+        type=int)
+
+    parser.add_argument(
+        '--explain',
+        help='Print the predicted cost of every strategy.',
+        action='store_true')
+
+    parser.add_argument(
+        '--approx',
+        help='Estimate the cardinality from sketches of the files in one '
+        'pass.',
+        action='store_true')
+
+    parser.add_argument(
+        '--checkpoint',
+        help='Keep the intersection of two files which grow by appending '
+        'lines up to date in this file. Only the lines appended since it was '
+        'saved are read.',
+        type=str)
+
     parsed_args = parser.parse_args(args)
 
     if parsed_args.mem_limit < c.MIN_MEMORY_BUDGET:
@@ -54,7 +120,54 @@ def parse_args(args=None):
             f'A memory limit of {parsed_args.mem_limit} is too small.'
         )
 
-    for f in {parsed_args.file_1, parsed_args.file_2}:
+    if parsed_args.workers < 1:
+        raise argparse.ArgumentTypeError(
+            f'{parsed_args.workers} workers are too few.'
+        )
+
+    if parsed_args.approx and (parsed_args.output or parsed_args.workers > 1):
+        raise argparse.ArgumentTypeError(
+            'An approximate intersection has no values to output and runs '
+            'on one process.'
+        )
+
+    parsed_args.files = [parsed_args.file_1, parsed_args.file_2] + \
+        parsed_args.more_files
+    if len(parsed_args.files) > 2 and (parsed_args.approx or
+                                       parsed_args.workers > 1):
+        raise argparse.ArgumentTypeError(
+            'More than two files are intersected exactly and on one process.'
+        )
+
+    if parsed_args.op != 'intersect' and (len(parsed_args.files) > 2 or
+                                          parsed_args.approx or
+                                          parsed_args.workers > 1):
+        raise argparse.ArgumentTypeError(
+            f'A {parsed_args.op} is of two files, exact and on one process.'
+        )
+
+    if parsed_args.checkpoint and (len(parsed_args.files) > 2 or
+                                   parsed_args.op != 'intersect' or
+                                   parsed_args.approx or
+                                   parsed_args.workers > 1):
+        raise argparse.ArgumentTypeError(
+            'A checkpoint is of the exact intersection of two files, kept on '
+            'one process.'
+        )
+
+    streams = [f for f in parsed_args.files if is_stream(f)]
+    if streams and (len(parsed_args.files) > 2 or
+                    parsed_args.op != 'intersect' or parsed_args.approx or
+                    parsed_args.workers > 1 or parsed_args.mmap or
+                    parsed_args.checkpoint):
+        raise argparse.ArgumentTypeError(
+            'A stream is read once, by the exact intersection of two inputs '
+            'on one process, without memory maps or a checkpoint.'
+        )
+    if parsed_args.files.count(c.STDIN) > 1:
+        raise argparse.ArgumentTypeError('Only one input can be stdin.')
+
+    for f in set(parsed_args.files) - set(streams):
         if not os.path.isfile(f):
             raise argparse.ArgumentTypeError(f'The file {f} does not exist.')
 
@@ -215,49 +328,462 @@ def seed():
         print(f'Finished {name} in {end - start} seconds')
 
 
-def read_nums(path):
+def is_stream(file_):
+    """Is `file_` a stream, which can only be read once and whose size is
+    not known: `c.STDIN`, a binary file object, or the path of a named pipe,
+    a character device or a socket?
+
+    Parameters
+    ----------
+    file_ : str U file object
+
+    Returns
+    ------
+    bool
+    """
+    if not isinstance(file_, str):
+        return True
+    if file_ == c.STDIN:
+        return True
+    try:
+        mode = os.stat(file_).st_mode
+    except OSError:
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISCHR(mode) or stat.S_ISSOCK(mode)
+
+
+@contextlib.contextmanager
+def open_binary(file_):
+    """Opens `file_` for unbuffered binary reading. A file object is used as
+    it is and `c.STDIN` is the binary stdin, neither is closed afterwards.
+
+    Parameters
+    ----------
+    file_ : str U file object
+
+    Yields
+    ------
+    file object
+    """
+    if not isinstance(file_, str):
+        yield file_
+    elif file_ == c.STDIN:
+        yield sys.stdin.buffer
+    else:
+        with open(file_, 'rb', buffering=0) as f:
+            yield f
+
+
+def read_nums(path, reader=None):
     """Simple helper function that grabs an entire file
     in memory and parses ints from it
 
     Parameters
     ----------
     path : str
+    reader : FileReader, optional
 
     Returns
     ------
     set of int
     """
 
-    with open(path, 'r') as infile:
-        nums = infile.readlines()
-    return {int(num.strip()) for num in nums}
+    reader = reader or FileReader()
+    nums = set()
+    for block in reader.blocks(path, c.READ_BUFFER_SIZE):
+        nums.update(block)
+    return nums
+
 
+def read_file_by_block(file_, block_size, start=0, end=None,
+                       block_bytes=c.READ_BUFFER_SIZE, complete_lines=False):
+    """Reads `block_size` lines of a file at a time, from the offset `start`
+    on. The lines are parsed in bulk, see `read_packed_blocks`.
 
-def read_file_by_block(file_, block_size):
-    """Reads `block_size`lines of a file  at a time
     Parameters
     ----------
     file_ : str
         The name of a file to fetch from
-    block_size: int , optional
+    block_size: int
         Number of ints to fetch at a time from a list
-
+    start : int, optional
+        Offset to start reading at, on a line boundary
+    end : int, optional
+        Offset to stop reading at, on a line boundary. Reads to the end of
+        the file if None
+    block_bytes : int, optional
+        Number of bytes to read at a time
+    complete_lines : bool, optional
+        Whether to leave a last line without a newline unread when `end` is
+        None. It may still be being appended to, and is read later from its
+        offset, see `line_end`.
 
     Yields
     ------
-    list of str
+    list of int
         Numbers from the file by list (lazily).
     """
+    if complete_lines and end is None:
+        end = line_end(file_)
+    values = chain.from_iterable(
+        read_packed_blocks(file_, block_bytes, start, end)
+    )
+
+    while True:
+        nums = list(islice(values, block_size))
+        if not nums:
+            break
+        yield nums
+
+
+def line_end(path):
+    """Returns the offset just past the last newline of a file, where its
+    complete lines end. Lines after it may still be being appended to.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    ------
+    int
+    """
+    end = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        while end > 0:
+            size = min(end, c.MIN_READ_SIZE)
+            f.seek(end - size)
+            cut = f.read(size).rfind(b'\n')
+            if cut != -1:
+                return end - size + cut + 1
+            end -= size
+    return 0
+
+
+def parse_blocks(buffer_, start, end):
+    """Parses the newline delimited numbers in `buffer_[start:end]` into
+    blocks of packed uint64s. `end` has to be on a line boundary.
+
+    The range is parsed and yielded in 1 / `c.PARSE_PIECES` sized pieces,
+    since splitting creates a python bytes object per line which takes far
+    more memory than the line itself.
+
+    Parameters
+    ----------
+    buffer_ : bytes U bytearray U mmap
+    start : int
+    end : int
+
+    Yields
+    ------
+    array of uint64
+    """
+    piece = max((end - start) // c.PARSE_PIECES, c.MIN_READ_SIZE)
+
+    while start < end:
+        stop = start + piece
+        if stop < end:
+            cut = buffer_.find(b'\n', stop, end)
+            stop = end if cut == -1 else cut + 1
+        else:
+            stop = end
+        block = array('Q', map(int, buffer_[start:stop].split()))
+        start = stop
+        if block:
+            yield block
+
+
+def read_packed_blocks(file_, block_bytes, start=0, end=None):
+    """Reads a file `block_bytes` bytes at a time and parses every buffer
+    into blocks of packed uint64s in bulk, see `parse_blocks`. A number split
+    between two buffers is carried over to the next buffer.
+
+    Reading and parsing needs at most `c.PARSE_OVERHEAD` times `block_bytes`
+    of memory.
 
-    with open(file_, 'r') as f:
+    Parameters
+    ----------
+    file_ : str U file object
+        The name of a file to fetch from, or a stream, see `is_stream`
+    block_bytes: int
+        Number of bytes to read at a time
+    start : int, optional
+        Offset to start reading at, on a line boundary
+    end : int, optional
+        Offset to stop reading at, on a line boundary. Reads to the end of
+        the file if None
 
-        while True:
-            chunk = islice(f, block_size)
-            stripped = (int(num[:-1]) for num in chunk)
-            nums = list(stripped)
-            if not nums:
+    Yields
+    ------
+    array of uint64
+        Numbers from the file by block (lazily).
+    """
+    block_bytes = max(int(block_bytes), c.MIN_READ_SIZE)
+    buffer_ = bytearray(block_bytes)
+    view = memoryview(buffer_)
+
+    with open_binary(file_) as f:
+        if start:
+            f.seek(start)
+        remaining = float('inf') if end is None else end - start
+        carry = 0
+        while remaining > 0:
+            read = f.readinto(view[carry:carry + min(len(view) - carry,
+                                                     remaining)])
+            if not read:
                 break
-            yield nums
+            remaining -= read
+            size = carry + read
+
+            # the last number is incomplete unless the buffer ends on
+            # a line boundary
+            end_ = buffer_.rfind(b'\n', 0, size) + 1
+            yield from parse_blocks(buffer_, 0, end_)
+
+            carry = size - end_
+            buffer_[:carry] = buffer_[end_:size]
+
+            if carry == len(buffer_):
+                # a line longer than the buffer
+                view.release()
+                buffer_.extend(bytes(block_bytes))
+                view = memoryview(buffer_)
+
+        yield from parse_blocks(buffer_, 0, carry)
+
+
+def line_ranges(path, n):
+    """Splits a file into at most `n` byte ranges of about the same size
+    which start and end on line boundaries.
+
+    Parameters
+    ----------
+    path : str
+    n : int
+
+    Returns
+    ------
+    list of (int, int)
+        Start and end offset of every non empty range
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, n):
+            # the range ends after the first newline at or past its share
+            f.seek(max(size * i // n - 1, bounds[-1]))
+            f.readline()
+            bounds.append(min(max(f.tell(), bounds[-1]), size))
+    bounds.append(size)
+
+    return [
+        (start, end) for start, end in zip(bounds, bounds[1:]) if end > start
+    ]
+
+
+class FileReader():
+    """A FileReader reads blocks of packed uint64s through a buffered file
+    object, see `read_packed_blocks`.
+    """
+
+    def __init__(self):
+        """
+        Attributes
+        ---------
+        bytes_read : int
+            The amount of input bytes read so far
+        """
+        self.bytes_read = 0
+
+    def blocks(self, file_, block_bytes, start=0, end=None):
+        """Reads `file_`, or the lines in [`start`, `end`) of it, about
+        `block_bytes` bytes at a time.
+
+        Parameters
+        ----------
+        file_ : str U file object
+            A path or a stream, see `is_stream`
+        block_bytes : int
+        start : int, optional
+        end : int, optional
+
+        Yields
+        ------
+        array of uint64
+        """
+        # the size of a stream is not known, so it is not counted
+        if not is_stream(file_):
+            end_ = os.path.getsize(file_) if end is None else end
+            self.bytes_read += end_ - start
+        return read_packed_blocks(file_, block_bytes, start, end)
+
+    def stats(self, file_):
+        """Returns statistics of `file_` estimated from samples of it, see
+        `estimate.sample_file`.
+
+        Returns
+        ------
+        FileStats
+        """
+        return estimate.file_stats(file_)
+
+    def estimate_count(self, file_):
+        """Returns an estimate of the amount of numbers in `file_`.
+
+        Returns
+        ------
+        int
+        """
+        return self.stats(file_).lines
+
+    def update(self, other):
+        """Adds the counters of a reader which read on another process.
+
+        Parameters
+        ----------
+        other : FileReader
+        """
+        self.bytes_read += other.bytes_read
+
+
+class PackedReader(FileReader):
+    """A PackedReader reads files of packed uint64s, like the partition files
+    of a `PartitionedStore`, see `packed.read_packed`.
+    """
+
+    def blocks(self, file_, block_bytes, start=0, end=None):
+        """Reads the values in [`start`, `end`) bytes of `file_` about
+        `block_bytes` bytes at a time.
+
+        Parameters
+        ----------
+        file_ : str
+        block_bytes : int
+        start : int, optional
+        end : int, optional
+
+        Yields
+        ------
+        array of uint64
+        """
+        end_ = os.path.getsize(file_) if end is None else end
+        self.bytes_read += end_ - start
+        return read_packed(file_, block_bytes // c.SIZE_UINT64, start, end)
+
+    def stats(self, file_):
+        """Returns statistics of `file_` estimated from samples of it, see
+        `estimate.sample_file`. The amount of values is exact.
+
+        Returns
+        ------
+        FileStats
+        """
+        return estimate.file_stats(file_, packed=True)
+
+
+class MappedReader(FileReader):
+    """A MappedReader scans numbers directly out of a memory mapped file. The
+    file is never copied through a file object's buffers and blocks are cut
+    at line boundaries in place, so no partial line is carried over. Only
+    the pieces being split are copied out of the mapping.
+
+    Mapped pages are backed by the page cache and are reclaimable, so they do
+    not count against the memory limit. Pages which have been parsed are
+    released right away, which keeps at most about one block of the mapping
+    resident.
+    """
+
+    def __init__(self):
+        """
+        Attributes
+        ---------
+        bytes_read : int
+            The amount of input bytes mapped so far
+        touched_bytes : int
+            The amount of mapped bytes paged in by scanning
+        peak_resident_bytes : int
+            The largest amount of mapped bytes resident at once
+        """
+        super().__init__()
+        self.touched_bytes = 0
+        self.peak_resident_bytes = 0
+
+    def blocks(self, file_, block_bytes, start=0, end=None):
+        """Scans `file_`, or the lines in [`start`, `end`) of it, about
+        `block_bytes` bytes at a time.
+
+        Parameters
+        ----------
+        file_ : str
+        block_bytes : int
+        start : int, optional
+        end : int, optional
+
+        Yields
+        ------
+        array of uint64
+        """
+        block_bytes = max(int(block_bytes), c.MIN_READ_SIZE)
+
+        with open(file_, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if end is not None:
+                size = min(size, end)
+            self.bytes_read += max(size - start, 0)
+            if size <= start:
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                released = start - start % mmap.PAGESIZE
+                while start < size:
+                    end_ = min(start + block_bytes, size)
+                    if end_ < size:
+                        # cut the block after its last newline. a line
+                        # longer than the block extends the block instead
+                        cut = mm.rfind(b'\n', start, end_)
+                        if cut == -1:
+                            cut = mm.find(b'\n', end_, size)
+                        end_ = size if cut == -1 else cut + 1
+
+                    self.touched_bytes += end_ - start
+                    self.peak_resident_bytes = max(
+                        self.peak_resident_bytes, end_ - released
+                    )
+
+                    yield from parse_blocks(mm, start, end_)
+
+                    released = self._release(mm, released, end_)
+                    start = end_
+
+    def update(self, other):
+        """Adds the counters of a reader which read on another process.
+
+        Parameters
+        ----------
+        other : MappedReader
+        """
+        super().update(other)
+        self.touched_bytes += other.touched_bytes
+        self.peak_resident_bytes = max(self.peak_resident_bytes,
+                                       other.peak_resident_bytes)
+
+    @staticmethod
+    def _release(mm, start, end):
+        """Tells the kernel the mapped pages in [start, end) will not be
+        needed again.
+
+        Returns
+        ------
+        int
+            Offset up to which pages were released
+        """
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return start
+        aligned_end = end - end % mmap.PAGESIZE
+        if aligned_end > start:
+            mm.madvise(mmap.MADV_DONTNEED, start, aligned_end - start)
+            return aligned_end
+        return start
 
 
 def require_int(function):
@@ -286,11 +812,26 @@ def require_int(function):
     return wrapper
 
 
+def order_by_file_size(files):
+    """Returns `files` ordered by size, smallest first. Files of the same
+    size keep their order.
+
+    Parameters
+    ----------
+    files : iterable of str
+
+    Returns
+    ------
+    list of str
+    """
+    return sorted(files, key=os.path.getsize)
+
+
 def reorder_by_file_size(function):
     @wraps(function)
     def wrapper(file1, file2, mem_limit, **kwargs):
         """Given a strategy reorders the arguments s.t. the smaller file
-        is always passed in first.
+        is always passed in first, see `order_by_file_size`.
 
         Parameters
         ----------
@@ -302,14 +843,8 @@ def reorder_by_file_size(function):
         ------
         function
         """
-
-        file1_size = os.path.getsize(file1)
-        file2_size = os.path.getsize(file2)
-
-        if file1_size <= file2_size:
-            return function(file1, file2, mem_limit, **kwargs)
-
-        return function(file2, file1, mem_limit, **kwargs)
+        file1, file2 = order_by_file_size((file1, file2))
+        return function(file1, file2, mem_limit, **kwargs)
     return wrapper
 
 
@@ -328,6 +863,34 @@ def mb_to_bytes(mb):
     return int(mb * c.MEGABYTE)
 
 
+def estimate_line_count(path, sample_size=c.LINE_SAMPLE_SIZE):
+    """Estimates the amount of lines of a file from the average line length
+    of its first `sample_size` bytes.
+
+    Parameters
+    ----------
+    path : str
+    sample_size : int, optional
+        Amount of bytes to sample
+
+    Returns
+    ------
+    int
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as infile:
+        sample = infile.read(sample_size)
+
+    if len(sample) >= file_size:
+        unterminated = bool(sample) and not sample.endswith(b'\n')
+        return sample.count(b'\n') + unterminated
+
+    lines = sample.count(b'\n')
+    if not lines:
+        return 1
+    return int(file_size * lines / len(sample))
+
+
 def bytes_to_ints(bytes_):
     """Converts # in bytes to # of ints in python
 